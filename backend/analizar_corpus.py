@@ -0,0 +1,96 @@
+"""
+Análisis por lotes de un corpus de archivos MIDI, sin servidor.
+
+    python -m backend.analizar_corpus corpus/ otros/*.mid --salida resultados.jsonl
+    python -m backend.analizar_corpus corpus/ --salida resultados.parquet --analisis midi mixtas
+
+Si se interrumpe, volver a lanzar el mismo comando continúa donde se quedó.
+"""
+import argparse
+import csv
+import multiprocessing
+import sys
+
+from backend.services.corpus import ANALISIS_CORPUS, analizar_corpus, leer_registros, ruta_progreso, resumen_tiempos
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.analizar_corpus",
+        description="Analiza en paralelo todos los MIDI de directorios, archivos o patrones glob."
+    )
+    parser.add_argument("entradas", nargs="+", help="Directorios (recursivos), archivos o patrones glob")
+    parser.add_argument("-o", "--salida", required=True, help="Archivo .jsonl o .parquet")
+    parser.add_argument(
+        "-a", "--analisis", nargs="+", choices=ANALISIS_CORPUS, default=list(ANALISIS_CORPUS),
+        help="Análisis a ejecutar (por defecto, todos)"
+    )
+    parser.add_argument("-i", "--instrumentos", nargs="+", default=None, help="Limitar el análisis a estos instrumentos")
+    parser.add_argument("-p", "--procesos", type=int, default=None, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument("--reintentar-errores", action="store_true", help="Volver a analizar los archivos que fallaron")
+    parser.add_argument("--tiempos", help="CSV con el tiempo de cada archivo y análisis")
+    parser.add_argument("-q", "--silencioso", action="store_true", help="No mostrar el progreso por archivo")
+    return parser.parse_args(argv)
+
+
+def _mostrar_progreso(hechos, total, registro):
+    estado = "ERROR" if registro["errores"] else "ok"
+    print(f"[{hechos}/{total}] {registro['archivo']} {registro['segundos']:.2f} s {estado}", file=sys.stderr)
+
+
+def _escribir_tiempos(ruta, registros, analisis):
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["archivo", "segundos", *analisis, "errores"])
+        for r in registros:
+            escritor.writerow([
+                r["archivo"], r["segundos"], *(r["tiempos"].get(a, "") for a in analisis),
+                ";".join(r["errores"])
+            ])
+
+
+def _mostrar_resumen(nuevos, reanudados, segundos):
+    resumen = resumen_tiempos(nuevos)
+    print(f"\nAnalizados: {len(nuevos)}  reanudados: {reanudados}  tiempo real: {segundos:.1f} s", file=sys.stderr)
+    if not nuevos:
+        return
+    print(
+        f"Por archivo: media {resumen['media']} s, mediana {resumen['mediana']} s, "
+        f"p95 {resumen['p95']} s, máximo {resumen['maximo']} s  (suma {resumen['total']} s)",
+        file=sys.stderr
+    )
+    print("Por análisis: " + ", ".join(f"{a} {s} s" for a, s in resumen["por_analisis"].items()), file=sys.stderr)
+    if resumen["con_errores"]:
+        print(f"Con errores: {resumen['con_errores']}", file=sys.stderr)
+    print("Más lentos:", file=sys.stderr)
+    for archivo, s in resumen["mas_lentos"]:
+        print(f"  {s:8.2f} s  {archivo}", file=sys.stderr)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    try:
+        nuevos, reanudados, segundos = analizar_corpus(
+            args.entradas, args.salida,
+            analisis=args.analisis,
+            instrumentos=args.instrumentos,
+            procesos=args.procesos,
+            reintentar_errores=args.reintentar_errores,
+            progreso=None if args.silencioso else _mostrar_progreso
+        )
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print("\nInterrumpido; volver a ejecutar el mismo comando para continuar.", file=sys.stderr)
+        return 130
+
+    if args.tiempos:
+        _escribir_tiempos(args.tiempos, leer_registros(ruta_progreso(args.salida)).values(), args.analisis)
+    _mostrar_resumen(nuevos, reanudados, segundos)
+    return 1 if any(r["errores"] for r in nuevos) else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
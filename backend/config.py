@@ -0,0 +1,46 @@
+import os
+
+# Tamaño máximo (en MB) de la caché en memoria de partituras parseadas
+CACHE_PARTITURAS_MB = int(os.getenv("SMARTSCORE_CACHE_PARTITURAS_MB", "512"))
+
+# Nombres de acorde del motor de cortes verticales: "music21" reproduce
+# `pitchedCommonName` de chordify; "tabla" usa la tabla de tipos por clase de altura
+NOMBRES_ACORDES = os.getenv("SMARTSCORE_NOMBRES_ACORDES", "music21")
+
+# Origen de la tabla de notas: "midi" (eventos de pretty_midi, con paridad
+# comprobada en las pruebas; music21 solo se parsea si una métrica lo necesita)
+# o "music21" (parseo completo)
+INGESTA = os.getenv("SMARTSCORE_INGESTA", "midi")
+
+# Procesos con los que se analizan en paralelo los archivos de una petición por
+# lotes (/metrics, /compases, /mixtas). 0 = uno por núcleo; 1 = sin paralelismo
+PROCESOS_LOTE = int(os.getenv("SMARTSCORE_PROCESOS_LOTE", "0"))
+
+# Análisis que se ejecutan a la vez fuera del bucle de eventos; el resto de
+# peticiones espera en la cola del ejecutor
+ANALISIS_CONCURRENTES = int(os.getenv("SMARTSCORE_ANALISIS_CONCURRENTES", "2"))
+
+# Base de datos SQLite de los trabajos de análisis asíncronos (/trabajos)
+TRABAJOS_DB = os.getenv("SMARTSCORE_TRABAJOS_DB", "trabajos.sqlite3")
+
+# Caché en disco de resultados de métricas: directorio y tamaño máximo en MB
+# (0 desactiva la caché)
+CACHE_RESULTADOS_DIR = os.getenv("SMARTSCORE_CACHE_RESULTADOS_DIR", ".cache_resultados")
+CACHE_RESULTADOS_MB = int(os.getenv("SMARTSCORE_CACHE_RESULTADOS_MB", "1024"))
+
+# Precalcular el análisis por defecto de cada archivo subido (se puede forzar
+# por petición con `?precalcular=`)
+PRECALCULAR_SUBIDAS = os.getenv("SMARTSCORE_PRECALCULAR_SUBIDAS", "0") == "1"
+
+# Tamaño máximo (en MB) de un archivo subido (0 = sin límite)
+SUBIDA_MAX_MB = int(os.getenv("SMARTSCORE_SUBIDA_MAX_MB", "50"))
+
+# Directorio del índice de vectores de características para buscar obras parecidas,
+# y si cada subida se indexa al recibirla (si no, al precalcularla o al pedir /similares)
+INDICE_SIMILITUD_DIR = os.getenv("SMARTSCORE_INDICE_SIMILITUD_DIR", ".indice_similitud")
+INDEXAR_SIMILITUD_SUBIDAS = os.getenv("SMARTSCORE_INDEXAR_SIMILITUD_SUBIDAS", "1") == "1"
+
+# Base de datos SQLite del índice invertido de motivos (n-gramas de alturas e
+# intervalos) de todo el corpus, y si cada subida se indexa al recibirla
+MOTIVOS_DB = os.getenv("SMARTSCORE_MOTIVOS_DB", "motivos.sqlite3")
+INDEXAR_MOTIVOS_SUBIDAS = os.getenv("SMARTSCORE_INDEXAR_MOTIVOS_SUBIDAS", "1") == "1"
@@ -1,67 +1,55 @@
-from fastapi import APIRouter, Query, HTTPException
-from backend.services.clasificador_metricas import (
-    metricas_instrumentales,
-    metricas_melodicas,
-    metricas_ritmicas,
-    metricas_armonicas,
-    metricas_texturales,
-    metricas_formales,
-    metricas_interaccion,
-    metricas_comparativas,
-    metricas_diferenciadoras,
-    metricas_todas
-)
-from music21 import converter
-import pretty_midi
+from fastapi import APIRouter, Query, HTTPException, Response
+from backend.services.clasificador_metricas import CATEGORIAS, metricas_archivo, contiene_errores, intervalos_archivo
+from backend.services.intervalos import representar_intervalos
+from backend.services.condicional import sin_etiqueta
+from backend.services.ejecutor import en_ejecutor
+from backend.services.precalculo import esperar_precalculo
+from backend.services.indice_compases import ventana_compases
 import os
 
 router = APIRouter()
 
 @router.get("/", response_model=dict)
 async def obtener_metricas_por_categoria(
+    response: Response,
     archivo: str = Query(...),
     categoria: str = Query(..., description="Una de las 9 categorías disponibles o 'todos'"), # Actualizar descripción
     instrumento: str = Query(None),
-    modo: str = Query("global", regex="^(global|compases|mixtas|todos)$")
+    modo: str = Query("global", regex="^(global|compases|mixtas|todos)$"),
+    desde_compas: int = Query(None, ge=1, description="Primer compás de las métricas por compás"),
+    hasta_compas: int = Query(None, ge=1, description="Último compás de las métricas por compás"),
+    intervalos: str = Query(
+        "resumen",
+        regex="^(resumen|lista|rle|empaquetado)$",
+        description="Secuencia completa de intervalos en `intervalos_todos` junto a `intervalos_predominantes`: omitida (resumen), lista, rle o empaquetada en base64"
+    )
 ):
     ruta = os.path.join("uploads", archivo)
     if not os.path.exists(ruta):
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-
+    if categoria not in CATEGORIAS:
+        raise HTTPException(status_code=400, detail=f"Categoría inválida: {categoria}")
     try:
-        score = converter.parse(ruta)
-        midi = pretty_midi.PrettyMIDI(ruta)
-
-        instrumento_param = instrumento if instrumento else None
+        ventana = ventana_compases(desde_compas, hasta_compas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        if categoria == "instrumentales":
-            resultado = metricas_instrumentales(score, midi, instrumento=instrumento_param, modo=modo)
-        elif categoria == "comparativas":
-            resultado = metricas_comparativas(score, midi, instrumento=instrumento_param, modo=modo)
-        elif categoria == "ritmicas":
-            resultado = metricas_ritmicas(score, instrumento=instrumento_param, modo=modo)
-        elif categoria == "formales":
-            resultado = metricas_formales(score, modo=modo)
-        elif categoria == "melodicas":
-            resultado = metricas_melodicas(score, instrumento=instrumento_param, modo=modo)
-        elif categoria == "armonicas":
-            resultado = metricas_armonicas(score, instrumento=instrumento_param, modo=modo)
-        elif categoria == "texturales":
-            resultado = metricas_texturales(score, instrumento=instrumento_param, modo=modo)
-        elif categoria == "interaccion":
-            resultado = metricas_interaccion(score, midi, instrumento=instrumento_param, modo=modo)
-        elif categoria == "diferenciadoras":
-            resultado = metricas_diferenciadoras(score, instrumento=instrumento_param, modo=modo)
-        elif categoria == "todos":
-            resultado = metricas_todas(score, midi, instrumento=instrumento_param, modo=modo)
-        else:
-            raise HTTPException(status_code=400, detail=f"Categoría inválida: {categoria}")
+    try:
+        await esperar_precalculo(archivo)
+        resultado = await en_ejecutor(metricas_archivo, ruta, categoria, instrumento, modo, ventana=ventana)
+        if contiene_errores(resultado):
+            sin_etiqueta(response)
+        if intervalos != "resumen" and "intervalos_predominantes" in resultado:
+            secuencia = await en_ejecutor(intervalos_archivo, ruta, instrumento)
+            resultado = {**resultado, "intervalos_todos": representar_intervalos(secuencia, intervalos)}
 
         return {
             "archivo": archivo,
             "categoria": categoria,
             "instrumento": instrumento,
             "modo": modo,
+            "desde_compas": desde_compas,
+            "hasta_compas": hasta_compas,
             "metricas": resultado
         }
 
@@ -1,49 +1,149 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException, Response
 from pathlib import Path
-from music21 import converter
+import numpy as np
+from backend.services.cache_partituras import cargar_partitura
+from backend.services.cache_resultados import con_cache
+from backend.services.lotes import procesar_lote
+from backend.services.ejecutor import en_ejecutor
 from backend.schemas.compas_metrics_schema import CompasAnalisisLote, CompasPorArchivo, CompasAnalisis
 from backend.schemas.error_response import ErrorResponse
-from backend.services.mixtas_parser import (
-    notas_por_compas,
-    compacidad_melodica_por_compas,
-    entropia_duracion_por_compas,
-    entropia_armonica_por_compas,
-    densidad_armonica_por_compas,
-    repetitividad_motívica_por_compas,
-    promedio_notas_por_compas,
-    varianza_notas_por_compas,
-    entropia_compuesta_por_compas,
-    seccion_aurea_por_compas,
-    complejidad_total,
-    dispersion_temporal_por_compas,
-    sincronizacion_entrada_por_compas,
-    variabilidad_intervalica_por_compas,
-    promedio_rango_dinamico_por_compas
-)
+from backend.services.matriz_compases import recorrer_matriz, COLUMNAS
+from backend.services.indice_compases import indice_compases, ventana_compases
+from backend.services.transmision import respuesta_en_flujo
+from backend.services.formato_columnas import respuesta_compacta, comprobar_codificacion
+from backend.services.condicional import sin_etiqueta
 from backend.services.parser import (
     contrapunto_activo as contrapunto_activo_global,
-    complejidad_total as complejidad_total_global,
-    seccion_aurea as seccion_aurea_global,
-    compases_no_vacios_por_instrumento
+    complejidad_total as complejidad_total_global
 )
 from typing import Union, List
 
 router = APIRouter()
 BASE_UPLOADS = Path(__file__).resolve().parent.parent.parent / "uploads"
 
+def analizar_compases_archivo(ruta, instrumentos_seleccionados, ventana=None):
+    """
+    Análisis por compás de un archivo. Es de nivel de módulo para poder
+    ejecutarse en el pool de procesos de los lotes.
+    """
+    return con_cache(
+        "analizar_compases",
+        ruta,
+        {"instrumentos": instrumentos_seleccionados or [], "ventana": ventana},
+        lambda: _analizar_compases_archivo(ruta, instrumentos_seleccionados, ventana)
+    )
+
+def columnas_compases_archivo(ruta, instrumentos_seleccionados, ventana=None):
+    """
+    Análisis por compás en columnas (un array por campo), sin construir un
+    `CompasAnalisis` por compás.
+    """
+    return con_cache(
+        "columnas_compases",
+        ruta,
+        {"instrumentos": instrumentos_seleccionados or [], "ventana": ventana},
+        lambda: _columnas_compases_archivo(ruta, instrumentos_seleccionados, ventana)
+    )
+
+def _valores_globales(score, instrumentos_seleccionados):
+    # Valores de toda la partitura: se calculan una vez por archivo
+    instrumento = instrumentos_seleccionados[0] if instrumentos_seleccionados else None
+    return (
+        contrapunto_activo_global(score, instrumento=instrumento),
+        complejidad_total_global(score, instrumento=instrumento)
+    )
+
+def _duraciones_por_numero(indice):
+    # Duración del compás con número i+1 de la primera parte
+    duraciones = {}
+    for numero, duracion in zip(indice.numeros.tolist(), indice.duraciones.tolist()):
+        duraciones.setdefault(numero, duracion)
+    return duraciones
+
+def _columnas_compases_archivo(ruta, instrumentos_seleccionados, ventana=None):
+    score, midi = cargar_partitura(ruta)
+    contrapunto, complejidad = _valores_globales(score, instrumentos_seleccionados)
+    duraciones = _duraciones_por_numero(indice_compases(score))
+
+    posiciones, filas = [], []
+    for i, fila in recorrer_matriz(score, midi, instrumentos_seleccionados, ventana):
+        posiciones.append(i)
+        filas.append(fila)
+    valores = np.array(filas, dtype=np.float64).reshape(-1, len(COLUMNAS))
+    numeros = np.asarray(posiciones, dtype=np.int64) + 1
+    return {
+        "numero": numeros,
+        "duracion": np.array([duraciones.get(n, 0) for n in numeros.tolist()], dtype=np.float64),
+        "notas": valores[:, COLUMNAS.index("notas")].astype(np.int64),
+        "seccion_aurea": valores[:, COLUMNAS.index("seccion_aurea")],
+        "entropia_compuesta": valores[:, COLUMNAS.index("entropia_compuesta")],
+        # Iguales en todos los compases: van una sola vez
+        "contrapunto_activo": contrapunto,
+        "complejidad_total": complejidad
+    }
+
+def _compases_de_archivo(ruta, instrumentos_seleccionados, ventana=None):
+    """
+    Genera el `CompasAnalisis` de cada compás (de la ventana, si se indica) a
+    medida que se recorre la rejilla.
+    """
+    score, midi = cargar_partitura(ruta)
+    contrapunto, complejidad = _valores_globales(score, instrumentos_seleccionados)
+    duraciones = _duraciones_por_numero(indice_compases(score))
+
+    columnas = {nombre: COLUMNAS.index(nombre) for nombre in ("notas", "seccion_aurea", "entropia_compuesta")}
+    for i, fila in recorrer_matriz(score, midi, instrumentos_seleccionados, ventana):
+        yield CompasAnalisis(
+            numero=i+1,
+            duracion=duraciones.get(i+1, 0),
+            notas=int(fila[columnas["notas"]]),
+            contrapunto_activo=contrapunto,
+            complejidad_total=complejidad,
+            seccion_aurea=float(fila[columnas["seccion_aurea"]]),
+            entropia_compuesta=float(fila[columnas["entropia_compuesta"]])
+        )
+
+def _analizar_compases_archivo(ruta, instrumentos_seleccionados, ventana=None):
+    return list(_compases_de_archivo(ruta, instrumentos_seleccionados, ventana))
+
+def _registros_compases(ruta, instrumentos_seleccionados, ventana=None):
+    yield {"tipo": "inicio", "archivo": ruta.name, "instrumentos": instrumentos_seleccionados}
+    total = 0
+    for compas in _compases_de_archivo(ruta, instrumentos_seleccionados, ventana):
+        total += 1
+        yield {"tipo": "compas", **compas.model_dump()}
+    yield {"tipo": "fin", "compases": total}
+
 @router.get("/", response_model=Union[CompasAnalisisLote, ErrorResponse])
-def obtener_metricas_compases_lote(
+async def obtener_metricas_compases_lote(
+    response: Response,
     archivos: List[str] = Query(...),
-    instrumentos: List[str] = Query(None)
+    instrumentos: List[str] = Query(None),
+    desde_compas: int = Query(None, ge=1),
+    hasta_compas: int = Query(None, ge=1),
+    columnas: bool = Query(False, description="Un array por campo en lugar de un objeto por compás"),
+    codificacion: str = Query("json", regex="^(json|msgpack)$")
 ):
     resultados = []
     errores = []
+    try:
+        ventana = ventana_compases(desde_compas, hasta_compas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if columnas:
+        comprobar_codificacion(codificacion)
+
+    rutas = [BASE_UPLOADS / Path(nombre_archivo).name for nombre_archivo in archivos]
+    existentes = [r for r in rutas if r.exists()]
+    analizar = columnas_compases_archivo if columnas else analizar_compases_archivo
+    analisis = dict(zip(existentes, await en_ejecutor(
+        procesar_lote, analizar, [(r, instrumentos or [], ventana) for r in existentes]
+    )))
 
-    for nombre_archivo in archivos:
-        archivo = Path(nombre_archivo).name
-        ruta = BASE_UPLOADS / archivo
+    for ruta in rutas:
+        archivo = ruta.name
 
-        if not ruta.exists():
+        if ruta not in analisis:
             errores.append({
                 "error": "Archivo no encontrado",
                 "archivo": archivo,
@@ -51,60 +151,40 @@ def obtener_metricas_compases_lote(
             })
             continue
 
-        try:
-            score = converter.parse(str(ruta))
-            instrumentos_seleccionados = instrumentos or []
-
-            compases_list = notas_por_compas(score, instrumentos_seleccionados)
-            compacidad_list = compacidad_melodica_por_compas(score, instrumentos_seleccionados)
-            entropia_duracion_list = entropia_duracion_por_compas(score, instrumentos_seleccionados)
-            entropia_armonica_list = entropia_armonica_por_compas(score, instrumentos_seleccionados)
-            densidad_armonica_list = densidad_armonica_por_compas(score, instrumentos_seleccionados)
-            repetitividad_list = repetitividad_motívica_por_compas(score, instrumentos_seleccionados=instrumentos_seleccionados)
-            promedio_notas_list = promedio_notas_por_compas(score, instrumentos_seleccionados)
-            varianza_notas_list = varianza_notas_por_compas(score, instrumentos_seleccionados)
-            entropia_compuesta_list = entropia_compuesta_por_compas(score, instrumentos_seleccionados)
-            seccion_aurea_list = seccion_aurea_por_compas(score)
-            dispersion_temporal_list = dispersion_temporal_por_compas(score, instrumentos_seleccionados)
-            sincronizacion_entrada_list = sincronizacion_entrada_por_compas(score, None, instrumentos_seleccionados)
-            variabilidad_intervalica_list = variabilidad_intervalica_por_compas(score, instrumentos_seleccionados)
-            promedio_rango_dinamico_list = promedio_rango_dinamico_por_compas(None, score, instrumentos_seleccionados)
-
-            compases_analisis = []
-            for i in range(len(compases_list)):
-                compas_data = CompasAnalisis(
-                    numero=i+1,
-                    duracion=score.parts[0].measure(i+1).duration.quarterLength if score.parts and score.parts[0].measure(i+1) else 0,
-                    notas=list(compases_list[i].values())[0],
-                    ambitus=None,  # Puedes agregar si tienes función para esto
-                    complejidad_ritmica=None,
-                    complejidad_ritmica_cuantificable=None,
-                    direccionalidad_melodica=None,
-                    polirritmia=None,
-                    tipo_textura=None,
-                    balance_dinamico=None,
-                    solismo_vs_tutti=None,
-                    simultaneidad_tematica=None,
-                    contrapunto_activo=contrapunto_activo_global(score, instrumento=instrumentos_seleccionados[0]),
-                    complejidad_total=complejidad_total(score, instrumento=instrumentos_seleccionados[0]) if instrumentos_seleccionados else complejidad_total_global(score),
-                    seccion_aurea=seccion_aurea_list[i][f"compas #{i+1}"] if i < len(seccion_aurea_list) else None,
-                    entropia_compuesta=entropia_compuesta_list[i][f"compas #{i+1}"] if i < len(entropia_compuesta_list) else None
-                )
-                compases_analisis.append(compas_data)
-
+        compases_analisis, e = analisis[ruta]
+        if e is None and columnas:
+            resultados.append({
+                "archivo": archivo,
+                "instrumentos": instrumentos or [],
+                "compases": compases_analisis
+            })
+        elif e is None:
             resultados.append(CompasPorArchivo(
                 archivo=archivo,
-                instrumentos=instrumentos_seleccionados,
+                instrumentos=instrumentos or [],
                 compases=compases_analisis
             ))
-
-        except Exception as e:
+        else:
             errores.append({
                 "error": f"Error al procesar el archivo MIDI: {str(e)}",
                 "archivo": archivo,
                 "instrumentos": instrumentos or []
             })
 
+    # Los errores pueden ser transitorios: esas respuestas no llevan ETag
+    if errores or not resultados:
+        sin_etiqueta(response)
+
+    if columnas:
+        if not resultados:
+            return sin_etiqueta(respuesta_compacta({
+                "error": "Sin resultados válidos",
+                "archivo": "",
+                "instrumentos": instrumentos or []
+            }, codificacion))
+        respuesta = respuesta_compacta({"resultados": resultados, "errores": errores}, codificacion)
+        return sin_etiqueta(respuesta) if errores else respuesta
+
     if not resultados:
         return ErrorResponse(
             error="Sin resultados válidos",
@@ -112,4 +192,25 @@ def obtener_metricas_compases_lote(
             instrumentos=instrumentos or []
         )
 
-    return CompasAnalisisLote(resultados=resultados, errores=errores)
\ No newline at end of file
+    return CompasAnalisisLote(resultados=resultados, errores=errores)
+
+@router.get("/stream")
+async def transmitir_compases(
+    archivo: str = Query(...),
+    instrumentos: List[str] = Query(None),
+    formato: str = Query("ndjson", regex="^(ndjson|sse)$"),
+    desde_compas: int = Query(None, ge=1),
+    hasta_compas: int = Query(None, ge=1)
+):
+    """
+    Análisis por compás de un archivo enviado compás a compás (NDJSON o SSE):
+    un registro `inicio`, uno `compas` por compás y uno `fin`.
+    """
+    ruta = BASE_UPLOADS / Path(archivo).name
+    if not ruta.exists():
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    try:
+        ventana = ventana_compases(desde_compas, hasta_compas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return respuesta_en_flujo(_registros_compases(ruta, instrumentos or [], ventana), formato)
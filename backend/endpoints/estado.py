@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from backend.services.ejecutor import estadisticas_ejecutor
+from backend.services.cache_partituras import estadisticas_cache
+from backend.services.cache_resultados import estadisticas_cache_resultados
+
+router = APIRouter()
+
+@router.get("/ejecutor", response_model=dict)
+async def obtener_estado_ejecutor():
+    """
+    Profundidad de la cola y tiempos de espera del ejecutor de análisis.
+    """
+    return estadisticas_ejecutor()
+
+@router.get("/caches", response_model=dict)
+async def obtener_estado_caches():
+    """
+    Estadísticas de la caché de partituras en memoria y de la de resultados en disco.
+    """
+    return {
+        "partituras": estadisticas_cache(),
+        "resultados": estadisticas_cache_resultados()
+    }
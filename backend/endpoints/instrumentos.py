@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Query, HTTPException
 from backend.services.instrumentos import extraer_instrumentos
+from backend.services.ejecutor import en_ejecutor
 
 router = APIRouter()
 
@@ -9,7 +10,7 @@ async def obtener_instrumentos(archivo: str = Query(...)):
     Devuelve la lista de instrumentos detectados en el archivo MIDI.
     """
     try:
-        instrumentos = extraer_instrumentos(archivo)
+        instrumentos = await en_ejecutor(extraer_instrumentos, archivo)
         if not instrumentos:
             raise HTTPException(status_code=404, detail="No se detectaron instrumentos en el archivo")
         return instrumentos
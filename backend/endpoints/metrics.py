@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
 from backend.schemas.global_metrics_schema import GlobalMetrics, MultiFileMetrics
 from backend.schemas.error_response import ErrorResponse
 from backend.services.parser import analizar_midi
+from backend.services.lotes import procesar_lote
+from backend.services.ejecutor import en_ejecutor
+from backend.services.formato_columnas import a_columnas, respuesta_compacta, comprobar_codificacion
+from backend.services.condicional import sin_etiqueta
+from backend.services.intervalos import representar_intervalos
 from typing import Union, List
 import os
 
@@ -9,11 +14,21 @@ router = APIRouter()
 
 @router.get("/", response_model=Union[MultiFileMetrics, ErrorResponse])
 async def obtener_metricas_multiples(
+    response: Response,
     archivos: List[str] = Query(...),
-    instrumentos: List[str] = Query(None)
+    instrumentos: List[str] = Query(None),
+    columnas: bool = Query(False, description="Un array por métrica por compás en lugar de listas de {compás: valor}"),
+    codificacion: str = Query("json", regex="^(json|msgpack)$"),
+    intervalos: str = Query(
+        "resumen",
+        regex="^(resumen|lista|rle|empaquetado)$",
+        description="Secuencia completa de intervalos en `intervalos_todos`: omitida (resumen), lista, rle o empaquetada en base64"
+    )
 ):
     resultados: List[GlobalMetrics] = []
     errores: List[ErrorResponse] = []
+    if columnas:
+        comprobar_codificacion(codificacion)
 
     campos_obligatorios = [
         "duracion_segundos", "tempo_promedio", "entropia_melodica",
@@ -32,9 +47,14 @@ async def obtener_metricas_multiples(
         "cantidad_notas_por_compas"  # Añadido
     ]
 
+    existentes = [a for a in archivos if os.path.exists(os.path.join("uploads", a))]
+    # Los archivos se analizan en paralelo; los resultados vuelven en orden
+    analisis = dict(zip(existentes, await en_ejecutor(
+        procesar_lote, analizar_midi, [(a, instrumentos or []) for a in existentes]
+    )))
+
     for nombre_archivo in archivos:
-        ruta = os.path.join("uploads", nombre_archivo)
-        if not os.path.exists(ruta):
+        if nombre_archivo not in analisis:
             errores.append(ErrorResponse(
                 error="Archivo no encontrado",
                 archivo=nombre_archivo,
@@ -42,7 +62,9 @@ async def obtener_metricas_multiples(
             ))
             continue
 
-        resultado = analizar_midi(nombre_archivo, instrumentos_seleccionados=instrumentos or [])
+        resultado, excepcion = analisis[nombre_archivo]
+        if excepcion is not None:
+            resultado = {"error": str(excepcion)}
         if "error" in resultado:
             errores.append(ErrorResponse(
                 error=resultado["error"],
@@ -80,12 +102,37 @@ async def obtener_metricas_multiples(
             ))
             continue
 
+        resultado = {**resultado, "intervalos_todos": representar_intervalos(resultado["intervalos_todos"], intervalos)}
+
+        if columnas:
+            resultados.append({
+                "archivo": nombre_archivo,
+                "instrumentos": instrumentos or [],
+                **a_columnas({k: resultado[k] for k in campos_obligatorios})
+            })
+            continue
+
         resultados.append(GlobalMetrics(
             archivo=nombre_archivo,
             instrumentos=instrumentos or [],
             **{k: resultado[k] for k in campos_obligatorios}
         ))
 
+    # Los errores pueden ser transitorios: esas respuestas no llevan ETag
+    if errores or not resultados:
+        sin_etiqueta(response)
+
+    if columnas:
+        errores = [error.model_dump() for error in errores]
+        if not resultados:
+            return sin_etiqueta(respuesta_compacta(errores[0] if errores else {
+                "error": "Sin resultados válidos",
+                "archivo": "",
+                "instrumentos": instrumentos or []
+            }, codificacion))
+        respuesta = respuesta_compacta({"resultados": resultados, "errores": errores}, codificacion)
+        return sin_etiqueta(respuesta) if errores else respuesta
+
     if not resultados:
         return errores[0] if errores else ErrorResponse(
             error="Sin resultados válidos",
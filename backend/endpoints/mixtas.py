@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException, Response
 from backend.schemas.mixtas_metrics_schema import MixtasMetricsLote, MixtasPorArchivo
 from backend.schemas.error_response import ErrorResponse
-from backend.services.mixtas_parser import analizar_mixtas
+from backend.services.mixtas_parser import analizar_mixtas, mixtas_en_flujo
+from backend.services.transmision import respuesta_en_flujo
+from backend.services.indice_compases import ventana_compases
+from backend.services.formato_columnas import a_columnas, respuesta_compacta, comprobar_codificacion
+from backend.services.condicional import sin_etiqueta
+from backend.services.lotes import procesar_lote
+from backend.services.ejecutor import en_ejecutor
 from typing import Union, List
 import os
 import traceback
@@ -10,15 +16,30 @@ router = APIRouter()
 
 @router.get("/", response_model=Union[MixtasMetricsLote, ErrorResponse])
 async def obtener_metricas_mixtas_lote(
+    response: Response,
     archivos: List[str] = Query(...),
-    instrumentos: List[str] = Query(None)
+    instrumentos: List[str] = Query(None),
+    desde_compas: int = Query(None, ge=1),
+    hasta_compas: int = Query(None, ge=1),
+    columnas: bool = Query(False, description="Un array por métrica por compás en lugar de listas de {compás: valor}"),
+    codificacion: str = Query("json", regex="^(json|msgpack)$")
 ):
     resultados: List[MixtasPorArchivo] = []
     errores: List[ErrorResponse] = []
+    try:
+        ventana = ventana_compases(desde_compas, hasta_compas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if columnas:
+        comprobar_codificacion(codificacion)
+
+    existentes = [a for a in archivos if os.path.exists(os.path.join("uploads", a))]
+    analisis = dict(zip(existentes, await en_ejecutor(
+        procesar_lote, analizar_mixtas, [(os.path.join("uploads", a), instrumentos, ventana) for a in existentes]
+    )))
 
     for nombre_archivo in archivos:
-        ruta = os.path.join("uploads", nombre_archivo)
-        if not os.path.exists(ruta):
+        if nombre_archivo not in analisis:
             errores.append(ErrorResponse(
                 error="Archivo no encontrado",
                 archivo=nombre_archivo,
@@ -27,7 +48,16 @@ async def obtener_metricas_mixtas_lote(
             continue
 
         try:
-            resultado = analizar_mixtas(ruta, instrumentos_seleccionados=instrumentos)
+            resultado, e = analisis[nombre_archivo]
+            if e is not None:
+                raise e
+            if columnas:
+                resultados.append({
+                    "archivo": nombre_archivo,
+                    "instrumentos": instrumentos or [],
+                    "mixtas": a_columnas(resultado)
+                })
+                continue
             resultados.append(MixtasPorArchivo(
                 archivo=nombre_archivo,
                 instrumentos=instrumentos or [],
@@ -41,6 +71,21 @@ async def obtener_metricas_mixtas_lote(
                 instrumentos=instrumentos or []
             ))
 
+    # Los errores pueden ser transitorios: esas respuestas no llevan ETag
+    if errores or not resultados:
+        sin_etiqueta(response)
+
+    if columnas:
+        errores = [error.model_dump() for error in errores]
+        if not resultados:
+            return sin_etiqueta(respuesta_compacta(errores[0] if errores else {
+                "error": "Sin resultados válidos",
+                "archivo": "",
+                "instrumentos": instrumentos or []
+            }, codificacion))
+        respuesta = respuesta_compacta({"resultados": resultados, "errores": errores}, codificacion)
+        return sin_etiqueta(respuesta) if errores else respuesta
+
     if not resultados:
         return errores[0] if errores else ErrorResponse(
             error="Sin resultados válidos",
@@ -48,4 +93,30 @@ async def obtener_metricas_mixtas_lote(
             instrumentos=instrumentos or []
         )
 
-    return MixtasMetricsLote(resultados=resultados, errores=errores)
\ No newline at end of file
+    return MixtasMetricsLote(resultados=resultados, errores=errores)
+
+@router.get("/stream")
+async def transmitir_metricas_mixtas(
+    archivo: str = Query(...),
+    instrumentos: List[str] = Query(None),
+    formato: str = Query("ndjson", regex="^(ndjson|sse)$"),
+    desde_compas: int = Query(None, ge=1),
+    hasta_compas: int = Query(None, ge=1)
+):
+    """
+    Métricas mixtas de un archivo enviadas a medida que se calculan (NDJSON o
+    SSE): un registro `resumen`, uno `compas` por compás y uno `fin`.
+    """
+    ruta = os.path.join("uploads", archivo)
+    if not os.path.exists(ruta):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    try:
+        ventana = ventana_compases(desde_compas, hasta_compas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def registros():
+        yield {"tipo": "inicio", "archivo": archivo, "instrumentos": instrumentos or []}
+        yield from mixtas_en_flujo(ruta, instrumentos, ventana)
+
+    return respuesta_en_flujo(registros(), formato)
@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Query, HTTPException
+from backend.services.ejecutor import en_ejecutor
+from backend.services.indice_motivos import (
+    ALTURAS, INTERVALOS, leer_motivo, buscar_motivo, indexar_motivos, estadisticas_motivos
+)
+from typing import List
+import os
+
+router = APIRouter()
+
+@router.get("/", response_model=dict)
+async def buscar_en_corpus(
+    alturas: str = Query(None, description='Motivo como alturas MIDI, p. ej. "60-62-64"'),
+    intervalos: str = Query(None, description='Motivo como intervalos en semitonos, p. ej. "2,2,-1"'),
+    transpuesto: bool = Query(False, description="Con `alturas`, buscar también sus transposiciones"),
+    limite: int = Query(100, ge=1, le=10000)
+):
+    """
+    Dónde aparece un motivo en todo el corpus indexado (archivo, parte y
+    compás), sin volver a recorrer ningún archivo.
+    """
+    if (alturas is None) == (intervalos is None):
+        raise HTTPException(status_code=400, detail="Indicar `alturas` o `intervalos`")
+    try:
+        if alturas is not None:
+            secuencia = leer_motivo(alturas, ALTURAS)
+            tipo = ALTURAS
+            if transpuesto:
+                secuencia = [b - a for a, b in zip(secuencia, secuencia[1:])]
+                tipo = INTERVALOS
+        else:
+            secuencia = leer_motivo(intervalos, INTERVALOS)
+            tipo = INTERVALOS
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    resultado = await en_ejecutor(buscar_motivo, tipo, secuencia, limite)
+    return {
+        "tipo": "alturas" if tipo == ALTURAS else "intervalos",
+        "motivo": secuencia,
+        **resultado
+    }
+
+@router.post("/indexar", response_model=dict)
+async def indexar_archivos(archivos: List[str] = Query(None)):
+    """
+    Indexa archivos ya subidos (por defecto, todos los de uploads/).
+    """
+    if not archivos:
+        archivos = sorted(
+            a for a in os.listdir("uploads")
+            if not a.startswith(".") and os.path.isfile(os.path.join("uploads", a))
+        ) if os.path.isdir("uploads") else []
+    indexados, errores = [], []
+    for archivo in archivos:
+        if not os.path.exists(os.path.join("uploads", archivo)):
+            errores.append({"archivo": archivo, "error": "Archivo no encontrado"})
+            continue
+        try:
+            indexados.append(await en_ejecutor(indexar_motivos, archivo))
+        except Exception as e:
+            errores.append({"archivo": archivo, "error": str(e)})
+    return {"indexados": indexados, "errores": errores}
+
+@router.get("/estado", response_model=dict)
+async def obtener_estado_indice():
+    """
+    Tamaño del índice de motivos.
+    """
+    return await en_ejecutor(estadisticas_motivos)
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Query, HTTPException
+from backend.services.ejecutor import en_ejecutor
+from backend.services.indice_similitud import indice_similitud, indexar_archivo
+
+router = APIRouter()
+
+@router.get("/", response_model=dict)
+async def obtener_similares(
+    archivo: str = Query(...),
+    k: int = Query(10, ge=1, le=100),
+    metrica: str = Query("euclidea", regex="^(euclidea|coseno)$")
+):
+    """
+    Las `k` obras del índice más parecidas al archivo, por distancia entre
+    vectores de características (entropías, intervalos, familias y dinámica).
+    """
+    try:
+        hash_contenido = await en_ejecutor(indexar_archivo, archivo)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"No se pudo analizar el archivo: {str(e)}")
+
+    similares = await en_ejecutor(indice_similitud.vecinos, hash_contenido, k, metrica)
+    return {
+        "archivo": archivo,
+        "hash": hash_contenido,
+        "metrica": metrica,
+        "indexados": indice_similitud.estadisticas()["vectores"],
+        "similares": similares
+    }
+
+@router.get("/estado", response_model=dict)
+async def obtener_estado_indice():
+    """
+    Tamaño del índice de similitud.
+    """
+    return indice_similitud.estadisticas()
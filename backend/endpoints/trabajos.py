@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Query, HTTPException
+from backend.services.clasificador_metricas import CATEGORIAS
+from backend.services.trabajos import (
+    crear_trabajo, obtener_trabajo, obtener_resultado, TERMINADO, FALLIDO
+)
+from typing import List
+import os
+
+router = APIRouter()
+
+@router.post("/", response_model=dict, status_code=202)
+async def enviar_trabajo(
+    archivo: str = Query(...),
+    categorias: List[str] = Query(["todos"]),
+    instrumento: str = Query(None),
+    modo: str = Query("global", regex="^(global|compases|mixtas|todos)$")
+):
+    """
+    Encola el análisis de un archivo y devuelve el id del trabajo para
+    consultar su progreso y su resultado.
+    """
+    ruta = os.path.join("uploads", archivo)
+    if not os.path.exists(ruta):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    invalidas = [c for c in categorias if c not in CATEGORIAS]
+    if invalidas:
+        raise HTTPException(status_code=400, detail=f"Categoría inválida: {', '.join(invalidas)}")
+
+    id_trabajo = crear_trabajo(archivo, ruta, categorias, instrumento, modo)
+    return {"id": id_trabajo, "estado": obtener_trabajo(id_trabajo)["estado"]}
+
+@router.get("/{id_trabajo}", response_model=dict)
+async def estado_trabajo(id_trabajo: str):
+    trabajo = obtener_trabajo(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+@router.get("/{id_trabajo}/resultado", response_model=dict)
+async def resultado_trabajo(id_trabajo: str):
+    trabajo = obtener_trabajo(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if trabajo["estado"] == FALLIDO:
+        raise HTTPException(status_code=500, detail=f"Error al calcular métricas: {trabajo['error']}")
+    if trabajo["estado"] != TERMINADO:
+        raise HTTPException(status_code=409, detail=f"El trabajo está {trabajo['estado']}")
+
+    return {
+        "archivo": trabajo["archivo"],
+        "categorias": trabajo["categorias"],
+        "instrumento": trabajo["instrumento"],
+        "modo": trabajo["modo"],
+        "metricas": obtener_resultado(id_trabajo)
+    }
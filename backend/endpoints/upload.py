@@ -1,20 +1,65 @@
-from fastapi import APIRouter, File, UploadFile
+from fastapi import APIRouter, File, UploadFile, Query, HTTPException
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from backend.config import PRECALCULAR_SUBIDAS, INDEXAR_MOTIVOS_SUBIDAS, INDEXAR_SIMILITUD_SUBIDAS
+from backend.services.precalculo import programar_precalculo, estado_precalculo
+from backend.services.indice_motivos import programar_indexado_motivos
+from backend.services.indice_similitud import programar_indexado_similitud
+from backend.services.almacen_subidas import (
+    guardar_subida, almacen_subidas, SubidaDemasiadoGrande, TAMANO_BLOQUE_SUBIDA
+)
 import os
-import shutil
 
 router = APIRouter()
 
 @router.post("/")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: UploadFile = File(...),
+    precalcular: bool = Query(None)
+):
     try:
-        os.makedirs("uploads", exist_ok=True)
-        file_path = os.path.join("uploads", file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return {"mensaje": "Archivo recibido", "nombre": file.filename}
+        # Se lee y escribe por bloques fuera del bucle de eventos, calculando el hash a la vez
+        guardado = await run_in_threadpool(
+            guardar_subida, file.filename, lambda: file.file.read(TAMANO_BLOQUE_SUBIDA)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SubidaDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": f"Error al subir archivo: {str(e)}"}
         )
+
+    try:
+        respuesta = {"mensaje": "Archivo recibido", **guardado}
+        # Un contenido ya conocido tiene sus análisis en caché: no hace falta precalcular
+        if (precalcular if precalcular is not None else PRECALCULAR_SUBIDAS) and not guardado["duplicado"]:
+            # El precálculo también deja el archivo en el índice de similitud
+            respuesta["precalculo"] = programar_precalculo(guardado["nombre"])
+        elif INDEXAR_SIMILITUD_SUBIDAS:
+            programar_indexado_similitud(guardado["nombre"])
+            respuesta["indice_similitud"] = "programado"
+        if INDEXAR_MOTIVOS_SUBIDAS:
+            # Con un contenido ya indexado solo se anota el nombre
+            programar_indexado_motivos(guardado["nombre"])
+            respuesta["indice_motivos"] = "programado"
+        return respuesta
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Error al subir archivo: {str(e)}"}
+        )
+
+@router.get("/estado", response_model=dict)
+async def estado_subida(archivo: str = Query(...)):
+    """
+    Estado del precálculo en segundo plano de un archivo subido.
+    """
+    if not os.path.exists(os.path.join("uploads", archivo)):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    estado = estado_precalculo(archivo)
+    if estado is None:
+        estado = {"estado": "sin_precalculo", "progreso": 0.0, "error": None}
+    return {"archivo": archivo, "hash": almacen_subidas.hash_de(archivo), **estado}
@@ -2,10 +2,21 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.endpoints import (
     upload, metrics, compases, mixtas,
-    instrumentos, clasificador_metricas_endpoint
+    instrumentos, clasificador_metricas_endpoint, estado, trabajos, similares, motivos
 )
+from backend.services.lotes import cerrar_pool
+from backend.services.ejecutor import cerrar_ejecutor
+from backend.services.trabajos import reanudar_trabajos
+from backend.services.cache_resultados import borrar_versiones_antiguas
+from backend.services.almacen_subidas import importar_subidas_existentes
+from backend.services.condicional import EtiquetasMiddleware, CompresionMiddleware
 
 app = FastAPI(title="SmartScore API")
+app.add_event_handler("startup", borrar_versiones_antiguas)
+app.add_event_handler("startup", importar_subidas_existentes)
+app.add_event_handler("startup", reanudar_trabajos)
+app.add_event_handler("shutdown", cerrar_pool)
+app.add_event_handler("shutdown", cerrar_ejecutor)
 
 app.include_router(upload.router, prefix="/upload")
 app.include_router(metrics.router, prefix="/metrics")
@@ -13,7 +24,14 @@ app.include_router(compases.router, prefix="/compases")
 app.include_router(mixtas.router, prefix="/mixtas")
 app.include_router(instrumentos.router, prefix="/instrumentos")
 app.include_router(clasificador_metricas_endpoint.router, prefix="/metricas")
+app.include_router(estado.router, prefix="/estado")
+app.include_router(trabajos.router, prefix="/trabajos")
+app.include_router(similares.router, prefix="/similares")
+app.include_router(motivos.router, prefix="/motivos")
 
+# El ETag se calcula fuera de la compresión para distinguir ambas representaciones
+app.add_middleware(CompresionMiddleware)
+app.add_middleware(EtiquetasMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -23,6 +41,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
+from backend.schemas.error_response import ErrorResponse
 
 class ParteInfo(BaseModel):
     nombre: str
@@ -23,10 +24,11 @@ class GlobalMetrics(BaseModel):
     porcentaje_participacion: Dict[str, float]
 
     cantidad_total_notas: Dict[str, Union[int, Dict[str, int]]]
-    compases_estimados: int
+    compases_estimados: Union[int, Dict[str, int]]  # Compases no vacíos por instrumento
     motivos_recurrentes: Dict[str, Dict[str, Union[int, List[str]]]]
-    intervalos_predominantes: Dict[str, Union[List[int], List[str]]]
-    intervalos_todos: List[str]
+    intervalos_predominantes: Dict[str, Union[int, List[int], List[str], Dict[str, Union[float, List[int]]]]]
+    # Solo si se pide: lista, {valores, repeticiones} o {tipo, longitud, datos}
+    intervalos_todos: Optional[Union[List[int], Dict[str, Union[int, str, List[int]]]]] = None
     balance_dinamico: Dict[str, float]
     red_interaccion_musical: Dict[str, int]
     seccion_aurea: float
@@ -36,11 +38,6 @@ class GlobalMetrics(BaseModel):
 
     cantidad_notas_por_compas: List[Dict[str, int]]  # Añadido para rítmicas
 
-class ErrorResponse(BaseModel):
-    error: str
-    archivo: str
-    instrumentos: List[str]
-
 class MultiFileMetrics(BaseModel):
     resultados: List[GlobalMetrics]
     errores: List[ErrorResponse] = []
\ No newline at end of file
@@ -1,9 +1,6 @@
 from pydantic import BaseModel
 from typing import Dict, List, Union
-
-class ErrorResponse(BaseModel):
-    error: str
-    detail: str = None
+from backend.schemas.error_response import ErrorResponse
 
 class MixtasPorArchivo(BaseModel):
     archivo: str
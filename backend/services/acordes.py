@@ -0,0 +1,229 @@
+import threading
+import weakref
+from functools import lru_cache
+
+import numpy as np
+from music21 import chord, pitch
+
+from backend.config import NOMBRES_ACORDES
+from backend.services.tabla_notas import tabla_notas, NOTA, ACORDE, MIEMBRO_ACORDE
+from backend.services.indice_compases import indice_compases
+
+# Precisión (en negras) con la que se comparan ataques, finales y barras
+DECIMALES_OFFSET = 6
+
+# Ortografía por defecto de music21 para alturas leídas de MIDI
+NOMBRES_CLASES = ["C", "C#", "D", "E-", "E", "F", "F#", "G", "G#", "A", "B-", "B"]
+
+# Tipos de acorde reconocidos por la tabla (intervalos desde la fundamental)
+PLANTILLAS_ACORDES = [
+    ((0, 4, 7, 10), "dominant-seventh chord"),
+    ((0, 4, 7, 11), "major-seventh chord"),
+    ((0, 3, 7, 10), "minor-seventh chord"),
+    ((0, 3, 6, 10), "half-diminished seventh chord"),
+    ((0, 3, 6, 9), "diminished-seventh chord"),
+    ((0, 3, 7, 11), "minor major-seventh chord"),
+    ((0, 4, 7), "major triad"),
+    ((0, 3, 7), "minor triad"),
+    ((0, 3, 6), "diminished triad"),
+    ((0, 4, 8), "augmented triad"),
+    ((0, 5, 7), "suspended-fourth triad"),
+    ((0, 2, 7), "suspended-second triad"),
+    ((0, 4, 10), "incomplete dominant-seventh chord"),
+    ((0, 7), "perfect fifth"),
+    ((0, 4), "major third"),
+    ((0, 3), "minor third"),
+]
+
+
+def _mascara(clases):
+    return sum(1 << c for c in set(clases))
+
+
+def _tipo_acorde(mascara):
+    clases = [c for c in range(12) if mascara >> c & 1]
+    if not clases:
+        return ""
+    if len(clases) == 1:
+        return NOMBRES_CLASES[clases[0]]
+    for intervalos, tipo in PLANTILLAS_ACORDES:
+        for raiz in clases:
+            if _mascara((raiz + i) % 12 for i in intervalos) == mascara:
+                return f"{NOMBRES_CLASES[raiz]}-{tipo}"
+    # Conjunto sin plantilla: forma normal (rotación más compacta)
+    rotaciones = [clases[i:] + clases[:i] for i in range(len(clases))]
+    normal = min(rotaciones, key=lambda r: ((r[-1] - r[0]) % 12, [(c - r[0]) % 12 for c in r]))
+    intervalos = "-".join(str((c - normal[0]) % 12) for c in normal)
+    return f"{NOMBRES_CLASES[normal[0]]}-conjunto {intervalos}"
+
+
+# Tabla de tipos indexada por máscara de clases de altura (bit i = clase i)
+TIPOS_ACORDE = [_tipo_acorde(m) for m in range(1 << 12)]
+
+
+@lru_cache(maxsize=65536)
+def _nombre_music21(alturas):
+    # Se construyen las alturas como lo hace la importación MIDI de music21:
+    # `chord.Chord(enteros)` deletrea distinto y cambia algunos nombres
+    return chord.Chord([pitch.Pitch(midi=a) for a in alturas]).pitchedCommonName
+
+
+class SecuenciaAcordes:
+    """
+    Sonoridades verticales de un subconjunto de partes (equivalentes a las de
+    `chordify()`), con su máscara de clases de altura y el compás de cada una.
+    """
+
+    def __init__(self, nombres, offsets, duraciones, compases, mascaras):
+        self.nombres = nombres
+        self.offsets = np.asarray(offsets, dtype=np.float64)
+        self.duraciones = np.asarray(duraciones, dtype=np.float64)
+        self.compases = np.asarray(compases, dtype=np.int64)
+        self.mascaras = np.asarray(mascaras, dtype=np.uint16)
+        self._orden = np.argsort(self.compases, kind="stable")
+
+    def __len__(self):
+        return len(self.nombres)
+
+    @property
+    def tipos(self):
+        return [TIPOS_ACORDE[m] for m in self.mascaras]
+
+    def nombres_validos(self):
+        return [n for n in self.nombres if n]
+
+    def por_compas(self, numeros):
+        """
+        Lista, alineada con `numeros`, de los nombres de acorde de cada compás.
+        """
+        compases_ordenados = self.compases[self._orden]
+        inicios = np.searchsorted(compases_ordenados, numeros, side="left")
+        fines = np.searchsorted(compases_ordenados, numeros, side="right")
+        return [
+            [self.nombres[j] for j in self._orden[ini:fin]]
+            for ini, fin in zip(inicios, fines)
+        ]
+
+
+def _vacia():
+    return SecuenciaAcordes([], [], [], [], [])
+
+
+def cortes_verticales(score, indices_partes, nombres=NOMBRES_ACORDES, rango=None):
+    """
+    Barrido por onsets sobre la tabla de notas, sin pasar por `chordify()`:
+    corta la partitura en cada ataque, final de nota o silencio y barra de
+    compás, y devuelve una sonoridad por cada tramo en el que suena al menos
+    una altura. Con `rango` (offsets de dos barras) solo se barre ese tramo.
+    Como en `chordify()`, las barras son las de la primera de las partes.
+    """
+    indice = indice_compases(score)
+    tabla = tabla_notas(score)
+    notas = tabla.notas
+    filas = notas[
+        np.isin(notas["tipo"], (NOTA, ACORDE, MIEMBRO_ACORDE))
+        & np.isin(notas["parte"], indices_partes)
+        & (notas["duracion"] > 0)
+    ]
+    if filas.size == 0:
+        return _vacia()
+
+    # Redondeo para que los límites de tresillos (fracciones en music21) coincidan
+    inicios = np.round(filas["onset"], DECIMALES_OFFSET)
+    fines = np.round(filas["onset"] + filas["duracion"], DECIMALES_OFFSET)
+    if rango is not None:
+        # Las barras cortan todas las sonoridades: basta con las notas que
+        # suenan dentro del tramo, incluidas las que vienen ligadas de antes
+        desde, hasta = np.round(rango, DECIMALES_OFFSET)
+        dentro = (fines > desde) & (inicios < hasta)
+        filas, inicios, fines = filas[dentro], inicios[dentro], fines[dentro]
+        if filas.size == 0:
+            return _vacia()
+    numeros, offsets_compases, duraciones_compases = indice.rejilla_parte(indices_partes[0])
+    barras = np.round(offsets_compases, DECIMALES_OFFSET)
+    # chordify también corta donde empieza o termina un silencio de otra parte
+    silencios = tabla.silencios[np.isin(tabla.silencios["parte"], indices_partes)]
+    bordes_silencios = np.round(
+        np.concatenate((silencios["onset"], silencios["onset"] + silencios["duracion"])),
+        DECIMALES_OFFSET
+    )
+    limites = np.unique(np.concatenate((inicios, fines, barras, bordes_silencios)))
+    fin_score = fines.max()
+    if len(barras):
+        # Como chordify, se descarta lo que queda fuera de la rejilla de compases
+        fin_score = min(fin_score, np.round(offsets_compases[-1] + duraciones_compases[-1], DECIMALES_OFFSET))
+    if rango is not None:
+        fin_score = min(fin_score, hasta)
+        limites = limites[limites >= desde]
+    limites = limites[(limites >= inicios.min()) & (limites <= fin_score)]
+    if len(limites) < 2:
+        return _vacia()
+
+    # Matriz tramos x alturas con el número de notas que suenan en cada tramo
+    alturas, columna = np.unique(filas["altura"], return_inverse=True)
+    # (la fila extra recoge las notas que empiezan o terminan tras el último límite)
+    cambios = np.zeros((len(limites) + 1, len(alturas)), dtype=np.int32)
+    np.add.at(cambios, (np.searchsorted(limites, inicios), columna), 1)
+    np.add.at(cambios, (np.searchsorted(limites, fines), columna), -1)
+    sonando = np.cumsum(cambios, axis=0)[:len(limites) - 1] > 0
+
+    con_sonido = sonando.any(axis=1)
+    sonando = sonando[con_sonido]
+    offsets = limites[:-1][con_sonido]
+    duraciones = np.diff(limites)[con_sonido]
+
+    bits = (1 << (alturas % 12)).astype(np.uint16)
+    mascaras = np.bitwise_or.reduce(np.where(sonando, bits, 0).astype(np.uint16), axis=1)
+
+    compases = np.zeros(len(offsets), dtype=np.int64)
+    if len(barras):
+        posiciones = np.searchsorted(barras, offsets, side="right") - 1
+        dentro = posiciones >= 0
+        compases[dentro] = numeros[posiciones[dentro]]
+
+    if nombres == "tabla":
+        etiquetas = [TIPOS_ACORDE[m] for m in mascaras]
+    else:
+        etiquetas = [_nombre_music21(tuple(int(a) for a in alturas[fila])) for fila in sonando]
+    return SecuenciaAcordes(etiquetas, offsets, duraciones, compases, mascaras)
+
+
+_secuencias = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def acordes(score, instrumentos_seleccionados=None, nombres=NOMBRES_ACORDES):
+    """
+    Secuencia de acordes del score restringida a los instrumentos indicados.
+    Se calcula una sola vez por (score, subconjunto de partes, nombres) y el
+    resultado se comparte entre todas las métricas armónicas.
+    """
+    indices = tuple(tabla_notas(score).indices_partes(instrumentos_seleccionados))
+    clave = (indices, nombres)
+    with _lock:
+        por_subconjunto = _secuencias.setdefault(score, {})
+        secuencia = por_subconjunto.get(clave)
+    if secuencia is None:
+        secuencia = cortes_verticales(score, list(indices), nombres) if indices else _vacia()
+        with _lock:
+            secuencia = por_subconjunto.setdefault(clave, secuencia)
+    return secuencia
+
+
+def acordes_ventana(score, instrumentos_seleccionados=None, ventana=None, nombres=NOMBRES_ACORDES):
+    """
+    Secuencia de acordes que cubre una ventana de compases. Si la secuencia
+    completa ya está calculada se reutiliza; si no, el barrido se limita a los
+    offsets de la ventana y no se guarda.
+    """
+    if ventana is None:
+        return acordes(score, instrumentos_seleccionados, nombres)
+    indices = tuple(tabla_notas(score).indices_partes(instrumentos_seleccionados))
+    with _lock:
+        secuencia = _secuencias.get(score, {}).get((indices, nombres))
+    if secuencia is not None:
+        return secuencia
+    rango = indice_compases(score).offsets_ventana(ventana)
+    if not indices or rango is None:
+        return _vacia()
+    return cortes_verticales(score, list(indices), nombres, rango)
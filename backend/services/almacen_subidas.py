@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from backend.config import SUBIDA_MAX_MB
+from backend.services.cache_partituras import hash_archivo_en_disco, registrar_hash
+
+DIRECTORIO_SUBIDAS = "uploads"
+
+# Bloques en los que se lee la subida mientras se escribe y se calcula su hash
+TAMANO_BLOQUE_SUBIDA = 1024 * 1024
+
+# Permisos de los objetos guardados (los temporales se crean con 0600)
+PERMISOS_OBJETO = 0o644
+
+
+class SubidaDemasiadoGrande(Exception):
+    pass
+
+
+class AlmacenSubidas:
+    """
+    Archivos subidos direccionados por contenido: cada contenido distinto se
+    guarda una sola vez en `.objetos/<xx>/<sha256>` y `uploads/<nombre>` es un
+    enlace duro a su objeto, así que el resto del backend sigue leyendo por
+    nombre. El índice nombre -> hash vive en `.nombres.json`.
+
+    Volver a subir un contenido ya conocido no escribe nada nuevo y conserva el
+    hash, con lo que las cachés de partituras y de resultados aciertan al momento.
+    """
+
+    def __init__(self, directorio, max_bytes):
+        self.directorio = Path(directorio)
+        self.objetos = self.directorio / ".objetos"
+        self.ruta_indice = self.directorio / ".nombres.json"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._indice = None
+
+    def _cargar_indice(self):
+        if self._indice is None:
+            try:
+                self._indice = json.loads(self.ruta_indice.read_text(encoding="utf-8"))
+            except (FileNotFoundError, ValueError):
+                self._indice = {}
+        return self._indice
+
+    def _guardar_indice(self):
+        fd, temporal = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._indice, f, ensure_ascii=False, indent=1)
+        os.replace(temporal, self.ruta_indice)
+
+    def ruta_objeto(self, digest):
+        return self.objetos / digest[:2] / digest
+
+    def ruta(self, nombre):
+        return self.directorio / nombre
+
+    def hash_de(self, nombre):
+        with self._lock:
+            entrada = self._cargar_indice().get(nombre)
+        return entrada["hash"] if entrada else None
+
+    def guardar(self, nombre, leer_bloque):
+        """
+        Guarda el contenido que devuelve `leer_bloque()` (b"" al terminar) con
+        el nombre dado. Devuelve {nombre, hash, tamano, duplicado}.
+        """
+        self.objetos.mkdir(parents=True, exist_ok=True)
+        h = hashlib.sha256()
+        tamano = 0
+        fd, temporal = tempfile.mkstemp(dir=self.objetos, suffix=".subida")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for bloque in iter(leer_bloque, b""):
+                    tamano += len(bloque)
+                    if self.max_bytes and tamano > self.max_bytes:
+                        raise SubidaDemasiadoGrande(
+                            f"El archivo supera el máximo de {self.max_bytes // (1024 * 1024)} MB"
+                        )
+                    h.update(bloque)
+                    f.write(bloque)
+            digest = h.hexdigest()
+            return self._registrar(nombre, digest, tamano, temporal)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def _registrar(self, nombre, digest, tamano, temporal):
+        objeto = self.ruta_objeto(digest)
+        destino = self.ruta(nombre)
+        with self._lock:
+            duplicado = objeto.exists()
+            if not duplicado:
+                objeto.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temporal, objeto)
+                os.chmod(objeto, PERMISOS_OBJETO)
+
+            anterior = self._cargar_indice().get(nombre, {}).get("hash")
+            if anterior != digest or not destino.exists():
+                _enlazar(objeto, destino)
+            self._anotar(nombre, digest, tamano, time.time())
+            self._guardar_indice()
+
+        registrar_hash(destino, digest)
+        registrar_hash(objeto, digest)
+        return {"nombre": nombre, "hash": digest, "tamano": tamano, "duplicado": duplicado}
+
+    def _anotar(self, nombre, digest, tamano, subido):
+        indice = self._cargar_indice()
+        anterior = indice.get(nombre, {}).get("hash")
+        indice[nombre] = {"hash": digest, "tamano": tamano, "subido": subido}
+        # El objeto anterior se borra si ya ningún nombre apunta a él
+        if anterior and anterior != digest and all(e["hash"] != anterior for e in indice.values()):
+            self.ruta_objeto(anterior).unlink(missing_ok=True)
+
+    def importar_existentes(self):
+        """
+        Incorpora al índice los archivos de `uploads/` que no pasaron por el
+        almacén (anteriores a él o copiados a mano) o cuyo contenido cambió
+        fuera de él, y olvida los nombres cuyo archivo ya no existe. Devuelve
+        el número de nombres importados.
+        """
+        if not self.directorio.is_dir():
+            return 0
+        importados = 0
+        with self._lock:
+            indice = self._cargar_indice()
+            for nombre in [n for n in indice if not self.ruta(n).is_file()]:
+                digest = indice.pop(nombre)["hash"]
+                if all(e["hash"] != digest for e in indice.values()):
+                    self.ruta_objeto(digest).unlink(missing_ok=True)
+                importados += 1
+            for ruta in sorted(self.directorio.iterdir()):
+                if ruta.name.startswith(".") or not ruta.is_file():
+                    continue
+                digest = hash_archivo_en_disco(ruta)
+                anterior = indice.get(ruta.name, {}).get("hash")
+                if anterior == digest:
+                    continue
+                if anterior and self.ruta_objeto(anterior).exists() and os.path.samefile(ruta, self.ruta_objeto(anterior)):
+                    # Se sobrescribió a través del enlace: el objeto ya no guarda ese contenido
+                    self.ruta_objeto(anterior).unlink()
+                objeto = self.ruta_objeto(digest)
+                if objeto.exists():
+                    # Mismo contenido que otro nombre: comparten el objeto
+                    _enlazar(objeto, ruta)
+                else:
+                    objeto.parent.mkdir(parents=True, exist_ok=True)
+                    _enlazar(ruta, objeto)
+                    os.chmod(objeto, PERMISOS_OBJETO)
+                estado = ruta.stat()
+                self._anotar(ruta.name, digest, estado.st_size, estado.st_mtime)
+                registrar_hash(ruta, digest)
+                registrar_hash(objeto, digest)
+                importados += 1
+            if importados:
+                self.objetos.mkdir(parents=True, exist_ok=True)
+                self._guardar_indice()
+        return importados
+
+
+def _enlazar(objeto, destino):
+    # El nombre se sustituye de forma atómica; sin enlaces duros, se copia
+    temporal = destino.with_name(f".{destino.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        os.link(objeto, temporal)
+    except OSError:
+        shutil.copyfile(objeto, temporal)
+    os.replace(temporal, destino)
+
+
+def nombre_seguro(nombre):
+    """
+    Nombre de archivo sin directorios. Se rechazan los vacíos y los ocultos,
+    que chocarían con los ficheros internos del almacén.
+    """
+    nombre = os.path.basename((nombre or "").replace("\\", "/"))
+    if not nombre or nombre.startswith("."):
+        raise ValueError("Nombre de archivo inválido")
+    return nombre
+
+
+almacen_subidas = AlmacenSubidas(DIRECTORIO_SUBIDAS, SUBIDA_MAX_MB * 1024 * 1024)
+
+
+def guardar_subida(nombre, leer_bloque):
+    return almacen_subidas.guardar(nombre_seguro(nombre), leer_bloque)
+
+
+def importar_subidas_existentes():
+    almacen_subidas.importar_existentes()
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pretty_midi
+from music21 import converter
+
+from backend.config import CACHE_PARTITURAS_MB, INGESTA
+
+# Estimación gruesa de memoria: cada nota genera varios objetos music21
+# (Note, Pitch, Duration, Volume) además de la nota de pretty_midi.
+BYTES_POR_NOTA_ESTIMADOS = 4096
+TAMANO_BLOQUE_HASH = 1024 * 1024
+
+
+def hash_archivo(ruta):
+    """
+    Calcula el hash SHA-256 del contenido del archivo.
+    """
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE_HASH), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+_hashes_en_disco = {}
+_lock_hashes = threading.Lock()
+
+
+def hash_archivo_en_disco(ruta):
+    """
+    `hash_archivo` recordado por (ruta, mtime, tamaño): el archivo solo se
+    vuelve a leer si cambia en disco.
+    """
+    estado = os.stat(ruta)
+    firma = (str(ruta), estado.st_mtime_ns, estado.st_size)
+    with _lock_hashes:
+        h = _hashes_en_disco.get(firma)
+    if h is None:
+        h = hash_archivo(ruta)
+        with _lock_hashes:
+            _hashes_en_disco[firma] = h
+    return h
+
+
+def registrar_hash(ruta, h):
+    """
+    Anota el hash ya conocido de un archivo recién escrito para no releerlo.
+    """
+    estado = os.stat(ruta)
+    with _lock_hashes:
+        _hashes_en_disco[(str(ruta), estado.st_mtime_ns, estado.st_size)] = h
+
+
+class EntradaPartitura:
+    """
+    Archivo parseado. El PrettyMIDI se carga siempre; el score de music21 solo
+    la primera vez que alguien lo pide.
+    """
+
+    def __init__(self, hash_contenido, ruta, midi, tamano_estimado):
+        self.hash = hash_contenido
+        self.ruta = ruta
+        self.midi = midi
+        self.tamano_estimado = tamano_estimado
+        self._score = None
+        self._eventos = None
+        self._lock = threading.Lock()
+
+    @property
+    def score(self):
+        if self._score is None:
+            with self._lock:
+                if self._score is None:
+                    self._score = converter.parse(self.ruta)
+        return self._score
+
+    @property
+    def eventos(self):
+        """
+        Partitura construida desde los eventos MIDI (ver `ingesta_midi`).
+        """
+        if self._eventos is None:
+            from backend.services.ingesta_midi import PartituraMidi
+            with self._lock:
+                if self._eventos is None:
+                    self._eventos = PartituraMidi(self)
+        return self._eventos
+
+
+def estimar_tamano(midi, tamano_archivo):
+    total_notas = sum(len(inst.notes) for inst in midi.instruments)
+    return tamano_archivo + total_notas * BYTES_POR_NOTA_ESTIMADOS
+
+
+class CachePartituras:
+    """
+    Caché LRU de pares (music21 Score, PrettyMIDI) indexada por el hash del
+    contenido del archivo. Expulsa las entradas menos usadas cuando la memoria
+    estimada supera el límite configurado.
+
+    Los objetos devueltos son compartidos entre peticiones: no deben mutarse.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def obtener(self, ruta):
+        ruta = str(ruta)
+        clave = hash_archivo_en_disco(ruta)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada
+            self.fallos += 1
+
+        # El parseo se hace fuera del lock para no bloquear otras peticiones;
+        # el de music21 se difiere hasta que se use `entrada.score`
+        midi = pretty_midi.PrettyMIDI(ruta)
+        entrada = EntradaPartitura(clave, ruta, midi, estimar_tamano(midi, os.path.getsize(ruta)))
+
+        with self._lock:
+            existente = self._entradas.get(clave)
+            if existente is not None:
+                self._entradas.move_to_end(clave)
+                return existente
+            self._entradas[clave] = entrada
+            self._bytes += entrada.tamano_estimado
+            self._expulsar()
+        return entrada
+
+    def _expulsar(self):
+        # Siempre se conserva la entrada más reciente aunque supere el límite
+        while self._bytes > self.max_bytes and len(self._entradas) > 1:
+            _, entrada = self._entradas.popitem(last=False)
+            self._bytes -= entrada.tamano_estimado
+            self.expulsiones += 1
+
+    def invalidar(self, clave):
+        with self._lock:
+            entrada = self._entradas.pop(clave, None)
+            if entrada is not None:
+                self._bytes -= entrada.tamano_estimado
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "bytes_estimados": self._bytes,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+                "tasa_aciertos": round(self.aciertos / consultas, 3) if consultas else 0.0
+            }
+
+
+cache_partituras = CachePartituras(CACHE_PARTITURAS_MB * 1024 * 1024)
+
+
+def obtener_entrada(ruta):
+    return cache_partituras.obtener(ruta)
+
+
+def cargar_partitura(ruta):
+    """
+    Devuelve el par (score, midi) del archivo, parseándolo solo si su contenido
+    no está ya en la caché.
+    """
+    entrada = cache_partituras.obtener(ruta)
+    return entrada.score, entrada.midi
+
+
+def cargar_eventos(ruta):
+    """
+    Como `cargar_partitura`, pero con `SMARTSCORE_INGESTA=midi` devuelve una
+    partitura construida desde los eventos MIDI: las métricas que solo usan la
+    tabla de notas y la rejilla de compases no esperan al parseo de music21.
+    """
+    entrada = cache_partituras.obtener(ruta)
+    if INGESTA == "midi":
+        return entrada.eventos, entrada.midi
+    return entrada.score, entrada.midi
+
+
+def estadisticas_cache():
+    return cache_partituras.estadisticas()
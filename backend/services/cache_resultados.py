@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from backend.config import (
+    CACHE_RESULTADOS_DIR, CACHE_RESULTADOS_MB, INGESTA, NOMBRES_ACORDES
+)
+from backend.services.cache_partituras import hash_archivo_en_disco
+
+# Subir este número al cambiar una métrica de forma que el código fuente no lo
+# refleje (p. ej. un cambio en una dependencia)
+VERSION_METRICAS = 1
+
+# Al vaciar la caché se deja por debajo de esta fracción del límite
+FRACCION_TRAS_EXPULSAR = 0.9
+
+
+# Carpetas de `backend/` cuyo código determina lo que se guarda: los endpoints
+# también calculan entradas (y guardan objetos de los esquemas)
+CARPETAS_VERSIONADAS = ("services", "endpoints", "schemas")
+
+
+def _version_codigo(backend=Path(__file__).resolve().parent.parent):
+    # Cualquier cambio en el código de análisis invalida lo guardado, igual
+    # que la configuración que altera los resultados
+    h = hashlib.sha256(f"{VERSION_METRICAS}|{INGESTA}|{NOMBRES_ACORDES}".encode())
+    for carpeta in CARPETAS_VERSIONADAS:
+        for fuente in sorted((backend / carpeta).glob("*.py")):
+            h.update(f"{carpeta}/{fuente.name}".encode())
+            h.update(fuente.read_bytes())
+    return h.hexdigest()[:16]
+
+
+VERSION_CODIGO = _version_codigo()
+
+
+class CacheResultados:
+    """
+    Caché en disco de resultados de análisis, compartida entre procesos y
+    reinicios. La clave combina el hash del contenido del archivo, el nombre
+    del análisis, sus parámetros y la versión del código; las entradas de otra
+    versión quedan en otro subdirectorio y se borran al arrancar.
+
+    Cuando el tamaño supera el límite se borran las entradas usadas hace más
+    tiempo (la fecha de modificación se renueva en cada acierto).
+    """
+
+    def __init__(self, directorio, max_bytes, version=VERSION_CODIGO):
+        self.raiz = Path(directorio)
+        self.version = version
+        self.directorio = self.raiz / version
+        self.max_bytes = max_bytes
+        self._bytes = None
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    @property
+    def activa(self):
+        return self.max_bytes > 0
+
+    def _ruta_entrada(self, nombre, ruta, parametros):
+        clave = json.dumps([nombre, hash_archivo_en_disco(ruta), parametros], sort_keys=True, default=str)
+        digest = hashlib.sha256(clave.encode()).hexdigest()
+        return self.directorio / digest[:2] / f"{digest}.pkl"
+
+    def obtener(self, nombre, ruta, parametros, calcular, guardar_si=None):
+        """
+        Devuelve el resultado guardado para (archivo, nombre, parámetros) o lo
+        calcula con `calcular()` y lo guarda (si `guardar_si(resultado)` lo
+        permite, para no fijar errores transitorios).
+        """
+        if not self.activa:
+            return calcular()
+        try:
+            destino = self._ruta_entrada(nombre, ruta, parametros)
+        except OSError:
+            return calcular()
+
+        try:
+            with open(destino, "rb") as f:
+                resultado = pickle.load(f)
+            os.utime(destino)
+            with self._lock:
+                self.aciertos += 1
+            return resultado
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError, TypeError):
+            # Entrada ilegible o que nombra clases que ya no existen: es un fallo
+            with self._lock:
+                self.fallos += 1
+
+        resultado = calcular()
+        if guardar_si is None or guardar_si(resultado):
+            self._guardar(destino, resultado)
+        return resultado
+
+    def _guardar(self, destino, resultado):
+        try:
+            datos = pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        # Escritura atómica: otros procesos pueden estar leyendo la misma clave
+        fd, temporal = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(datos)
+            os.replace(temporal, destino)
+        except OSError:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._tamano_total()
+            else:
+                self._bytes += len(datos)
+            if self._bytes > self.max_bytes:
+                self._expulsar()
+
+    def _entradas(self):
+        return list(self.directorio.glob("*/*.pkl")) if self.directorio.exists() else []
+
+    def _tamano_total(self):
+        total = 0
+        for archivo in self._entradas():
+            try:
+                total += archivo.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _expulsar(self):
+        # Otros procesos escriben en el mismo directorio: se vuelve a medir
+        entradas = []
+        for archivo in self._entradas():
+            try:
+                estado = archivo.stat()
+            except OSError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, archivo))
+        entradas.sort()
+        total = sum(tamano for _, tamano, _ in entradas)
+        objetivo = self.max_bytes * FRACCION_TRAS_EXPULSAR
+        for _, tamano, archivo in entradas:
+            if total <= objetivo:
+                break
+            try:
+                archivo.unlink()
+            except OSError:
+                continue
+            total -= tamano
+            self.expulsiones += 1
+        self._bytes = total
+
+    def borrar_versiones_antiguas(self):
+        if not self.raiz.exists():
+            return
+        for directorio in self.raiz.iterdir():
+            if directorio.is_dir() and directorio.name != self.version:
+                shutil.rmtree(directorio, ignore_errors=True)
+
+    def limpiar(self):
+        with self._lock:
+            for archivo in self._entradas():
+                archivo.unlink(missing_ok=True)
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._tamano_total()
+            consultas = self.aciertos + self.fallos
+            return {
+                "version": self.version,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+                "tasa_aciertos": round(self.aciertos / consultas, 3) if consultas else 0.0
+            }
+
+
+cache_resultados = CacheResultados(CACHE_RESULTADOS_DIR, CACHE_RESULTADOS_MB * 1024 * 1024)
+
+
+def con_cache(nombre, ruta, parametros, calcular, guardar_si=None):
+    return cache_resultados.obtener(nombre, ruta, parametros, calcular, guardar_si)
+
+
+def borrar_versiones_antiguas():
+    cache_resultados.borrar_versiones_antiguas()
+
+
+def estadisticas_cache_resultados():
+    return cache_resultados.estadisticas()
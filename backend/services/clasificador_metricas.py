@@ -1,3 +1,8 @@
+import contextvars
+from contextlib import contextmanager
+
+import numpy as np
+
 from backend.services.parser import (
     instrumentos_detectados, cantidad_total_notas, partes_detectadas,
     participacion_por_partes, clasificar_familias, balance_dinamico,
@@ -5,8 +10,12 @@ from backend.services.parser import (
     entropia_melodica, entropia_ritmica, entropia_armonica, entropia_interaccion,
     complejidad_total, firma_metrica, seccion_aurea, variedad_tonal,
     innovacion_estadistica, firma_fractal, contrapunto_activo, red_interaccion,
-    seccion_aurea_por_compas, compases_no_vacios_por_instrumento
+    seccion_aurea_por_compas, compases_no_vacios_por_instrumento, intervalos_melodicos
 )
+from backend.services.indice_compases import indice_compases
+from backend.services.tabla_notas import tabla_notas
+from backend.services.cache_partituras import cargar_eventos
+from backend.services.cache_resultados import con_cache
 from backend.services.mixtas_parser import (
     compacidad_melodica, repetitividad_motívica, densidad_armonica,
     variabilidad_intervalica, promedio_notas_por_compas, varianza_notas_por_compas,
@@ -17,11 +26,95 @@ from backend.services.mixtas_parser import (
     variabilidad_intervalica_por_compas, contrapunto_activo_instrumento
 )
 
-def blindar(func, *args, nombre=None, **kwargs):
+# Comienzo de los valores y claves que sustituyen a una métrica que falló
+PREFIJO_ERROR = "[ERROR en"
+
+_plan_actual = contextvars.ContextVar("plan_metricas", default=None)
+# Ventana (desde, hasta) de compases a la que se limitan las métricas `*_por_compas`
+_ventana_actual = contextvars.ContextVar("ventana_compases", default=None)
+
+def _ventana():
+    return _ventana_actual.get()
+
+class PlanMetricas:
+    """
+    Plan de una petición: cada métrica subyacente, identificada por (función,
+    argumentos), se calcula una sola vez aunque la pidan varias categorías o
+    submodos; los diccionarios de cada categoría se arman con los resultados
+    compartidos.
+    """
+
+    def __init__(self):
+        self.resultados = {}
+        self.calculadas = 0
+        self.reutilizadas = 0
+
+    def obtener(self, clave, calcular):
+        if clave in self.resultados:
+            self.reutilizadas += 1
+        else:
+            self.calculadas += 1
+            try:
+                self.resultados[clave] = (calcular(), None)
+            except Exception as e:
+                self.resultados[clave] = (None, e)
+        return self.resultados[clave]
+
+@contextmanager
+def plan_metricas():
+    plan = _plan_actual.get()
+    if plan is not None:
+        # Llamada anidada: se comparte el plan de la petición
+        yield plan
+        return
+    plan = PlanMetricas()
+    token = _plan_actual.set(plan)
     try:
-        return func(*args, **kwargs)
-    except Exception as e:
-        return f"[ERROR en {nombre}]: {str(e)}"
+        yield plan
+    finally:
+        _plan_actual.reset(token)
+
+def _clave_argumento(valor):
+    if valor is None or isinstance(valor, (str, int, float, bool)):
+        return valor
+    if isinstance(valor, (list, tuple)):
+        return tuple(_clave_argumento(v) for v in valor)
+    # score, midi: el plan los mantiene vivos, así que su id es estable
+    return ("id", id(valor))
+
+def _clave_funcion(func):
+    # Las lambdas se recrean en cada llamada: se identifican por su código
+    codigo = getattr(func, "__code__", None)
+    return codigo if codigo is not None and not getattr(func, "__closure__", None) else func
+
+def blindar(func, *args, nombre=None, **kwargs):
+    plan = _plan_actual.get()
+    if plan is None:
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            return f"[ERROR en {nombre}]: {str(e)}"
+    clave = (
+        _clave_funcion(func),
+        _clave_argumento(args),
+        tuple(sorted((k, _clave_argumento(v)) for k, v in kwargs.items()))
+    )
+    resultado, error = plan.obtener(clave, lambda: func(*args, **kwargs))
+    if error is not None:
+        return f"[ERROR en {nombre}]: {str(error)}"
+    return resultado
+
+def contiene_errores(metricas):
+    """
+    Indica si alguna métrica (o submodo) quedó con la marca de error de `blindar`.
+    """
+    if isinstance(metricas, str):
+        return metricas.startswith(PREFIJO_ERROR)
+    if isinstance(metricas, dict):
+        return any(str(k).startswith(PREFIJO_ERROR) or contiene_errores(v) for k, v in metricas.items())
+    if isinstance(metricas, (list, tuple)):
+        return any(contiene_errores(v) for v in metricas)
+    return False
 
 def fusionar_metricas(score, midi=None, instrumento=None, funcion=None):
     resultado = {}
@@ -74,10 +167,10 @@ def metricas_melodicas(score, instrumento=None, modo="global"):
         resultado["repetitividad_motívica"] = blindar(repetitividad_motívica, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="repetitividad_motívica")
     if modo == "compases":
         resultado["promedio_notas_por_compas"] = blindar(promedio_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="promedio_notas_por_compas") # Modificado
-        resultado["varianza_notas_por_compas"] = blindar(varianza_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="varianza_notas_por_compas") # Modificado
-        resultado["compacidad_melodica_por_compas"] = blindar(compacidad_melodica_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="compacidad_melodica_por_compas")
-        resultado["repetitividad_motívica_por_compas"] = blindar(repetitividad_motívica_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="repetitividad_motívica_por_compas")
-        resultado["cantidad_notas_por_compas"] = blindar(notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="cantidad_notas_por_compas")
+        resultado["varianza_notas_por_compas"] = blindar(varianza_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="varianza_notas_por_compas") # Modificado
+        resultado["compacidad_melodica_por_compas"] = blindar(compacidad_melodica_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="compacidad_melodica_por_compas")
+        resultado["repetitividad_motívica_por_compas"] = blindar(repetitividad_motívica_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="repetitividad_motívica_por_compas")
+        resultado["cantidad_notas_por_compas"] = blindar(notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="cantidad_notas_por_compas")
     return resultado
 
 def metricas_ritmicas(score, instrumento=None, modo="global"):
@@ -96,11 +189,11 @@ def metricas_ritmicas(score, instrumento=None, modo="global"):
         resultado["entropia_ritmica"] = blindar(entropia_ritmica, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="entropia_ritmica")
         resultado["firma_metrica"] = blindar(firma_metrica, score, nombre="firma_metrica")
         resultado["promedio_notas_por_compas"] = blindar(promedio_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="promedio_notas_por_compas")
-        resultado["varianza_notas_por_compas"] = blindar(varianza_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="varianza_notas_por_compas")
+        resultado["varianza_notas_por_compas"] = blindar(varianza_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="varianza_notas_por_compas")
     if modo == "compases":
         resultado["promedio_notas_por_compas"] = blindar(promedio_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="promedio_notas_por_compas")
-        resultado["varianza_notas_por_compas"] = blindar(varianza_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="varianza_notas_por_compas")
-        resultado["cantidad_notas_por_compas"] = blindar(notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="cantidad_notas_por_compas")
+        resultado["varianza_notas_por_compas"] = blindar(varianza_notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="varianza_notas_por_compas")
+        resultado["cantidad_notas_por_compas"] = blindar(notas_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="cantidad_notas_por_compas")
     return resultado
 
 def metricas_armonicas(score, instrumento=None, modo="global"):
@@ -115,7 +208,7 @@ def metricas_armonicas(score, instrumento=None, modo="global"):
         resultado["innovacion_estadistica"] = blindar(innovacion_estadistica, score, nombre="innovacion_estadistica")
     if modo == "compases":
         resultado["densidad_armonica"] = blindar(densidad_armonica, score, nombre="densidad_armonica")
-        resultado["densidad_armonica_por_compas"] = blindar(densidad_armonica_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="densidad_armonica_por_compas")
+        resultado["densidad_armonica_por_compas"] = blindar(densidad_armonica_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="densidad_armonica_por_compas")
     return resultado
 
 def metricas_armonicas(score, instrumento=None, modo="global"):
@@ -149,6 +242,10 @@ def metricas_texturales(score, instrumento=None, modo="global"):
         resultado["complejidad_total"] = blindar(complejidad_total, score, instrumento=instrumento, nombre="complejidad_total") # Modificado
     return resultado
 
+def compases_estimados(score):
+    # Compases de 4 negras a 120 bpm hasta el final de la obra (`highestTime`)
+    return int(tabla_notas(score).fin() / (60 / 120) / 4)
+
 def metricas_formales(score, modo="global"):
     resultado = {}
     if modo == "todos":
@@ -162,9 +259,9 @@ def metricas_formales(score, modo="global"):
         resultado["seccion_aurea"] = blindar(seccion_aurea, score, nombre="seccion_aurea")
     if modo == "mixtas":
         resultado["seccion_aurea"] = blindar(seccion_aurea, score, nombre="seccion_aurea")
-        resultado["compases_estimados"] = blindar(lambda s: int(s.highestTime / (60 / 120) / 4), score, nombre="compases_estimados") # Mantener si se quiere la estimación global
+        resultado["compases_estimados"] = blindar(compases_estimados, score, nombre="compases_estimados") # Mantener si se quiere la estimación global
     if modo == "compases":
-        resultado["compases_estimados"] = blindar(lambda s: int(s.highestTime / (60 / 120) / 4), score, nombre="compases_estimados") # Mantener si se quiere la estimación global
+        resultado["compases_estimados"] = blindar(compases_estimados, score, nombre="compases_estimados") # Mantener si se quiere la estimación global
     return resultado
 
 def metricas_interaccion(score, midi, instrumento=None, modo="global"):
@@ -189,6 +286,7 @@ def metricas_interaccion(score, midi, instrumento=None, modo="global"):
             dispersion_temporal_por_compas,
             score,
             instrumentos_seleccionados=[instrumento] if instrumento else None,
+            ventana=_ventana(),
             nombre="dispersion_temporal_por_compas"
         )
     if modo == "compases":
@@ -196,10 +294,11 @@ def metricas_interaccion(score, midi, instrumento=None, modo="global"):
             dispersion_temporal_por_compas,
             score,
             instrumentos_seleccionados=[instrumento] if instrumento else None,
+            ventana=_ventana(),
             nombre="dispersion_temporal_por_compas"
         )
-        resultado["sincronizacion_entrada_por_compas"] = blindar(sincronizacion_entrada_por_compas, score, midi, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="sincronizacion_entrada_por_compas")
-        resultado["dispersion_temporal_por_compas"] = blindar(dispersion_temporal_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="dispersion_temporal_por_compas")
+        resultado["sincronizacion_entrada_por_compas"] = blindar(sincronizacion_entrada_por_compas, score, midi, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="sincronizacion_entrada_por_compas")
+        resultado["dispersion_temporal_por_compas"] = blindar(dispersion_temporal_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="dispersion_temporal_por_compas")
     return resultado
 
 def metricas_comparativas(score, midi, instrumento=None, modo="global"):
@@ -216,11 +315,11 @@ def metricas_comparativas(score, midi, instrumento=None, modo="global"):
         resultado["promedio_rango_dinamico"] = blindar(
             promedio_rango_dinamico,
             midi,
-            len(score.parts[0].getElementsByClass('Measure')),
+            len(indice_compases(score)),
             [instrumento] if instrumento else None,
             nombre="promedio_rango_dinamico"
         )
-        resultado["promedio_rango_dinamico_por_compas"] = blindar(promedio_rango_dinamico_por_compas, midi, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="promedio_rango_dinamico_por_compas")
+        resultado["promedio_rango_dinamico_por_compas"] = blindar(promedio_rango_dinamico_por_compas, midi, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="promedio_rango_dinamico_por_compas")
 
     return resultado
 
@@ -230,20 +329,85 @@ def metricas_diferenciadoras(score, instrumento=None, modo="global"):
     resultado = {}
     if modo in ["global", "mixtas", "compases"]:
         resultado["variabilidad_intervalica"] = blindar(variabilidad_intervalica,score, [instrumento] if instrumento else None, nombre="variabilidad_intervalica")
-        resultado["variabilidad_intervalica_por_compas"] = blindar(variabilidad_intervalica_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, nombre="variabilidad_intervalica_por_compas")
+        resultado["variabilidad_intervalica_por_compas"] = blindar(variabilidad_intervalica_por_compas, score, instrumentos_seleccionados=[instrumento] if instrumento else None, ventana=_ventana(), nombre="variabilidad_intervalica_por_compas")
     return resultado
 
-def metricas_todas(score, midi, instrumento=None, modo="global"):
+def metricas_todas(score, midi, instrumento=None, modo="global", progreso=None):
     resultado = {}
     submodos_a_ejecutar = ["global", "mixtas", "compases"] if modo == "todos" else [modo]
+    pasos = [
+        ("instrumentales", metricas_instrumentales, (score, midi), {"instrumento": instrumento}),
+        ("melodicas", metricas_melodicas, (score,), {"instrumento": instrumento}),
+        ("ritmicas", metricas_ritmicas, (score,), {"instrumento": instrumento}),
+        ("armonicas", metricas_armonicas, (score,), {"instrumento": instrumento}),
+        ("formales", metricas_formales, (score,), {}),
+        ("texturales", metricas_texturales, (score,), {"instrumento": instrumento}),
+        ("interaccion", metricas_interaccion, (score, midi), {"instrumento": instrumento}),
+        ("comparativas", metricas_comparativas, (score, midi), {"instrumento": instrumento}),
+        ("diferenciadoras", metricas_diferenciadoras, (score,), {"instrumento": instrumento}),
+    ]
+    total = len(submodos_a_ejecutar) * len(pasos)
+    hechos = 0
     for submodo_actual in submodos_a_ejecutar:
-        resultado.update(blindar(metricas_instrumentales, score, midi, instrumento=instrumento, modo=submodo_actual, nombre=f"instrumentales_{submodo_actual}"))
-        resultado.update(blindar(metricas_melodicas, score, instrumento=instrumento, modo=submodo_actual, nombre=f"melodicas_{submodo_actual}"))
-        resultado.update(blindar(metricas_ritmicas, score, instrumento=instrumento, modo=submodo_actual, nombre=f"ritmicas_{submodo_actual}"))
-        resultado.update(blindar(metricas_armonicas, score, instrumento=instrumento, modo=submodo_actual, nombre=f"armonicas_{submodo_actual}"))
-        resultado.update(blindar(metricas_formales, score, modo=submodo_actual, nombre=f"formales_{submodo_actual}"))
-        resultado.update(blindar(metricas_texturales, score, instrumento=instrumento, modo=submodo_actual, nombre=f"texturales_{submodo_actual}"))
-        resultado.update(blindar(metricas_interaccion, score, midi, instrumento=instrumento, modo=submodo_actual, nombre=f"interaccion_{submodo_actual}"))
-        resultado.update(blindar(metricas_comparativas, score, midi, instrumento=instrumento, modo=submodo_actual, nombre=f"comparativas_{submodo_actual}"))
-        resultado.update(blindar(metricas_diferenciadoras, score, instrumento=instrumento, modo=submodo_actual, nombre=f"diferenciadoras_{submodo_actual}"))
-    return resultado
\ No newline at end of file
+        for nombre, funcion, args, kwargs in pasos:
+            resultado.update(blindar(funcion, *args, modo=submodo_actual, nombre=f"{nombre}_{submodo_actual}", **kwargs))
+            hechos += 1
+            if progreso:
+                progreso(hechos / total)
+    return resultado
+
+CATEGORIAS = [
+    "instrumentales", "comparativas", "ritmicas", "formales", "melodicas",
+    "armonicas", "texturales", "interaccion", "diferenciadoras", "todos"
+]
+
+def metricas_categoria(score, midi, categoria, instrumento=None, modo="global", progreso=None, ventana=None):
+    token = _ventana_actual.set(ventana)
+    try:
+        with plan_metricas():
+            return _metricas_categoria(score, midi, categoria, instrumento, modo, progreso)
+    finally:
+        _ventana_actual.reset(token)
+
+def _metricas_categoria(score, midi, categoria, instrumento=None, modo="global", progreso=None):
+    if categoria == "instrumentales":
+        return metricas_instrumentales(score, midi, instrumento=instrumento, modo=modo)
+    elif categoria == "comparativas":
+        return metricas_comparativas(score, midi, instrumento=instrumento, modo=modo)
+    elif categoria == "ritmicas":
+        return metricas_ritmicas(score, instrumento=instrumento, modo=modo)
+    elif categoria == "formales":
+        return metricas_formales(score, modo=modo)
+    elif categoria == "melodicas":
+        return metricas_melodicas(score, instrumento=instrumento, modo=modo)
+    elif categoria == "armonicas":
+        return metricas_armonicas(score, instrumento=instrumento, modo=modo)
+    elif categoria == "texturales":
+        return metricas_texturales(score, instrumento=instrumento, modo=modo)
+    elif categoria == "interaccion":
+        return metricas_interaccion(score, midi, instrumento=instrumento, modo=modo)
+    elif categoria == "diferenciadoras":
+        return metricas_diferenciadoras(score, instrumento=instrumento, modo=modo)
+    elif categoria == "todos":
+        return metricas_todas(score, midi, instrumento=instrumento, modo=modo, progreso=progreso)
+    raise ValueError(f"Categoría inválida: {categoria}")
+
+def metricas_archivo(ruta, categoria, instrumento=None, modo="global", progreso=None, ventana=None):
+    def calcular():
+        score, midi = cargar_eventos(ruta)
+        return metricas_categoria(score, midi, categoria, instrumento=instrumento or None, modo=modo, progreso=progreso, ventana=ventana)
+    # Un error puede ser transitorio: no se guarda
+    return con_cache(
+        f"metricas_{categoria}", ruta, {"instrumento": instrumento or None, "modo": modo, "ventana": ventana},
+        calcular, guardar_si=lambda resultado: not contiene_errores(resultado)
+    )
+
+def intervalos_archivo(ruta, instrumento=None):
+    """
+    Secuencia completa de intervalos melódicos del archivo (o del instrumento),
+    que `intervalos_predominantes` resume en un histograma.
+    """
+    def calcular():
+        score, _ = cargar_eventos(ruta)
+        return intervalos_melodicos(score, instrumento=instrumento or None).astype(np.int16)
+    return con_cache("intervalos_todos", ruta, {"instrumento": instrumento or None}, calcular)
@@ -1,12 +1,17 @@
 import pretty_midi
 import numpy as np
-from music21 import converter, note, chord, stream
+from music21 import stream
+from backend.services.cache_partituras import cargar_partitura
+from backend.services.tabla_notas import tabla_notas
+from backend.services.acordes import acordes
+from backend.services.indice_compases import indice_compases, actividad_midi_por_compas
+from backend.services.ngramas import repetitividad_partes, repetitividad_por_compas
 
 def carga_score(midi_path):
-    return converter.parse(midi_path)
+    return cargar_partitura(midi_path)[0]
 
 def carga_midi(midi_path):
-    return pretty_midi.PrettyMIDI(midi_path)
+    return cargar_partitura(midi_path)[1]
 
 def compases(score):
     if not score.parts:
@@ -14,17 +19,8 @@ def compases(score):
     return list(score.parts[0].getElementsByClass(stream.Measure))
 
 def notas_por_compas(score, instrumentos_seleccionados=None):
-    resultados_por_compas = []
-    for i, m in enumerate(compases(score)):
-        notas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                notas.extend([n for n in compas_parte.notes if isinstance(n, note.Note)])
-        resultados_por_compas.append({f"compas #{i+1}": len(notas)})
-    return resultados_por_compas
+    conteos = indice_compases(score).conteos(instrumentos_seleccionados)
+    return [{f"compas #{i+1}": int(c)} for i, c in enumerate(conteos)]
 
 def promedio_notas_por_compas(score, instrumentos_seleccionados=None):
     cantidades_raw = [list(d.values())[0] for d in notas_por_compas(score, instrumentos_seleccionados)]
@@ -32,14 +28,9 @@ def promedio_notas_por_compas(score, instrumentos_seleccionados=None):
 
 def varianza_notas_por_compas(score, instrumentos_seleccionados=None):
     resultados_por_compas = []
-    for i, m in enumerate(compases(score)):
-        notas_midi_en_compas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                notas_midi_en_compas.extend([n.pitch.midi for n in compas_parte.notes if isinstance(n, note.Note)])
+    filas, inicios, fines = indice_compases(score).segmentos(instrumentos_seleccionados)
+    for i, (ini, fin) in enumerate(zip(inicios, fines)):
+        notas_midi_en_compas = filas["altura"][ini:fin]
         if len(notas_midi_en_compas) > 1:
             varianza = float(round(np.var(notas_midi_en_compas), 2))
         else:
@@ -49,15 +40,10 @@ def varianza_notas_por_compas(score, instrumentos_seleccionados=None):
 
 def entropia_duracion_por_compas(score, instrumentos_seleccionados=None):
     resultados_por_compas = []
-    for i, m in enumerate(compases(score)):
-        duraciones_en_compas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                duraciones_en_compas.extend([n.quarterLength for n in compas_parte.notes if isinstance(n, note.Note)])
-        if not duraciones_en_compas:
+    filas, inicios, fines = indice_compases(score).segmentos(instrumentos_seleccionados)
+    for i, (ini, fin) in enumerate(zip(inicios, fines)):
+        duraciones_en_compas = filas["duracion"][ini:fin]
+        if not duraciones_en_compas.size:
             entropia = 0.0
         else:
             hist, _ = np.histogram(duraciones_en_compas, bins=8)
@@ -71,83 +57,37 @@ def entropia_duracion_por_compas(score, instrumentos_seleccionados=None):
     return resultados_por_compas
 
 def compacidad_melodica(score, instrumentos_seleccionados=None):
-    alturas = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        alturas.extend([n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)])
-    if not alturas:
+    alturas = tabla_notas(score).seleccion(instrumentos_seleccionados)["altura"]
+    if not alturas.size:
         return 0.0
-    rango = max(alturas) - min(alturas) if alturas else 0
-    return float(round(len(set(alturas)) / (rango + 1), 3))
+    rango = int(alturas.max()) - int(alturas.min())
+    return float(round(np.unique(alturas).size / (rango + 1), 3))
 
 def compacidad_melodica_por_compas(score, instrumentos_seleccionados=None):
     resultados = []
-    for i, m in enumerate(compases(score)):
-        alturas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                alturas.extend([n.pitch.midi for n in compas_parte.notes if isinstance(n, note.Note)])
-        if not alturas:
+    filas, inicios, fines = indice_compases(score).segmentos(instrumentos_seleccionados)
+    for i, (ini, fin) in enumerate(zip(inicios, fines)):
+        alturas = filas["altura"][ini:fin]
+        if not alturas.size:
             valor = 0.0
         else:
-            rango = max(alturas) - min(alturas) if alturas else 0
-            valor = float(round(len(set(alturas)) / (rango + 1), 3))
+            rango = int(alturas.max()) - int(alturas.min())
+            valor = float(round(np.unique(alturas).size / (rango + 1), 3))
         resultados.append({f"compas #{i+1}": valor})
     return resultados
 
 def repetitividad_motívica(score, n=3, instrumentos_seleccionados=None):
-    motivos_conteo = {}
-    partes = score.parts
-    if instrumentos_seleccionados:
-        partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-
-    for p in partes:
-        notas = [n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)]
-        for i in range(len(notas) - n + 1):
-            motivo = tuple(notas[i:i+n])
-            motivos_conteo[motivo] = motivos_conteo.get(motivo, 0) + 1
-
-    total_motivos = sum(motivos_conteo.values())
-    if total_motivos == 0:
-        return 0.0
-    repetidos = sum(count for count in motivos_conteo.values() if count > 1)
-    return float(round(repetidos / total_motivos, 3))
+    return repetitividad_partes(tabla_notas(score).seleccion(instrumentos_seleccionados), n)
 
 def repetitividad_motívica_por_compas(score, n=3, instrumentos_seleccionados=None):
-    resultados = []
-    for i, m in enumerate(compases(score)):
-        motivos_conteo = {}
-        partes = score.parts
-        if instrumentos_seleccionados:
-            partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-        for p in partes:
-            compas_parte = p.measure(m.number)
-            if not compas_parte:
-                continue
-            notas = [n.pitch.midi for n in compas_parte.notes if isinstance(n, note.Note)]
-            for j in range(len(notas) - n + 1):
-                motivo = tuple(notas[j:j+n])
-                motivos_conteo[motivo] = motivos_conteo.get(motivo, 0) + 1
-        total_motivos = sum(motivos_conteo.values())
-        if total_motivos == 0:
-            valor = 0.0
-        else:
-            repetidos = sum(count for count in motivos_conteo.values() if count > 1)
-            valor = float(round(repetidos / total_motivos, 3))
-        resultados.append({f"compas #{i+1}": valor})
-    return resultados
+    indice = indice_compases(score)
+    filas, _, _ = indice.segmentos(instrumentos_seleccionados)
+    valores = repetitividad_por_compas(filas, indice.numeros, n)
+    return [{f"compas #{i+1}": valor} for i, valor in enumerate(valores)]
 
 def entropia_melodica(score, instrumentos_seleccionados=None):
-    alturas = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        alturas.extend([n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)])
-    if not alturas:
+    alturas = tabla_notas(score).seleccion(instrumentos_seleccionados)["altura"]
+    if not alturas.size:
         return 0.0
     hist = np.histogram(alturas, bins=24)[0]
     prob = hist / np.sum(hist)
@@ -156,12 +96,8 @@ def entropia_melodica(score, instrumentos_seleccionados=None):
     return float(round(entropia, 3))
 
 def entropia_ritmica(score, instrumentos_seleccionados=None):
-    duraciones = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        duraciones.extend([n.quarterLength for n in p.flat.notes if isinstance(n, note.Note)])
-    if not duraciones:
+    duraciones = tabla_notas(score).seleccion(instrumentos_seleccionados)["duracion"]
+    if not duraciones.size:
         return 0.0
     hist = np.histogram(duraciones, bins=16)[0]
     prob = hist / np.sum(hist)
@@ -170,16 +106,8 @@ def entropia_ritmica(score, instrumentos_seleccionados=None):
     return float(round(entropia, 3))
 
 def entropia_armonica(score, instrumentos_seleccionados=None):
-    partes = score.parts
-    if instrumentos_seleccionados:
-        partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-    if not partes:
-        return 0.0
-    score_chord = stream.Score()
-    for p in partes:
-        score_chord.append(p)
-    acordes = score_chord.chordify().recurse().getElementsByClass(chord.Chord)
-    nombres_acordes = [c.pitchedCommonName for c in acordes if c.pitchedCommonName]
+    secuencia = acordes(score, instrumentos_seleccionados)
+    nombres_acordes = secuencia.nombres_validos()
     if not nombres_acordes:
         return 0.0
     letras = [ord(a[0]) for a in nombres_acordes if a]
@@ -190,45 +118,28 @@ def entropia_armonica(score, instrumentos_seleccionados=None):
     return float(round(entropia, 3))
 
 def densidad_armonica(score):
-    compases_list = compases(score) # Renombrado para evitar conflicto con la función compases
-    if not compases_list:
+    compases_list = indice_compases(score) # Renombrado para evitar conflicto con la función compases
+    if not len(compases_list):
         return 0.0
-    score_chord = score.chordify()
-    acordes = score_chord.recurse().getElementsByClass(chord.Chord)
-    total_acordes = len(acordes)
+    total_acordes = len(acordes(score))
     densidad = total_acordes / len(compases_list)
     return float(round(densidad, 3))
 
 def densidad_armonica_por_compas(score, instrumentos_seleccionados=None):
     resultados = []
-    compases_lista = compases(score)
-    for i, m in enumerate(compases_lista):
-        score_chord = stream.Score()
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                score_chord.append(compas_parte)
-        acordes = score_chord.chordify().recurse().getElementsByClass(chord.Chord)
-        densidad = len(acordes)
+    indice = indice_compases(score)
+    acordes_por_compas = acordes(score, instrumentos_seleccionados).por_compas(indice.numeros)
+    for i, acordes_compas in enumerate(acordes_por_compas):
+        densidad = len(acordes_compas)
         resultados.append({f"compas #{i+1}": densidad})
     return resultados
 
 def entropia_armonica_por_compas(score, instrumentos_seleccionados=None):
     resultados = []
-    compases_lista = compases(score)
-    for i, m in enumerate(compases_lista):
-        partes = score.parts
-        if instrumentos_seleccionados:
-            partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-        score_chord = stream.Score()
-        for p in partes:
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                score_chord.append(compas_parte)
-        acordes = score_chord.chordify().recurse().getElementsByClass(chord.Chord)
-        nombres_acordes = [c.pitchedCommonName for c in acordes if c.pitchedCommonName]
+    indice = indice_compases(score)
+    acordes_por_compas = acordes(score, instrumentos_seleccionados).por_compas(indice.numeros)
+    for i, acordes_compas in enumerate(acordes_por_compas):
+        nombres_acordes = [a for a in acordes_compas if a]
         if not nombres_acordes:
             entropia = 0.0
         else:
@@ -254,49 +165,34 @@ def sincronizacion_entrada(midi, instrumentos_seleccionados=None):
 
 def sincronizacion_entrada_por_compas(score, midi, instrumentos_seleccionados=None):
     resultados = []
-    compases_lista = compases(score)
-    for i, m in enumerate(compases_lista):
-        tiempos = []
-        for inst in midi.instruments:
-            nombre = inst.name.strip() or pretty_midi.program_to_instrument_name(inst.program)
-            if instrumentos_seleccionados and nombre not in instrumentos_seleccionados:
-                continue
-            notas_en_compas = [n for n in inst.notes if m.offset <= n.start < m.offset + m.duration.quarterLength]
-            if notas_en_compas:
-                tiempos.append(notas_en_compas[0].start)
-        if not tiempos:
-            valor = 0.0
-        else:
-            valor = float(round(np.std(tiempos), 3))
-        resultados.append({f"compas #{i+1}": valor})
+    entradas, _ = actividad_midi_por_compas(score, midi, instrumentos_seleccionados)
+    # Desviación estándar, por compás, del primer ataque de cada instrumento que toca
+    tocan = ~np.isnan(entradas)
+    cantidad = tocan.sum(axis=0)
+    media = np.nansum(entradas, axis=0) / np.maximum(cantidad, 1)
+    desviacion = np.sqrt(np.nansum((entradas - media) ** 2, axis=0) / np.maximum(cantidad, 1))
+    for i, valor in enumerate(desviacion):
+        resultados.append({f"compas #{i+1}": float(round(valor, 3)) if cantidad[i] else 0.0})
     return resultados
 
 def dispersion_temporal(score, instrumentos_seleccionados=None):
-    tiempos = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        tiempos.extend([n.offset for n in p.flat.notes if isinstance(n, note.Note)])
-    if not tiempos:
+    tiempos = tabla_notas(score).seleccion(instrumentos_seleccionados)["onset"]
+    if not tiempos.size:
         return 0.0
     return float(round(np.std(tiempos), 3))
 
 def dispersion_temporal_por_compas(score, instrumentos_seleccionados=None):
     resultados = []
-    compases_lista = compases(score)
-    for m in compases_lista:
-        tiempos = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                tiempos.extend([n.offset for n in compas_parte.notes if isinstance(n, note.Note)])
-        if not tiempos:
+    indice = indice_compases(score)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados)
+    for i, (ini, fin) in enumerate(zip(inicios, fines)):
+        # Offsets relativos al compás, como `n.offset` dentro de `compas_parte.notes`
+        offsets = filas["onset_compas"][ini:fin]
+        if not offsets.size:
             valor = 0.0
         else:
-            valor = float(round(np.std(tiempos), 3))
-        resultados.append({f"compas #{m.number}": valor})
+            valor = float(round(np.std(offsets), 3))
+        resultados.append({f"compas #{indice.numeros[i]}": valor})
     return resultados
 
 def promedio_rango_dinamico(midi, total_compases, instrumentos_seleccionados=None):
@@ -317,59 +213,58 @@ def promedio_rango_dinamico(midi, total_compases, instrumentos_seleccionados=Non
 
 def promedio_rango_dinamico_por_compas(midi, score, instrumentos_seleccionados=None):
     resultados = []
-    compases_lista = compases(score)
-    for m in compases_lista:
-        rangos = []
-        for inst in midi.instruments:
-            nombre = inst.name.strip() or pretty_midi.program_to_instrument_name(inst.program)
-            if instrumentos_seleccionados and nombre not in instrumentos_seleccionados:
-                continue
-            notas_en_compas = [n for n in inst.notes if m.offset <= n.start < m.offset + m.duration.quarterLength]
-            if notas_en_compas:
-                velocities = [n.velocity for n in notas_en_compas]
-                rango = max(velocities) - min(velocities)
-                rangos.append(rango)
-        if not rangos:
-            valor = 0.0
-        else:
-            valor = float(round(np.mean(rangos), 3))
-        resultados.append({f"compas #{m.number}": valor})
+    indice = indice_compases(score)
+    _, rangos = actividad_midi_por_compas(score, midi, instrumentos_seleccionados)
+    cantidad = (~np.isnan(rangos)).sum(axis=0)
+    promedio = np.nansum(rangos, axis=0) / np.maximum(cantidad, 1)
+    for numero, valor, n in zip(indice.numeros, promedio, cantidad):
+        resultados.append({f"compas #{numero}": float(round(valor, 3)) if n else 0.0})
     return resultados
 
 def variabilidad_intervalica(score, instrumentos_seleccionados=None):
-    intervalos = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        notas = [n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)]
-        intervalos.extend([abs(notas[i+1] - notas[i]) for i in range(len(notas)-1)])
-    if not intervalos:
+    filas = tabla_notas(score).seleccion(instrumentos_seleccionados)
+    # Intervalos entre notas consecutivas de una misma parte
+    misma_parte = filas["parte"][1:] == filas["parte"][:-1]
+    intervalos = np.abs(np.diff(filas["altura"].astype(np.int64)))[misma_parte]
+    if not intervalos.size:
         return 0.0
     return float(round(np.std(intervalos), 3))
 
 def variabilidad_intervalica_por_compas(score, instrumentos_seleccionados=None):
     resultados = []
-    compases_lista = compases(score)
-    for m in compases_lista:
-        intervalos = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                notas = [n.pitch.midi for n in compas_parte.notes if isinstance(n, note.Note)]
-                intervalos.extend([abs(notas[i+1] - notas[i]) for i in range(len(notas)-1)])
-        if not intervalos:
+    indice = indice_compases(score)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados)
+    for i, (ini, fin) in enumerate(zip(inicios, fines)):
+        tramo = filas[ini:fin]
+        # Intervalos entre notas consecutivas de una misma parte dentro del compás
+        misma_parte = tramo["parte"][1:] == tramo["parte"][:-1]
+        intervalos = np.abs(np.diff(tramo["altura"].astype(np.int64)))[misma_parte]
+        if not intervalos.size:
             valor = 0.0
         else:
             valor = float(round(np.std(intervalos), 3))
-        resultados.append({f"compas #{m.number}": valor})
+        resultados.append({f"compas #{indice.numeros[i]}": valor})
     return resultados
 
+def perfil_entropias_compases(score, instrumentos_seleccionados=None):
+    """
+    Perfil memoizado de las entropías de `analizar_compases`, que conservan su
+    propia fórmula (log2 p sin el 1e-9 de `parser`).
+    """
+    from backend.services.parser import memoizar_perfil
+
+    clave = ("compases", tuple(instrumentos_seleccionados) if instrumentos_seleccionados else None)
+    return memoizar_perfil(score, clave, lambda: {
+        "entropia_melodica": entropia_melodica(score, instrumentos_seleccionados),
+        "entropia_ritmica": entropia_ritmica(score, instrumentos_seleccionados),
+        "entropia_armonica": entropia_armonica(score, instrumentos_seleccionados)
+    })
+
 def analizar_compases(midi_path, instrumentos_seleccionados=None):
     score = carga_score(midi_path)
     midi = carga_midi(midi_path)
     total_compases = len(compases(score))
+    perfil = perfil_entropias_compases(score, instrumentos_seleccionados)
 
     return {
         "promedio_notas_por_compas": promedio_notas_por_compas(score, instrumentos_seleccionados),
@@ -382,10 +277,10 @@ def analizar_compases(midi_path, instrumentos_seleccionados=None):
         "dispersion_temporal": dispersion_temporal(score, instrumentos_seleccionados),
         "compacidad_melodica": compacidad_melodica(score, instrumentos_seleccionados),
         "repetitividad_motívica": repetitividad_motívica(score, n=3, instrumentos_seleccionados=instrumentos_seleccionados),
-        "entropia_melodica": entropia_melodica(score, instrumentos_seleccionados),
-        "entropia_ritmica": entropia_ritmica(score, instrumentos_seleccionados),
-        "entropia_armonica": entropia_armonica(score, instrumentos_seleccionados),
-        "entropia_compuesta": float(round(np.mean([entropia_melodica(score, instrumentos_seleccionados), entropia_ritmica(score, instrumentos_seleccionados), entropia_armonica(score, instrumentos_seleccionados)]), 3)),
+        "entropia_melodica": perfil["entropia_melodica"],
+        "entropia_ritmica": perfil["entropia_ritmica"],
+        "entropia_armonica": perfil["entropia_armonica"],
+        "entropia_compuesta": float(round(np.mean([perfil["entropia_melodica"], perfil["entropia_ritmica"], perfil["entropia_armonica"]]), 3)),
         "cantidad_notas_por_compas": notas_por_compas(score, instrumentos_seleccionados),
         "compacidad_melodica_por_compas": compacidad_melodica_por_compas(score, instrumentos_seleccionados),
         "repetitividad_motívica_por_compas": repetitividad_motívica_por_compas(score, n=3, instrumentos_seleccionados=instrumentos_seleccionados),
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+from urllib.parse import parse_qsl
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+
+from backend.services.cache_partituras import hash_archivo_en_disco
+from backend.services.cache_resultados import VERSION_CODIGO
+from backend.services.almacen_subidas import DIRECTORIO_SUBIDAS
+
+# Rutas cuyas respuestas dependen solo del contenido de los archivos y de la petición
+PREFIJOS_CONDICIONALES = ("/metrics", "/compases", "/mixtas", "/metricas", "/instrumentos")
+
+# Parámetros que nombran archivos de `uploads/`
+PARAMETROS_ARCHIVO = ("archivo", "archivos")
+
+# Las respuestas más pequeñas no compensan comprimirse
+MINIMO_COMPRIMIR = 1024
+
+SUFIJO_GZIP = "-gz"
+
+
+# VERSION_CODIGO ya cubre servicios, endpoints y esquemas
+VERSION_API = VERSION_CODIGO
+
+
+def _es_flujo(ruta):
+    return ruta.rstrip("/").endswith("/stream")
+
+
+def etiqueta_peticion(ruta, query_string):
+    """
+    ETag fuerte de una petición: hash del contenido de los archivos que nombra,
+    de la ruta, de sus parámetros y de la versión del código. None si algún
+    archivo no existe (la respuesta será un error).
+    """
+    parametros = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    hashes = []
+    for clave, valor in parametros:
+        if clave not in PARAMETROS_ARCHIVO:
+            continue
+        archivo = os.path.join(DIRECTORIO_SUBIDAS, os.path.basename(valor))
+        if not os.path.isfile(archivo):
+            return None
+        hashes.append(hash_archivo_en_disco(archivo))
+    if not hashes:
+        return None
+    # Orden estable por nombre: los valores repetidos (archivos=...) conservan
+    # su orden, que sí cambia la respuesta
+    parametros = sorted(parametros, key=lambda par: par[0])
+    clave = json.dumps([VERSION_API, ruta.rstrip("/"), parametros, hashes])
+    return hashlib.sha256(clave.encode()).hexdigest()[:32]
+
+
+def _etiqueta_http(etiqueta, comprimida=False):
+    return f'"{etiqueta}{SUFIJO_GZIP if comprimida else ""}"'
+
+
+def _coincidente(if_none_match, etiqueta):
+    """
+    Etiqueta de If-None-Match que corresponde a `etiqueta` (con o sin
+    compresión), o None.
+    """
+    if not if_none_match:
+        return None
+    candidatas = {_etiqueta_http(etiqueta), _etiqueta_http(etiqueta, True)}
+    for valor in if_none_match.split(","):
+        valor = valor.strip()
+        if valor == "*":
+            return _etiqueta_http(etiqueta)
+        if valor.startswith("W/"):
+            valor = valor[2:]
+        if valor in candidatas:
+            return valor
+    return None
+
+
+def sin_etiqueta(respuesta):
+    """
+    Marca una respuesta 200 que contiene errores (que pueden ser transitorios)
+    para que no lleve ETag ni se reutilice con un 304.
+    """
+    respuesta.headers["Cache-Control"] = "no-store"
+    return respuesta
+
+
+class EtiquetasMiddleware:
+    """
+    GET condicional para las métricas: añade un ETag a las respuestas 200 y
+    contesta 304 a un If-None-Match que coincide sin llegar a calcular nada.
+    La representación comprimida lleva su propia etiqueta. Las respuestas
+    marcadas con `sin_etiqueta` no se etiquetan.
+    """
+
+    def __init__(self, app, prefijos=PREFIJOS_CONDICIONALES):
+        self.app = app
+        self.prefijos = prefijos
+
+    def _aplica(self, scope):
+        ruta = scope["path"]
+        return (
+            scope["method"] in ("GET", "HEAD")
+            and ruta.startswith(self.prefijos)
+            and not _es_flujo(ruta)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._aplica(scope):
+            await self.app(scope, receive, send)
+            return
+
+        etiqueta = await run_in_threadpool(etiqueta_peticion, scope["path"], scope["query_string"])
+        if etiqueta is None:
+            await self.app(scope, receive, send)
+            return
+
+        coincidente = _coincidente(Headers(scope=scope).get("if-none-match"), etiqueta)
+        if coincidente is not None:
+            respuesta = Response(status_code=304, headers={
+                "ETag": coincidente,
+                "Cache-Control": "no-cache",
+                "Vary": "Accept-Encoding"
+            })
+            await respuesta(scope, receive, send)
+            return
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start" and mensaje["status"] == 200:
+                cabeceras = MutableHeaders(scope=mensaje)
+                if "no-store" in cabeceras.get("cache-control", ""):
+                    await send(mensaje)
+                    return
+                comprimida = cabeceras.get("content-encoding") == "gzip"
+                cabeceras["ETag"] = _etiqueta_http(etiqueta, comprimida)
+                cabeceras["Cache-Control"] = "no-cache"
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
+
+
+class CompresionMiddleware:
+    """
+    Gzip para las respuestas grandes, salvo las que se envían en flujo (NDJSON
+    o SSE), que deben salir registro a registro.
+    """
+
+    def __init__(self, app, minimo=MINIMO_COMPRIMIR):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimo, compresslevel=6)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not _es_flujo(scope["path"]):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
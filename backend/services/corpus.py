@@ -0,0 +1,309 @@
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from backend.services.cache_partituras import hash_archivo_en_disco
+from backend.services.cache_resultados import VERSION_CODIGO
+from backend.services.formato_columnas import codificar
+from backend.services.indice_similitud import indice_similitud, indexar_analisis
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXTENSIONES_MIDI = (".mid", ".midi")
+
+ANALISIS_CORPUS = ("midi", "mixtas", "compases")
+
+# Tras este número de archivos cada proceso se reinicia y libera la memoria que
+# music21 no devuelve
+ARCHIVOS_POR_PROCESO = 50
+
+
+def descubrir_archivos(entradas):
+    """
+    Rutas absolutas y sin repetir de los MIDI nombrados por `entradas`
+    (archivos, directorios, que se recorren recursivamente, o patrones glob).
+    """
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for raiz, _, nombres in os.walk(entrada):
+                rutas.extend(
+                    os.path.join(raiz, nombre) for nombre in sorted(nombres)
+                    if nombre.lower().endswith(EXTENSIONES_MIDI)
+                )
+        elif os.path.isfile(entrada):
+            rutas.append(entrada)
+        else:
+            rutas.extend(
+                ruta for ruta in sorted(glob.glob(entrada, recursive=True))
+                if os.path.isfile(ruta) and ruta.lower().endswith(EXTENSIONES_MIDI)
+            )
+    return list(dict.fromkeys(os.path.abspath(ruta) for ruta in rutas))
+
+
+def _analizar(analisis, ruta, instrumentos):
+    if analisis == "midi":
+        from backend.services.parser import analizar_midi
+        # Con una ruta absoluta, `analizar_midi` no la busca en uploads/
+        resultado = analizar_midi(ruta, instrumentos)
+        if "error" in resultado:
+            raise RuntimeError(resultado["error"])
+        return resultado
+    if analisis == "mixtas":
+        from backend.services.mixtas_parser import analizar_mixtas
+        return analizar_mixtas(ruta, instrumentos)
+    if analisis == "compases":
+        from backend.services.compas_parser import analizar_compases
+        return analizar_compases(ruta, instrumentos)
+    raise ValueError(f"Análisis desconocido: {analisis}")
+
+
+def analizar_archivo(ruta, hash_contenido, analisis, instrumentos=None):
+    """
+    Ejecuta los análisis pedidos sobre un archivo y devuelve su registro, con
+    el tiempo de cada análisis. Un error en uno no impide los demás.
+    """
+    registro = {
+        "archivo": ruta,
+        "hash": hash_contenido,
+        "version": VERSION_CODIGO,
+        "instrumentos": instrumentos or [],
+        "resultados": {},
+        "errores": {},
+        "tiempos": {}
+    }
+    for nombre in analisis:
+        inicio = time.perf_counter()
+        try:
+            registro["resultados"][nombre] = _analizar(nombre, ruta, instrumentos or [])
+        except Exception as e:
+            registro["errores"][nombre] = f"{type(e).__name__}: {e}"
+        registro["tiempos"][nombre] = round(time.perf_counter() - inicio, 4)
+    registro["segundos"] = round(sum(registro["tiempos"].values()), 4)
+    return registro
+
+
+def ruta_progreso(salida):
+    """
+    Archivo JSONL donde se van anotando los registros: la propia salida si es
+    JSONL; junto a ella si es Parquet, que no admite añadir filas.
+    """
+    return salida if not es_parquet(salida) else salida + ".progreso.jsonl"
+
+
+def es_parquet(salida):
+    return salida.lower().endswith(".parquet")
+
+
+def leer_registros(ruta):
+    """
+    Registros ya escritos, el último por archivo. Una línea cortada por una
+    interrupción se ignora.
+    """
+    registros = {}
+    if not os.path.exists(ruta):
+        return registros
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue
+            registros[registro["archivo"]] = registro
+    return registros
+
+
+def _vigente(registro, hash_contenido, analisis, instrumentos, reintentar_errores):
+    # Un registro sirve si el archivo, el código y los parámetros no han cambiado
+    return (
+        registro["hash"] == hash_contenido
+        and registro["version"] == VERSION_CODIGO
+        and registro["instrumentos"] == (instrumentos or [])
+        and all(a in registro["resultados"] or a in registro["errores"] for a in analisis)
+        and not (reintentar_errores and registro["errores"])
+    )
+
+
+def _linea(registro):
+    return codificar(registro) + b"\n"
+
+
+def compactar(ruta, registros):
+    """
+    Reescribe el JSONL con un registro por archivo, sin los que quedaron
+    sustituidos al reanudar.
+    """
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as f:
+        for registro in registros.values():
+            f.write(_linea(registro))
+    os.replace(temporal, ruta)
+
+
+def escribir_parquet(salida, registros):
+    """
+    Una fila por archivo; resultados y errores van como JSON, ya que cada
+    análisis tiene su propia estructura anidada.
+    """
+    filas = [{
+        "archivo": r["archivo"],
+        "hash": r["hash"],
+        "version": r["version"],
+        "instrumentos": r["instrumentos"],
+        "segundos": r["segundos"],
+        **{f"tiempo_{a}": r["tiempos"].get(a) for a in ANALISIS_CORPUS},
+        **{f"resultado_{a}": (
+            codificar(r["resultados"][a]).decode("utf-8") if a in r["resultados"] else None
+        ) for a in ANALISIS_CORPUS},
+        "errores": json.dumps(r["errores"], ensure_ascii=False) if r["errores"] else None
+    } for r in registros.values()]
+    pyarrow.parquet.write_table(pyarrow.Table.from_pylist(filas), salida)
+
+
+def resumen_tiempos(registros, mas_lentos=10):
+    """
+    Estadísticas de los tiempos por archivo y los archivos más lentos.
+    """
+    if not registros:
+        return {"archivos": 0}
+    segundos = np.array([r["segundos"] for r in registros], dtype=float)
+    orden = np.argsort(segundos)[::-1][:mas_lentos]
+    return {
+        "archivos": len(registros),
+        "con_errores": sum(1 for r in registros if r["errores"]),
+        "total": float(round(segundos.sum(), 3)),
+        "media": float(round(segundos.mean(), 3)),
+        "mediana": float(round(np.median(segundos), 3)),
+        "p95": float(round(np.percentile(segundos, 95), 3)),
+        "maximo": float(round(segundos.max(), 3)),
+        "por_analisis": {
+            a: float(round(sum(r["tiempos"].get(a, 0.0) for r in registros), 3))
+            for a in ANALISIS_CORPUS if any(a in r["tiempos"] for r in registros)
+        },
+        "mas_lentos": [(registros[i]["archivo"], registros[i]["segundos"]) for i in orden]
+    }
+
+
+def analizar_corpus(entradas, salida, analisis=ANALISIS_CORPUS, instrumentos=None,
+                    procesos=None, reintentar_errores=False, progreso=None):
+    """
+    Analiza todos los MIDI de `entradas` en un pool de procesos y va añadiendo
+    cada registro a la salida en cuanto termina, de modo que una ejecución
+    interrumpida se reanuda saltando los archivos ya analizados (mismo
+    contenido, código y parámetros). Con salida .parquet la tabla se escribe
+    al final desde el JSONL de progreso.
+
+    `progreso(hechos, total, registro)` se llama tras cada archivo. Devuelve
+    (registros de esta ejecución, número de archivos reanudados, segundos).
+    """
+    if es_parquet(salida) and pyarrow is None:
+        raise RuntimeError("La salida Parquet necesita el paquete pyarrow")
+    analisis = [a for a in ANALISIS_CORPUS if a in analisis]
+    inicio = time.perf_counter()
+
+    rutas = descubrir_archivos(entradas)
+    progreso_jsonl = ruta_progreso(salida)
+    previos = leer_registros(progreso_jsonl)
+    pendientes, reanudados = [], 0
+    for ruta in rutas:
+        hash_contenido = hash_archivo_en_disco(ruta)
+        previo = previos.get(ruta)
+        if previo and _vigente(previo, hash_contenido, analisis, instrumentos, reintentar_errores):
+            reanudados += 1
+            _indexar(previo)
+        else:
+            pendientes.append((ruta, hash_contenido))
+
+    nuevos = []
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(progreso_jsonl, "ab") as f:
+        def anotar(registro):
+            f.write(_linea(registro))
+            f.flush()
+            _indexar(registro)
+            previos[registro["archivo"]] = registro
+            nuevos.append(registro)
+            if progreso:
+                progreso(reanudados + len(nuevos), len(rutas), registro)
+
+        if procesos == 1 or len(pendientes) < 2:
+            for ruta, hash_contenido in pendientes:
+                anotar(analizar_archivo(ruta, hash_contenido, analisis, instrumentos))
+        else:
+            # "spawn", como el pool del servidor; cada proceso se recicla para
+            # que la memoria no crezca a lo largo de miles de archivos
+            with ProcessPoolExecutor(
+                max_workers=procesos or os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=ARCHIVOS_POR_PROCESO
+            ) as pool:
+                futuros = {
+                    pool.submit(analizar_archivo, ruta, hash_contenido, analisis, instrumentos):
+                        (ruta, hash_contenido)
+                    for ruta, hash_contenido in pendientes
+                }
+                try:
+                    for futuro in as_completed(futuros):
+                        try:
+                            anotar(futuro.result())
+                        except BrokenProcessPool as e:
+                            # Un proceso murió (p. ej. por memoria): no se sabe con qué
+                            # archivo, así que se anota en todos los que quedaban
+                            ruta, hash_contenido = futuros[futuro]
+                            anotar(_registro_fallido(ruta, hash_contenido, analisis, instrumentos, e))
+                except BaseException:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+    with open(progreso_jsonl, "rb") as f:
+        lineas = sum(1 for _ in f)
+    if lineas != len(previos):
+        compactar(progreso_jsonl, previos)
+    if es_parquet(salida):
+        escribir_parquet(salida, {r: previos[r] for r in rutas if r in previos})
+    return nuevos, reanudados, time.perf_counter() - inicio
+
+
+def nombre_en_indice(ruta):
+    """
+    Nombre con el que un archivo del corpus entra en el índice de similitud:
+    su ruta relativa al directorio de trabajo, o su directorio y su nombre si
+    está fuera. `/similares` lo muestra junto a los de uploads/, así que nunca
+    es la ruta absoluta, y siempre lleva un directorio para no coincidir con
+    el nombre de una subida.
+    """
+    relativa = os.path.relpath(ruta)
+    if relativa.startswith(os.pardir + os.sep) or os.sep not in relativa:
+        relativa = os.path.join(os.path.basename(os.path.dirname(ruta)), os.path.basename(ruta))
+    return relativa.replace(os.sep, "/")
+
+
+def _indexar(registro):
+    # Solo el análisis global de la obra completa entra en el índice de similitud
+    if "midi" in registro["resultados"] and not registro["instrumentos"]:
+        nombre = nombre_en_indice(registro["archivo"])
+        if indice_similitud.nombres.get(nombre) != registro["hash"]:
+            indexar_analisis(registro["hash"], nombre, registro["resultados"]["midi"])
+
+
+def _registro_fallido(ruta, hash_contenido, analisis, instrumentos, error):
+    return {
+        "archivo": ruta,
+        "hash": hash_contenido,
+        "version": VERSION_CODIGO,
+        "instrumentos": instrumentos or [],
+        "resultados": {},
+        "errores": {a: f"{type(error).__name__}: {error}" for a in analisis},
+        "tiempos": {},
+        "segundos": 0.0
+    }
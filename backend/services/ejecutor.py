@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.config import ANALISIS_CONCURRENTES
+
+# Hilos dedicados al análisis: el bucle de eventos de uvicorn queda libre para
+# atender subidas y consultas ligeras mientras se calculan las métricas
+CONCURRENCIA = max(1, ANALISIS_CONCURRENTES)
+_ejecutor = ThreadPoolExecutor(
+    max_workers=CONCURRENCIA,
+    thread_name_prefix="analisis"
+)
+
+_lock = threading.Lock()
+_estado = {
+    "en_cola": 0,
+    "en_curso": 0,
+    "completados": 0,
+    "fallidos": 0,
+    "espera_total": 0.0,
+    "espera_maxima": 0.0,
+    "ejecucion_total": 0.0,
+}
+
+
+def _medir(funcion, encolado):
+    inicio = time.perf_counter()
+    espera = inicio - encolado
+    with _lock:
+        _estado["en_cola"] -= 1
+        _estado["en_curso"] += 1
+        _estado["espera_total"] += espera
+        _estado["espera_maxima"] = max(_estado["espera_maxima"], espera)
+    fallo = False
+    try:
+        return funcion()
+    except BaseException:
+        fallo = True
+        raise
+    finally:
+        with _lock:
+            _estado["en_curso"] -= 1
+            _estado["completados" if not fallo else "fallidos"] += 1
+            _estado["ejecucion_total"] += time.perf_counter() - inicio
+
+
+def enviar_a_ejecutor(funcion, *args, **kwargs):
+    """
+    Encola `funcion(*args, **kwargs)` en el ejecutor de análisis y devuelve el
+    `Future` correspondiente.
+    """
+    with _lock:
+        _estado["en_cola"] += 1
+    tarea = functools.partial(_medir, functools.partial(funcion, *args, **kwargs), time.perf_counter())
+    return _ejecutor.submit(tarea)
+
+
+async def en_ejecutor(funcion, *args, **kwargs):
+    """
+    Ejecuta `funcion(*args, **kwargs)` en el ejecutor de análisis y espera su
+    resultado sin bloquear el bucle de eventos.
+    """
+    return await asyncio.wrap_future(enviar_a_ejecutor(funcion, *args, **kwargs))
+
+
+def estadisticas_ejecutor():
+    with _lock:
+        estado = dict(_estado)
+    terminados = estado["completados"] + estado["fallidos"]
+    # La espera de los que están en curso ya está contabilizada
+    iniciados = terminados + estado["en_curso"]
+    return {
+        "concurrencia": CONCURRENCIA,
+        "en_cola": estado["en_cola"],
+        "en_curso": estado["en_curso"],
+        "completados": estado["completados"],
+        "fallidos": estado["fallidos"],
+        "espera_media_ms": round(1000 * estado["espera_total"] / iniciados, 3) if iniciados else 0.0,
+        "espera_maxima_ms": round(1000 * estado["espera_maxima"], 3),
+        "ejecucion_media_ms": round(1000 * estado["ejecucion_total"] / terminados, 3) if terminados else 0.0,
+    }
+
+
+def cerrar_ejecutor():
+    _ejecutor.shutdown(wait=False, cancel_futures=True)
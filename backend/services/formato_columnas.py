@@ -0,0 +1,119 @@
+import json
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CODIFICACIONES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+PREFIJO_COMPAS = "compas #"
+
+
+def serie_por_compas(valor):
+    """
+    Si `valor` es una lista de {"compas #n": número} devuelve (números de
+    compás, valores) como arrays; si no, None.
+    """
+    if not isinstance(valor, list) or not valor:
+        return None
+    numeros, valores = [], []
+    for elemento in valor:
+        if not isinstance(elemento, dict) or len(elemento) != 1:
+            return None
+        (clave, dato), = elemento.items()
+        if not isinstance(clave, str) or not clave.startswith(PREFIJO_COMPAS):
+            return None
+        if isinstance(dato, bool) or not isinstance(dato, (int, float, np.number)):
+            return None
+        numeros.append(int(clave[len(PREFIJO_COMPAS):]))
+        valores.append(dato)
+    return np.asarray(numeros, dtype=np.int64), np.asarray(valores)
+
+
+def a_columnas(metricas):
+    """
+    Sustituye cada lista por compás de `metricas` por una columna de valores.
+    Los números de compás comunes van una sola vez en `compases`; una serie
+    con otra numeración se deja como {"compases": [...], "valores": [...]}.
+    """
+    salida, por_compas, numeros = {}, {}, None
+    for clave, valor in metricas.items():
+        serie = serie_por_compas(valor)
+        if serie is None:
+            salida[clave] = valor
+            continue
+        if numeros is None:
+            numeros = serie[0]
+        if np.array_equal(numeros, serie[0]):
+            por_compas[clave] = serie[1]
+        else:
+            por_compas[clave] = {"compases": serie[0], "valores": serie[1]}
+    if por_compas:
+        salida["compases"] = numeros
+        salida["por_compas"] = por_compas
+    return salida
+
+
+def _a_nativo(valor):
+    # Para los codificadores que no entienden numpy
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, dict):
+        return {k: _a_nativo(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_a_nativo(v) for v in valor]
+    return valor
+
+
+def _por_defecto(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    return str(valor)
+
+
+def comprobar_codificacion(codificacion):
+    if codificacion not in CODIFICACIONES:
+        raise HTTPException(status_code=400, detail=f"Codificación inválida: {codificacion}")
+    if codificacion == "msgpack" and msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack no está disponible en el servidor (falta el paquete msgpack)")
+
+
+def codificar(contenido, codificacion="json"):
+    if codificacion == "msgpack":
+        return msgpack.packb(_a_nativo(contenido), use_bin_type=True, default=_por_defecto)
+    if orjson is not None:
+        return orjson.dumps(
+            contenido,
+            default=_por_defecto,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(contenido, ensure_ascii=False, default=_por_defecto).encode("utf-8")
+
+
+def respuesta_compacta(contenido, codificacion="json", status_code=200):
+    """
+    Respuesta ya serializada, sin pasar por los modelos de Pydantic ni por el
+    codificador de FastAPI: los arrays de numpy se escriben directamente.
+    """
+    return Response(
+        content=codificar(contenido, codificacion),
+        media_type=CODIFICACIONES[codificacion],
+        status_code=status_code
+    )
@@ -0,0 +1,267 @@
+import threading
+import weakref
+
+import numpy as np
+import pretty_midi
+from music21 import stream
+
+from backend.services.tabla_notas import tabla_notas, registrar_tabla, MapaTempo, NOTA
+
+# Margen (en segundos) para que una nota que cae justo en la barra de compás
+# no se asigne al compás anterior por errores de redondeo
+TOLERANCIA_SEGUNDOS = 1e-6
+
+
+class IndiceCompases:
+    """
+    Índice de compases de un score: número de compás -> rango de offsets ->
+    tramo contiguo de la tabla de notas de cada parte.
+
+    La rejilla de compases es la de la primera parte (como en `compases(score)`)
+    y, al igual que `compas_parte.notes`, los tramos solo incluyen los elementos
+    que cuelgan directamente del compás (no los que están dentro de una Voice).
+    """
+
+    def __init__(self, score, rejilla=None, rejillas_partes=None):
+        self.tabla = tabla_notas(score)
+        # Referencia débil: el índice vive en una caché indexada por el score
+        self._score = weakref.ref(score)
+        self._segmentos = {}
+        self._lock = threading.Lock()
+        # Rejilla de cada parte; si no se conoce se lee de sus compases de music21
+        self._rejillas_partes = dict(enumerate(rejillas_partes)) if rejillas_partes is not None else {}
+        if rejilla is None:
+            partes = list(score.parts)
+            rejilla = self.rejilla_parte(0) if partes else ([], [], [])
+        numeros, offsets, duraciones = rejilla
+        self.numeros = np.asarray(numeros, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.float64)
+        self.duraciones = np.asarray(duraciones, dtype=np.float64)
+
+        notas = self.tabla.notas
+        directas = notas[~notas["en_voz"]]
+        # Orden estable por (compás, parte): cada compás queda contiguo y, dentro
+        # de él, las notas de cada parte conservan su orden original
+        orden = np.lexsort((directas["parte"], directas["compas"]))
+        self._directas = directas[orden]
+
+    def __len__(self):
+        return len(self.numeros)
+
+    def segmentos(self, instrumentos_seleccionados=None, tipos=(NOTA,)):
+        """
+        Devuelve (filas, inicios, fines): las filas seleccionadas ordenadas por
+        compás y los límites del tramo de cada compás de la rejilla.
+        """
+        clave = (tuple(instrumentos_seleccionados) if instrumentos_seleccionados else None, tuple(tipos))
+        with self._lock:
+            resultado = self._segmentos.get(clave)
+        if resultado is not None:
+            return resultado
+
+        filas = self._directas[np.isin(self._directas["tipo"], tipos)]
+        if instrumentos_seleccionados:
+            filas = filas[np.isin(filas["parte"], self.tabla.indices_partes(instrumentos_seleccionados))]
+        inicios = np.searchsorted(filas["compas"], self.numeros, side="left")
+        fines = np.searchsorted(filas["compas"], self.numeros, side="right")
+        resultado = (filas, inicios, fines)
+        with self._lock:
+            self._segmentos[clave] = resultado
+        return resultado
+
+    def conteos(self, instrumentos_seleccionados=None, tipos=(NOTA,), ventana=None):
+        _, inicios, fines = self.segmentos(instrumentos_seleccionados, tipos)
+        ini, fin = self.rango(ventana)
+        return fines[ini:fin] - inicios[ini:fin]
+
+    def rango(self, ventana=None):
+        """
+        Posiciones [ini, fin) de la rejilla que cubre una ventana (desde, hasta)
+        de compases numerados desde 1, con ambos extremos incluidos.
+        """
+        if ventana is None:
+            return 0, len(self)
+        desde, hasta = ventana
+        ini = min(max((desde or 1) - 1, 0), len(self))
+        fin = len(self) if hasta is None else min(max(hasta, ini), len(self))
+        return ini, fin
+
+    def offsets_ventana(self, ventana=None):
+        """
+        Offsets (en negras) de la barra inicial y final de la ventana.
+        """
+        ini, fin = self.rango(ventana)
+        if ini >= fin:
+            return None
+        return float(self.offsets[ini]), float(self.offsets[fin - 1] + self.duraciones[fin - 1])
+
+    def rejilla_parte(self, indice_parte):
+        """
+        (números, offsets, duraciones) de los compases de una parte, que puede
+        tener más o menos compases que la primera.
+        """
+        with self._lock:
+            rejilla = self._rejillas_partes.get(indice_parte)
+        if rejilla is None:
+            medidas = list(list(self._score().parts)[indice_parte].getElementsByClass(stream.Measure))
+            rejilla = (
+                np.array([m.number for m in medidas], dtype=np.int64),
+                np.array([float(m.offset) for m in medidas], dtype=np.float64),
+                np.array([float(m.duration.quarterLength) for m in medidas], dtype=np.float64)
+            )
+            with self._lock:
+                rejilla = self._rejillas_partes.setdefault(indice_parte, rejilla)
+        return rejilla
+
+
+_indices = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def indice_compases(score):
+    """
+    Índice de compases del score, construido una sola vez por objeto score.
+    """
+    with _lock:
+        indice = _indices.get(score)
+    if indice is None:
+        indice = IndiceCompases(score)
+        with _lock:
+            indice = _indices.setdefault(score, indice)
+    return indice
+
+
+def ventana_compases(desde_compas=None, hasta_compas=None):
+    """
+    Ventana (desde, hasta) de compases pedida, o None si abarca toda la obra.
+    """
+    if desde_compas is None and hasta_compas is None:
+        return None
+    if desde_compas is not None and hasta_compas is not None and desde_compas > hasta_compas:
+        raise ValueError("desde_compas no puede ser mayor que hasta_compas")
+    return (desde_compas, hasta_compas)
+
+
+def registrar_rejilla(score, rejilla, rejillas_partes=None):
+    """
+    Crea el índice del score con una rejilla de compases (números, offsets,
+    duraciones) ya conocida, y opcionalmente la de cada parte, sin recorrer
+    sus compases de music21.
+    """
+    indice = IndiceCompases(score, rejilla, rejillas_partes)
+    with _lock:
+        _indices[score] = indice
+    return indice
+
+
+class PartituraParcial:
+    """
+    Vista de solo lectura de algunas partes de un score. Las partes no se
+    añaden a ningún stream nuevo: siguen perteneciendo al score compartido de
+    la caché, que no debe mutarse.
+    """
+
+    def __init__(self, score, indices_partes):
+        self.original = score
+        self.indices_partes = list(indices_partes)
+
+    @property
+    def parts(self):
+        partes = list(self.original.parts)
+        return [partes[i] for i in self.indices_partes]
+
+
+def subconjunto_partitura(score, indices_partes):
+    """
+    Vista de las partes `indices_partes` del score con su tabla de notas y su
+    índice de compases derivados de los del score completo.
+    """
+    vista = PartituraParcial(score, indices_partes)
+    registrar_tabla(vista, tabla_notas(score).subconjunto(vista.indices_partes))
+    indice = indice_compases(score)
+    rejillas = [indice.rejilla_parte(i) for i in vista.indices_partes]
+    registrar_rejilla(vista, rejillas[0] if rejillas else ([], [], []), rejillas)
+    return vista
+
+
+def tramos_por_parte(filas):
+    """
+    Divide las filas de un compás en tramos contiguos de una misma parte.
+    """
+    if filas.size == 0:
+        return []
+    cortes = np.flatnonzero(np.diff(filas["parte"])) + 1
+    return np.split(filas, cortes)
+
+
+_notas_midi = weakref.WeakKeyDictionary()
+
+
+def notas_midi_ordenadas(midi):
+    """
+    Lista (nombre, inicios, velocidades) por instrumento de PrettyMIDI, con las
+    notas ordenadas por inicio. Se calcula una sola vez por objeto midi.
+    """
+    with _lock:
+        notas = _notas_midi.get(midi)
+    if notas is None:
+        notas = []
+        for inst in midi.instruments:
+            nombre = inst.name.strip() or pretty_midi.program_to_instrument_name(inst.program)
+            inicios = np.array([n.start for n in inst.notes], dtype=np.float64)
+            velocidades = np.array([n.velocity for n in inst.notes], dtype=np.int64)
+            orden = np.argsort(inicios, kind="stable")
+            notas.append((nombre, inicios[orden], velocidades[orden]))
+        with _lock:
+            notas = _notas_midi.setdefault(midi, notas)
+    return notas
+
+
+def limites_compases_segundos(score, midi, ventana=None):
+    """
+    Inicio y fin de cada compás de la rejilla (o de la ventana) convertidos de
+    negras a segundos con el mapa de tempo del MIDI.
+    """
+    indice = indice_compases(score)
+    ini, fin = indice.rango(ventana)
+    offsets = indice.offsets[ini:fin]
+    mapa = MapaTempo.desde_midi(midi)
+    return mapa.a_segundos(offsets), mapa.a_segundos(offsets + indice.duraciones[ini:fin])
+
+
+def actividad_midi_por_compas(score, midi, instrumentos_seleccionados=None, ventana=None):
+    """
+    Matrices instrumentos x compases con el primer ataque (en segundos) y el
+    rango de velocidades de cada instrumento en cada compás. Vale NaN donde el
+    instrumento no tiene notas.
+    """
+    inicios_compas, fines_compas = limites_compases_segundos(score, midi, ventana)
+    inicios_compas = inicios_compas - TOLERANCIA_SEGUNDOS
+    fines_compas = fines_compas - TOLERANCIA_SEGUNDOS
+    entradas, rangos = [], []
+    for nombre, inicios, velocidades in notas_midi_ordenadas(midi):
+        if instrumentos_seleccionados and nombre not in instrumentos_seleccionados:
+            continue
+        ini = np.searchsorted(inicios, inicios_compas, side="left")
+        fin = np.searchsorted(inicios, fines_compas, side="left")
+        con_notas = fin > ini
+
+        entrada = np.full(len(ini), np.nan)
+        entrada[con_notas] = inicios[ini[con_notas]]
+        rango = np.full(len(ini), np.nan)
+        if con_notas.any():
+            # Tramos [ini, fin) intercalados: reduceat deja en las posiciones pares
+            # el máximo/mínimo de cada compás. El centinela permite fin == len.
+            cortes = np.column_stack((ini[con_notas], fin[con_notas])).ravel()
+            extendidas = np.append(velocidades, 0)
+            maximos = np.maximum.reduceat(extendidas, cortes)[::2]
+            minimos = np.minimum.reduceat(extendidas, cortes)[::2]
+            rango[con_notas] = maximos - minimos
+        entradas.append(entrada)
+        rangos.append(rango)
+
+    forma = (0, len(inicios_compas))
+    return (
+        np.array(entradas) if entradas else np.empty(forma),
+        np.array(rangos) if rangos else np.empty(forma)
+    )
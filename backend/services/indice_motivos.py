@@ -0,0 +1,296 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from backend.config import MOTIVOS_DB
+from backend.services.cache_partituras import cargar_eventos, hash_archivo_en_disco
+from backend.services.ejecutor import enviar_a_ejecutor
+from backend.services.ngramas import empaquetar_ngramas
+from backend.services.tabla_notas import tabla_notas
+
+# Tipos de n-grama del índice
+ALTURAS = 0
+INTERVALOS = 1
+
+# Notas por n-grama indexado (3 alturas, o los 2 intervalos entre 3 notas). Los
+# motivos más largos se buscan encadenando n-gramas por su posición en la parte
+LONGITUD_GRAMA = 3
+
+# Los intervalos se desplazan desde [-64, 63] a 0..127 para empaquetarlos como
+# las alturas
+DESPLAZAMIENTO_INTERVALO = 64
+
+_lock = threading.RLock()
+_inicializada = False
+
+
+def _inicializar(conexion):
+    global _inicializada
+    with _lock:
+        if _inicializada:
+            return
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS archivos (
+                id INTEGER PRIMARY KEY,
+                hash TEXT UNIQUE NOT NULL,
+                partes TEXT NOT NULL,
+                notas INTEGER NOT NULL,
+                indexado REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS nombres (
+                nombre TEXT PRIMARY KEY,
+                archivo INTEGER NOT NULL REFERENCES archivos(id)
+            );
+            CREATE INDEX IF NOT EXISTS nombres_archivo ON nombres(archivo);
+            CREATE TABLE IF NOT EXISTS motivos (
+                tipo INTEGER NOT NULL,
+                clave INTEGER NOT NULL,
+                archivo INTEGER NOT NULL,
+                parte INTEGER NOT NULL,
+                posicion INTEGER NOT NULL,
+                compas INTEGER NOT NULL,
+                PRIMARY KEY (tipo, clave, archivo, parte, posicion)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS frecuencias (
+                tipo INTEGER NOT NULL,
+                clave INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                PRIMARY KEY (tipo, clave)
+            ) WITHOUT ROWID;
+        """)
+        conexion.commit()
+        _inicializada = True
+
+
+@contextmanager
+def _conexion():
+    # Una conexión por operación, como en los trabajos: se usa desde los hilos del ejecutor
+    conexion = sqlite3.connect(MOTIVOS_DB, timeout=30)
+    try:
+        _inicializar(conexion)
+        with conexion:
+            yield conexion
+    finally:
+        conexion.close()
+
+
+def claves_alturas(alturas):
+    """
+    Clave de cada n-grama de LONGITUD_GRAMA alturas consecutivas.
+    """
+    return empaquetar_ngramas(alturas, LONGITUD_GRAMA)
+
+
+def claves_intervalos(intervalos):
+    """
+    Clave de cada n-grama de LONGITUD_GRAMA - 1 intervalos consecutivos
+    (independiente de la transposición).
+    """
+    desplazados = np.clip(np.asarray(intervalos, dtype=np.int64), -DESPLAZAMIENTO_INTERVALO, DESPLAZAMIENTO_INTERVALO - 1) + DESPLAZAMIENTO_INTERVALO
+    return empaquetar_ngramas(desplazados, LONGITUD_GRAMA - 1)
+
+
+def entradas_motivos(score):
+    """
+    Filas (tipo, clave, parte, posición, compás) de todos los n-gramas de
+    alturas e intervalos de cada parte. La posición es el índice de la primera
+    nota del n-grama dentro de la parte y el compás, el de esa nota.
+    """
+    bloques = []
+    for indice_parte, filas in tabla_notas(score).por_parte():
+        alturas = filas["altura"].astype(np.int64)
+        n = len(alturas) - LONGITUD_GRAMA + 1
+        if n <= 0:
+            continue
+        posiciones = np.arange(n, dtype=np.int64)
+        compases = filas["compas"][:n].astype(np.int64)
+        parte = np.full(n, indice_parte, dtype=np.int64)
+        for tipo, claves in (
+            (ALTURAS, claves_alturas(alturas)),
+            (INTERVALOS, claves_intervalos(np.diff(alturas)))
+        ):
+            bloques.append(np.column_stack([np.full(n, tipo), claves, parte, posiciones, compases]))
+    if not bloques:
+        return np.zeros((0, 5), dtype=np.int64)
+    return np.concatenate(bloques)
+
+
+def _borrar_huerfano(conexion, id_archivo):
+    # Un contenido al que ya no apunta ningún nombre sale del índice
+    if conexion.execute("SELECT 1 FROM nombres WHERE archivo = ?", (id_archivo,)).fetchone():
+        return
+    conexion.execute("""
+        UPDATE frecuencias SET total = total - (
+            SELECT COUNT(*) FROM motivos m
+            WHERE m.tipo = frecuencias.tipo AND m.clave = frecuencias.clave AND m.archivo = ?
+        )
+        WHERE (tipo, clave) IN (SELECT DISTINCT tipo, clave FROM motivos WHERE archivo = ?)
+    """, (id_archivo, id_archivo))
+    conexion.execute("DELETE FROM frecuencias WHERE total <= 0")
+    conexion.execute("DELETE FROM motivos WHERE archivo = ?", (id_archivo,))
+    conexion.execute("DELETE FROM archivos WHERE id = ?", (id_archivo,))
+
+
+def _asignar_nombre(conexion, nombre, id_archivo):
+    anterior = conexion.execute("SELECT archivo FROM nombres WHERE nombre = ?", (nombre,)).fetchone()
+    if anterior and anterior[0] == id_archivo:
+        return
+    conexion.execute("INSERT OR REPLACE INTO nombres (nombre, archivo) VALUES (?, ?)", (nombre, id_archivo))
+    if anterior:
+        _borrar_huerfano(conexion, anterior[0])
+
+
+def indexar_motivos(nombre_archivo):
+    """
+    Añade al índice los n-gramas de un archivo de `uploads/`. Un contenido ya
+    indexado (mismo hash) solo se asocia al nombre, sin parsear nada.
+    """
+    ruta = os.path.join("uploads", nombre_archivo)
+    hash_contenido = hash_archivo_en_disco(ruta)
+    with _lock, _conexion() as conexion:
+        fila = conexion.execute("SELECT id FROM archivos WHERE hash = ?", (hash_contenido,)).fetchone()
+        if fila:
+            _asignar_nombre(conexion, nombre_archivo, fila[0])
+            return {"archivo": nombre_archivo, "hash": hash_contenido, "nuevo": False}
+
+    # El parseo se hace fuera del bloqueo: puede tardar segundos
+    score, _ = cargar_eventos(ruta)
+    entradas = entradas_motivos(score)
+    partes = tabla_notas(score).nombres_partes
+    notas = int(sum(len(filas) for _, filas in tabla_notas(score).por_parte()))
+
+    with _lock, _conexion() as conexion:
+        fila = conexion.execute("SELECT id FROM archivos WHERE hash = ?", (hash_contenido,)).fetchone()
+        if fila is None:
+            id_archivo = conexion.execute(
+                "INSERT INTO archivos (hash, partes, notas, indexado) VALUES (?, ?, ?, ?)",
+                (hash_contenido, json.dumps(partes, ensure_ascii=False), notas, time.time())
+            ).lastrowid
+            conexion.executemany(
+                "INSERT OR IGNORE INTO motivos (tipo, clave, archivo, parte, posicion, compas) VALUES (?, ?, ?, ?, ?, ?)",
+                ((t, c, id_archivo, p, pos, m) for t, c, p, pos, m in entradas.tolist())
+            )
+            if len(entradas):
+                claves, conteos = np.unique(entradas[:, :2], axis=0, return_counts=True)
+                conexion.executemany(
+                    "INSERT INTO frecuencias (tipo, clave, total) VALUES (?, ?, ?) "
+                    "ON CONFLICT (tipo, clave) DO UPDATE SET total = total + excluded.total",
+                    ((t, c, n) for (t, c), n in zip(claves.tolist(), conteos.tolist()))
+                )
+        else:
+            id_archivo = fila[0]
+        _asignar_nombre(conexion, nombre_archivo, id_archivo)
+    return {"archivo": nombre_archivo, "hash": hash_contenido, "nuevo": True, "ngramas": len(entradas)}
+
+
+def programar_indexado_motivos(nombre_archivo):
+    return enviar_a_ejecutor(indexar_motivos, nombre_archivo)
+
+
+def leer_motivo(texto, tipo):
+    """
+    Secuencia de enteros de un motivo escrito como "60-62-64" (alturas, como
+    las claves de `motivos_recurrentes`) o "2,2,-1" (intervalos).
+    """
+    separador = r"[-,\s]+" if tipo == ALTURAS else r"[,\s]+"
+    try:
+        valores = [int(v) for v in re.split(separador, texto.strip()) if v]
+    except ValueError:
+        raise ValueError(f"Motivo inválido: {texto}")
+    minimo = LONGITUD_GRAMA if tipo == ALTURAS else LONGITUD_GRAMA - 1
+    if len(valores) < minimo:
+        raise ValueError(f"El motivo necesita al menos {minimo} valores")
+    if tipo == ALTURAS and not all(0 <= v <= 127 for v in valores):
+        raise ValueError("Las alturas deben estar entre 0 y 127")
+    return valores
+
+
+def _grams_consulta(tipo, secuencia):
+    # Desplazamientos y claves de los n-gramas que cubren el motivo: cada uno
+    # abarca LONGITUD_GRAMA alturas o LONGITUD_GRAMA - 1 intervalos
+    claves = claves_alturas(secuencia) if tipo == ALTURAS else claves_intervalos(secuencia)
+    ancho = LONGITUD_GRAMA if tipo == ALTURAS else LONGITUD_GRAMA - 1
+    ultimo = len(claves) - 1
+    desplazamientos = sorted(set(range(0, ultimo + 1, ancho)) | {ultimo})
+    return [(d, int(claves[d])) for d in desplazamientos]
+
+
+def buscar_motivo(tipo, secuencia, limite=100):
+    """
+    Apariciones exactas de un motivo en todo el corpus: archivo, parte y compás
+    de su primera nota. El motivo se descompone en n-gramas que deben aparecer
+    seguidos en la misma parte; la consulta empieza por el menos frecuente.
+    """
+    grams = _grams_consulta(tipo, secuencia)
+    with _conexion() as conexion:
+        frecuencias = {}
+        for _, clave in grams:
+            fila = conexion.execute(
+                "SELECT total FROM frecuencias WHERE tipo = ? AND clave = ?", (tipo, clave)
+            ).fetchone()
+            frecuencias[clave] = fila[0] if fila else 0
+        if not all(frecuencias.values()):
+            return {"total": 0, "ocurrencias": []}
+
+        orden = sorted(grams, key=lambda g: frecuencias[g[1]])
+        (d0, _), resto = orden[0], orden[1:]
+        alias = {d: f"m{i}" for i, (d, _) in enumerate(orden)}
+        tablas = " CROSS JOIN ".join(f"motivos {alias[d]}" for d, _ in orden)
+        condiciones, parametros = ["m0.tipo = ? AND m0.clave = ?"], [tipo, orden[0][1]]
+        for d, clave in resto:
+            a = alias[d]
+            condiciones.append(
+                f"{a}.tipo = ? AND {a}.clave = ? AND {a}.archivo = m0.archivo "
+                f"AND {a}.parte = m0.parte AND {a}.posicion = m0.posicion + ?"
+            )
+            parametros += [tipo, clave, d - d0]
+        donde = " AND ".join(condiciones)
+
+        if len(orden) == 1:
+            total = frecuencias[orden[0][1]]
+        else:
+            total = conexion.execute(f"SELECT COUNT(*) FROM {tablas} WHERE {donde}", parametros).fetchone()[0]
+
+        inicio = alias[0]
+        filas = conexion.execute(
+            f"SELECT m0.archivo, m0.parte, {inicio}.posicion, {inicio}.compas FROM {tablas} WHERE {donde} "
+            f"ORDER BY m0.archivo, m0.parte, {inicio}.posicion LIMIT ?",
+            [*parametros, limite]
+        ).fetchall()
+
+        ids = sorted({f[0] for f in filas})
+        archivos = {}
+        for id_archivo in ids:
+            hash_contenido, partes = conexion.execute(
+                "SELECT hash, partes FROM archivos WHERE id = ?", (id_archivo,)
+            ).fetchone()
+            nombres = [n for (n,) in conexion.execute(
+                "SELECT nombre FROM nombres WHERE archivo = ? ORDER BY nombre", (id_archivo,)
+            )]
+            archivos[id_archivo] = (hash_contenido, json.loads(partes), nombres)
+
+    return {
+        "total": total,
+        "ocurrencias": [{
+            "archivos": archivos[id_archivo][2],
+            "hash": archivos[id_archivo][0],
+            "parte": archivos[id_archivo][1][parte],
+            "compas": compas,
+            "posicion": posicion
+        } for id_archivo, parte, posicion, compas in filas]
+    }
+
+
+def estadisticas_motivos():
+    with _conexion() as conexion:
+        archivos, notas = conexion.execute("SELECT COUNT(*), COALESCE(SUM(notas), 0) FROM archivos").fetchone()
+        nombres = conexion.execute("SELECT COUNT(*) FROM nombres").fetchone()[0]
+        distintos = conexion.execute("SELECT COUNT(*) FROM frecuencias").fetchone()[0]
+    return {"archivos": archivos, "nombres": nombres, "notas": notas, "ngramas_distintos": distintos}
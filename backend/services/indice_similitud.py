@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from backend.config import INDICE_SIMILITUD_DIR
+from backend.services.cache_resultados import VERSION_CODIGO
+from backend.services.ejecutor import enviar_a_ejecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Subir al cambiar la composición del vector: el índice anterior se descarta. Lo
+# mismo ocurre con cualquier cambio de código (VERSION_CODIGO), como en la caché
+# de resultados, para no mezclar vectores calculados por versiones distintas
+VERSION_VECTORES = 1
+
+ENTROPIAS = (
+    "entropia_melodica", "entropia_ritmica", "entropia_armonica",
+    "entropia_interaccion", "complejidad_total"
+)
+
+# Histograma de intervalos en semitonos; los saltos mayores de una octava se
+# acumulan en los extremos
+INTERVALO_MAXIMO = 12
+
+FAMILIAS = ("Cuerdas", "Vientos madera", "Metales", "Percusión", "Teclado", "Otros")
+
+DIMENSION = len(ENTROPIAS) + 2 * INTERVALO_MAXIMO + 1 + len(FAMILIAS) + 4
+
+METRICAS_DISTANCIA = ("euclidea", "coseno")
+
+
+def vector_caracteristicas(resultado):
+    """
+    Vector de longitud fija a partir del resultado de `analizar_midi`: perfil
+    de entropías, histograma de intervalos (proporciones), reparto de partes
+    por familia (proporciones) y media, desviación, mínimo y máximo de la
+    dinámica de las partes (velocidad / 127).
+    """
+    entropias = [float(resultado[clave]) for clave in ENTROPIAS]
+
+    intervalos = np.zeros(2 * INTERVALO_MAXIMO + 1)
+    histograma = resultado["intervalos_predominantes"].get("histograma", {})
+    valores = np.clip(np.asarray(histograma.get("intervalos", []), dtype=np.int64), -INTERVALO_MAXIMO, INTERVALO_MAXIMO)
+    np.add.at(intervalos, valores + INTERVALO_MAXIMO, np.asarray(histograma.get("conteos", []), dtype=float))
+    if intervalos.sum():
+        intervalos /= intervalos.sum()
+
+    familias = np.array([len(resultado["familias_instrumentales"].get(f, [])) for f in FAMILIAS], dtype=float)
+    if familias.sum():
+        familias /= familias.sum()
+
+    dinamicas = np.asarray(list(resultado["balance_dinamico"].values()), dtype=float) / 127
+    dinamica = (
+        [dinamicas.mean(), dinamicas.std(), dinamicas.min(), dinamicas.max()]
+        if dinamicas.size else [0.0] * 4
+    )
+
+    return np.concatenate([entropias, intervalos, familias, dinamica]).astype(np.float32)
+
+
+class IndiceSimilitud:
+    """
+    Vectores de características de todos los archivos analizados, uno por
+    contenido (hash), en una matriz float32 en disco que se lee con `np.memmap`:
+    las consultas no vuelven a parsear ningún archivo y la memoria la gestiona
+    el sistema operativo.
+
+    `claves.jsonl` es un registro de solo añadir con líneas {fila, hash,
+    nombre}; una fila se escribe en `vectores.f32` antes de anotarla, así que
+    una interrupción nunca deja claves sin vector. Otros procesos (p. ej. el
+    análisis por lotes) pueden añadir vectores: se leen las líneas nuevas en
+    cada consulta.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = Path(directorio)
+        self.ruta_vectores = self.directorio / "vectores.f32"
+        self.ruta_claves = self.directorio / "claves.jsonl"
+        self._lock = threading.Lock()
+        self._preparado = False
+        self._leido = 0
+        self.filas = {}
+        self.hashes = []
+        self.nombres = {}
+        self._archivos = {}
+        self._matriz = None
+        self._estadisticas = None
+
+    def _preparar(self):
+        if self._preparado:
+            return
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        ruta_meta = self.directorio / "meta.json"
+        meta = {"version": VERSION_VECTORES, "codigo": VERSION_CODIGO, "dimension": DIMENSION}
+        try:
+            vigente = json.loads(ruta_meta.read_text()) == meta
+        except (FileNotFoundError, ValueError):
+            vigente = False
+        if not vigente:
+            for ruta in (self.ruta_vectores, self.ruta_claves):
+                ruta.unlink(missing_ok=True)
+            ruta_meta.write_text(json.dumps(meta))
+        self._preparado = True
+
+    def _sincronizar(self):
+        # Lee las claves que otros procesos hayan añadido desde la última vez
+        self._preparar()
+        tamano = self.ruta_claves.stat().st_size if self.ruta_claves.exists() else 0
+        if tamano < self._leido:
+            # Otro proceso, con otra versión, ha vaciado el índice
+            self._leido = 0
+            self.filas, self.hashes, self.nombres, self._archivos = {}, [], {}, {}
+            self._matriz = None
+        if tamano == self._leido:
+            return
+        with open(self.ruta_claves, "rb") as f:
+            f.seek(self._leido)
+            for linea in f:
+                if not linea.endswith(b"\n"):
+                    break
+                self._leido += len(linea)
+                clave = json.loads(linea)
+                if clave["hash"] not in self.filas:
+                    self.filas[clave["hash"]] = clave["fila"]
+                    self.hashes.append(clave["hash"])
+                nombre = clave.get("nombre")
+                if nombre:
+                    # Un nombre reasignado a otro contenido deja de listarse en el anterior
+                    anterior = self.nombres.get(nombre)
+                    if anterior is not None:
+                        self._archivos[anterior].discard(nombre)
+                    self.nombres[nombre] = clave["hash"]
+                    self._archivos.setdefault(clave["hash"], set()).add(nombre)
+
+    def _bloqueo_archivo(self):
+        return _BloqueoArchivo(self.directorio / ".bloqueo")
+
+    def registrar(self, hash_contenido, nombre, vector):
+        """
+        Añade el vector de un contenido (si no estaba) y anota `nombre` como
+        uno de sus archivos.
+        """
+        with self._lock, self._bloqueo_archivo():
+            self._sincronizar()
+            if hash_contenido in self.filas and self.nombres.get(nombre) == hash_contenido:
+                return
+            fila = self.filas.get(hash_contenido)
+            if fila is None:
+                fila = len(self.hashes)
+                with open(self.ruta_vectores, "ab") as f:
+                    f.truncate(fila * DIMENSION * 4)
+                    f.write(np.asarray(vector, dtype="<f4").tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            linea = json.dumps({"fila": fila, "hash": hash_contenido, "nombre": nombre}, ensure_ascii=False)
+            with open(self.ruta_claves, "ab") as f:
+                f.write(linea.encode("utf-8") + b"\n")
+            self._sincronizar()
+
+    def contiene(self, hash_contenido):
+        with self._lock:
+            self._sincronizar()
+            return hash_contenido in self.filas
+
+    def _matriz_actual(self):
+        n = len(self.hashes)
+        if self._matriz is None or self._matriz.shape[0] != n:
+            self._matriz = np.memmap(self.ruta_vectores, dtype="<f4", mode="r", shape=(n, DIMENSION))
+            # Media y desviación por columna, para que ninguna escala domine la distancia
+            media = self._matriz.mean(axis=0, dtype=np.float64)
+            desviacion = self._matriz.std(axis=0, dtype=np.float64)
+            desviacion[desviacion == 0] = 1.0
+            self._estadisticas = (media.astype(np.float32), desviacion.astype(np.float32))
+        return self._matriz, self._estadisticas
+
+    def archivos_de(self, hash_contenido):
+        return sorted(self._archivos.get(hash_contenido, ()))
+
+    def vecinos(self, hash_contenido, k=10, metrica="euclidea"):
+        """
+        Los `k` contenidos más parecidos a `hash_contenido`, con su distancia
+        sobre las características estandarizadas.
+        """
+        if metrica not in METRICAS_DISTANCIA:
+            raise ValueError(f"Métrica inválida: {metrica}")
+        with self._lock:
+            self._sincronizar()
+            matriz, (media, desviacion) = self._matriz_actual()
+            fila = self.filas[hash_contenido]
+            z = (np.asarray(matriz) - media) / desviacion
+            consulta = z[fila]
+            if metrica == "coseno":
+                normas = np.linalg.norm(z, axis=1) * np.linalg.norm(consulta)
+                normas[normas == 0] = 1.0
+                distancias = 1.0 - (z @ consulta) / normas
+            else:
+                diferencias = z - consulta
+                distancias = np.sqrt(np.einsum("ij,ij->i", diferencias, diferencias))
+            distancias[fila] = np.inf
+
+            k = min(k, len(distancias) - 1)
+            if k <= 0:
+                return []
+            cercanos = np.argpartition(distancias, k - 1)[:k]
+            cercanos = cercanos[np.argsort(distancias[cercanos])]
+            return [{
+                "hash": self.hashes[i],
+                "archivos": self.archivos_de(self.hashes[i]),
+                "distancia": round(float(distancias[i]), 4)
+            } for i in cercanos]
+
+    def estadisticas(self):
+        with self._lock:
+            self._sincronizar()
+            return {
+                "vectores": len(self.hashes),
+                "nombres": len(self.nombres),
+                "dimension": DIMENSION,
+                "bytes": self.ruta_vectores.stat().st_size if self.ruta_vectores.exists() else 0
+            }
+
+
+class _BloqueoArchivo:
+    # Exclusión entre procesos que escriben en el mismo índice (sin fcntl, solo
+    # entre hilos)
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._f = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            self._f = open(self.ruta, "a")
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._f is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+
+
+indice_similitud = IndiceSimilitud(INDICE_SIMILITUD_DIR)
+
+
+def indexar_analisis(hash_contenido, nombre, resultado):
+    """
+    Registra el resultado de `analizar_midi` (de la obra completa, sin
+    selección de instrumentos) en el índice de similitud.
+    """
+    if "error" in resultado:
+        return
+    indice_similitud.registrar(hash_contenido, nombre, vector_caracteristicas(resultado))
+
+
+def indexar_archivo(nombre_archivo):
+    """
+    Hash del archivo de `uploads/`, indexándolo antes si hace falta (el
+    análisis sale de la caché de resultados si ya se calculó).
+    """
+    from backend.services.cache_partituras import hash_archivo_en_disco
+    from backend.services.parser import analizar_midi
+
+    ruta = os.path.join("uploads", nombre_archivo)
+    if not os.path.exists(ruta):
+        raise FileNotFoundError(ruta)
+    hash_contenido = hash_archivo_en_disco(ruta)
+    if not indice_similitud.contiene(hash_contenido) or indice_similitud.nombres.get(nombre_archivo) != hash_contenido:
+        resultado = analizar_midi(nombre_archivo)
+        if "error" in resultado:
+            raise ValueError(resultado["error"])
+        indexar_analisis(hash_contenido, nombre_archivo, resultado)
+    return hash_contenido
+
+
+def indexar_subida(nombre_archivo):
+    """
+    `indexar_archivo` para los análisis en segundo plano: nadie espera el
+    resultado, así que un fallo solo se anota.
+    """
+    try:
+        return indexar_archivo(nombre_archivo)
+    except Exception as e:
+        logger.warning("No se pudo indexar %s: %s", nombre_archivo, e)
+
+
+def programar_indexado_similitud(nombre_archivo):
+    """
+    Encola el indexado del archivo subido en el ejecutor de análisis.
+    """
+    return enviar_a_ejecutor(indexar_subida, nombre_archivo)
@@ -0,0 +1,397 @@
+from bisect import bisect_left, bisect_right
+from fractions import Fraction
+
+import logging
+
+import numpy as np
+import pretty_midi
+from music21 import key
+
+from backend.services.tabla_notas import (
+    TablaNotas, MapaTempo, DTYPE_NOTAS, DTYPE_SILENCIOS,
+    NOTA, ACORDE, MIEMBRO_ACORDE, OTRO, registrar_tabla
+)
+from backend.services.indice_compases import registrar_rejilla
+
+logger = logging.getLogger(__name__)
+
+# Mismos divisores de negra que usa music21 al cuantizar MIDI
+DIVISORES_CUANTIZACION = (4, 3)
+CANAL_PERCUSION = 9  # canal 10 en numeración MIDI
+
+
+def _multiplo_cercano(valor, divisor):
+    # Réplica de `music21.common.nearestMultiple` con unidad 1/divisor; devuelve
+    # también el múltiplo exacto, como el Fraction con el que music21 lo guarda
+    unidad = 1 / divisor
+    multiplo = int(np.floor(valor / unidad))
+    bajo = unidad * multiplo
+    if bajo <= valor <= bajo + unidad / 2.0:
+        return bajo, Fraction(multiplo, divisor), round(valor - bajo, 7)
+    alto = unidad * (multiplo + 1)
+    return alto, Fraction(multiplo + 1, divisor), round(alto - valor, 7)
+
+
+def _mejor_ajuste(valor, cero_permitido=True, hueco=0.0):
+    """
+    Valor cuantizado a la rejilla de 1/4 o 1/3 de negra que music21 elegiría
+    (`Stream.quantize`): menor hueco restante, luego menor error, luego la
+    unidad más fina. La elección se hace en coma flotante, como en music21, y
+    el resultado es exacto.
+    """
+    candidatos = []
+    for divisor in DIVISORES_CUANTIZACION:
+        unidad = 1 / divisor
+        ajuste, exacto, error = _multiplo_cercano(valor, divisor)
+        if not cero_permitido and ajuste == 0.0:
+            ajuste, exacto = unidad, Fraction(1, divisor)
+            error = abs(round(valor - ajuste, 7))
+        restante = 0.0 if hueco % unidad == 0 else max(hueco - ajuste, 0.0)
+        candidatos.append((restante, error, unidad, ajuste, exacto))
+    return min(candidatos)[4]
+
+
+def _agrupar_acordes(inicios, fines, tolerancia):
+    """
+    Agrupa en acordes las notas que empiezan y terminan juntas, con el mismo
+    recorrido que la importación MIDI de music21. Devuelve la lista de grupos
+    (índices) y si la parte necesita voces.
+    """
+    grupos, reunidos, voces = [], set(), False
+    for i in range(len(inicios)):
+        if i in reunidos:
+            continue
+        grupo = []
+        for j in range(i + 1, len(inicios)):
+            if abs(inicios[j] - inicios[i]) < tolerancia:
+                if abs(fines[j] - fines[i]) > tolerancia:
+                    voces = True
+                    continue
+                if not grupo:
+                    grupo = [i]
+                    reunidos.add(i)
+                grupo.append(j)
+                reunidos.add(j)
+            else:
+                break
+        grupos.append(grupo or [i])
+    return grupos, voces
+
+
+def _cuantizar(offsets, duraciones):
+    """
+    Cuantiza offsets y duraciones (en negras) como `Stream.quantize` sobre una
+    parte ordenada: la duración se ajusta mirando el siguiente ataque distinto.
+    """
+    ajustados = [_mejor_ajuste(o) for o in offsets]
+    resultado = []
+    for i, (o, d) in enumerate(zip(ajustados, duraciones)):
+        hueco = None
+        for siguiente in ajustados[i + 1:]:
+            if siguiente > o:
+                hueco = siguiente - o
+                break
+        d = max(d, 0.0)
+        if hueco is None:
+            resultado.append(_mejor_ajuste(d, cero_permitido=False))
+        else:
+            resultado.append(_mejor_ajuste(d, cero_permitido=False, hueco=hueco))
+    return ajustados, resultado
+
+
+def _negras(midi, tiempo):
+    return Fraction(midi.time_to_tick(tiempo), midi.resolution)
+
+
+def _eventos_director(midi):
+    """
+    Offsets (en negras) de los cambios de tempo, compás y tonalidad. music21
+    los copia en todas las partes, así que alargan la parte y cortan silencios.
+    """
+    tiempos = list(midi.get_tempo_changes()[0])
+    tiempos += [ts.time for ts in midi.time_signature_changes]
+    tiempos += [ks.time for ks in midi.key_signature_changes]
+    return sorted({_negras(midi, t) for t in tiempos})
+
+
+def _rejilla_compases(midi, fin):
+    """
+    Compases (números, inicios, duraciones en negras) que cubren hasta `fin`,
+    según los cambios de compás del MIDI (4/4 si no hay ninguno).
+    """
+    cambios = [
+        (_negras(midi, ts.time), Fraction(ts.numerator * 4, ts.denominator))
+        for ts in midi.time_signature_changes
+    ]
+    if not cambios or cambios[0][0] > 0:
+        cambios.insert(0, (Fraction(0), Fraction(4)))
+    numeros, inicios, duraciones = [], [], []
+    offset, k = Fraction(0), 0
+    while offset < fin or not numeros:
+        while k + 1 < len(cambios) and cambios[k + 1][0] <= offset:
+            k += 1
+        numeros.append(len(numeros) + 1)
+        inicios.append(offset)
+        duraciones.append(cambios[k][1])
+        offset += cambios[k][1]
+    return numeros, inicios, duraciones
+
+
+def _tonicas(midi):
+    """
+    Tónicas de los cambios de tonalidad, como las de los `key.Key` que crea
+    music21 (p. ej. "E-" para mi bemol mayor).
+    """
+    tonicas = set()
+    for ks in midi.key_signature_changes:
+        modo, alteraciones = pretty_midi.key_number_to_mode_accidentals(ks.key_number)
+        tonicas.add(key.KeySignature(alteraciones).asKey("minor" if modo else "major").tonic.name)
+    return tonicas
+
+
+def _elementos_instrumento(midi, inst):
+    """
+    Elementos (offset, duración, alturas, velocidad) de un instrumento tal y
+    como quedarían tras importar el MIDI con music21, y si necesita voces.
+    """
+    resolucion = midi.resolution
+    notas = sorted(
+        ((midi.time_to_tick(n.start), midi.time_to_tick(n.end), n.pitch, n.velocity) for n in inst.notes),
+        key=lambda n: n[0]
+    )
+    inicios = [n[0] for n in notas]
+    fines = [n[1] for n in notas]
+    grupos, voces = _agrupar_acordes(inicios, fines, resolucion / max(DIVISORES_CUANTIZACION))
+
+    offsets, duraciones, alturas, velocidades = [], [], [], []
+    for grupo in grupos:
+        primera, ultima = notas[grupo[0]], notas[grupo[-1]]
+        offsets.append(primera[0] / resolucion)
+        # music21 toma la duración de la última nota del grupo
+        duraciones.append((ultima[1] - ultima[0]) / resolucion)
+        alturas.append([notas[j][2] for j in grupo])
+        # La velocidad de un acorde en music21 es la media de la de sus notas
+        velocidades.append(int(round(sum(notas[j][3] for j in grupo) / len(grupo))))
+
+    orden = sorted(range(len(offsets)), key=lambda i: offsets[i])
+    offsets = [offsets[i] for i in orden]
+    duraciones = [duraciones[i] for i in orden]
+    alturas = [alturas[i] for i in orden]
+    velocidades = [velocidades[i] for i in orden]
+    offsets, duraciones = _cuantizar(offsets, duraciones)
+    return offsets, duraciones, alturas, velocidades, voces
+
+
+def _asignar_voces(offsets, duraciones):
+    """
+    Reparto en voces de `makeVoices`: cada elemento va a la primera voz que ya
+    terminó. Devuelve el índice de voz de cada elemento, o None si basta una.
+    """
+    fines_voces, voces = [], []
+    for offset, duracion in zip(offsets, duraciones):
+        for v, fin in enumerate(fines_voces):
+            if fin <= offset:
+                break
+        else:
+            v = len(fines_voces)
+            fines_voces.append(0)
+        fines_voces[v] = max(fines_voces[v], offset + duracion)
+        voces.append(v)
+    return voces if len(fines_voces) > 1 else None
+
+
+def _colocar_en_compases(offsets, duraciones, necesita_voces, inicios_compas, duraciones_compas):
+    """
+    Reproduce `makeMeasures`, `makeVoices` y `makeTies`: devuelve los trozos
+    (elemento, índice de compás, onset, duración, en_voz) en el orden de
+    `flatten()`.
+    """
+    n_compases = len(inicios_compas)
+    compas_de = [min(max(bisect_right(inicios_compas, o) - 1, 0), n_compases - 1) for o in offsets]
+    # Contenido de cada compás: voz (None = directo) y trozos en orden de inserción
+    contenido = [[] for _ in range(n_compases)]
+    secuencia = 0
+    for e, k in enumerate(compas_de):
+        contenido[k].append([e, offsets[e], duraciones[e], None, secuencia])
+        secuencia += 1
+
+    con_voces = [False] * n_compases
+    if necesita_voces:
+        for k in range(n_compases):
+            voces = _asignar_voces([t[1] for t in contenido[k]], [t[2] for t in contenido[k]])
+            if voces is not None:
+                con_voces[k] = True
+                for t, v in zip(contenido[k], voces):
+                    t[3] = v
+
+    # Compases que reciben una sola voz al ligar desde un compás con voces
+    # (`moveNotesToVoices`); `flattenUnnecessaryVoices` la deshace al final
+    una_voz = [False] * n_compases
+    for k in range(n_compases):
+        fin_compas = inicios_compas[k] + duraciones_compas[k]
+        siguiente_con_voces = k + 1 < n_compases and con_voces[k + 1]
+        # En un compás con voces solo se ligan los elementos de las voces
+        for t in list(contenido[k]):
+            if con_voces[k] and t[3] is None:
+                continue
+            e, onset, duracion, voz, _ = t
+            if onset + duracion <= fin_compas or onset >= fin_compas or k + 1 >= n_compases:
+                continue
+            t[2] = fin_compas - onset
+            if siguiente_con_voces:
+                # Desde un compás sin voces el resto entra en la primera voz del
+                # siguiente; entre compases con voces music21 busca la voz por su
+                # id, que nunca coincide, y lo deja directo en el compás
+                voz_destino = None if con_voces[k] else 0
+            elif con_voces[k]:
+                for u in contenido[k + 1]:
+                    u[3] = 0
+                con_voces[k + 1] = una_voz[k + 1] = True
+                voz_destino = 0
+            else:
+                voz_destino = None
+            contenido[k + 1].append([e, fin_compas, onset + duracion - fin_compas, voz_destino, secuencia])
+            secuencia += 1
+
+    for k in range(n_compases):
+        if una_voz[k]:
+            for t in contenido[k]:
+                t[3] = None
+
+    trozos = []
+    for k in range(n_compases):
+        for e, onset, duracion, voz, orden in contenido[k]:
+            # Recorrido de `flatten()`: primero las voces (en orden), luego lo directo
+            clave = (onset, k, voz if voz is not None else n_compases, orden)
+            trozos.append((clave, e, k, onset, duracion, voz))
+    trozos.sort(key=lambda t: t[0])
+    return [t[1:] for t in trozos]
+
+
+def construir_tabla_midi(midi):
+    """
+    Tabla de notas y rejilla de compases de cada parte construidas solo con
+    los eventos de PrettyMIDI, reproduciendo la cuantización, agrupación en
+    acordes, voces y ligaduras de la importación de music21 (los offsets se
+    calculan con fracciones exactas, como en music21).
+
+    Diferencias conocidas con `converter.parse`:
+    - PrettyMIDI no conserva el orden de los note-on, así que el orden de las
+      notas que empiezan a la vez (y, en compases con voces, su reparto entre
+      voces) y el de las alturas de un acorde, cuya primera fila lo representa,
+      pueden diferir.
+    - Hay una parte por instrumento de PrettyMIDI (pista, canal y programa) y
+      music21 crea una por pista: en archivos con varios canales o programas
+      en una misma pista las partes no coinciden.
+    - Los cambios de compás y tonalidad son los de la primera pista, que es
+      donde los lee PrettyMIDI.
+    """
+    filas, silencios, nombres, rejillas = [], [], [], []
+    eventos = _eventos_director(midi)
+    for indice, inst in enumerate(midi.instruments):
+        nombres.append(inst.name.strip() or None)
+        offsets, duraciones, alturas, velocidades, voces = _elementos_instrumento(midi, inst)
+        fin_parte = max(max((o + d for o, d in zip(offsets, duraciones)), default=0), max(eventos, default=0))
+        numeros, inicios_compas, duraciones_compas = _rejilla_compases(midi, fin_parte)
+        rejillas.append(_rejilla_flotante(numeros, inicios_compas, duraciones_compas))
+
+        filas_parte = []
+        trozos = _colocar_en_compases(offsets, duraciones, voces, inicios_compas, duraciones_compas)
+        for e, k, onset, duracion, voz in trozos:
+            en_voz = voz is not None
+            comun = (indice, numeros[k], float(onset), float(onset - inicios_compas[k]), 0.0, float(duracion))
+            grupo, velocidad = alturas[e], velocidades[e]
+            if inst.is_drum:
+                filas_parte.append(comun + (-1, velocidad, OTRO, en_voz))
+            elif len(grupo) == 1:
+                filas_parte.append(comun + (grupo[0], velocidad, NOTA, en_voz))
+            else:
+                for j, altura in enumerate(grupo):
+                    filas_parte.append(comun + (altura, velocidad, ACORDE if j == 0 else MIEMBRO_ACORDE, en_voz))
+        filas.extend(filas_parte)
+        silencios.extend(_silencios_parte(indice, trozos, inicios_compas, duraciones_compas, eventos))
+
+    notas = np.array(filas, dtype=DTYPE_NOTAS)
+    mapa_tempo = MapaTempo.desde_midi(midi)
+    notas["onset_segundos"] = mapa_tempo.a_segundos(notas["onset"])
+    # music21 copia las tonalidades en todas las partes
+    tonicas = _tonicas(midi)
+    tabla = TablaNotas(
+        notas, nombres, mapa_tempo, np.array(silencios, dtype=DTYPE_SILENCIOS),
+        [set(tonicas) for _ in nombres]
+    )
+    return tabla, rejillas
+
+
+def _rejilla_flotante(numeros, inicios, duraciones):
+    return (
+        np.asarray(numeros, dtype=np.int64),
+        np.array([float(i) for i in inicios]),
+        np.array([float(d) for d in duraciones])
+    )
+
+
+def _silencios_parte(indice, trozos, inicios_compas, duraciones_compas, eventos):
+    """
+    Huecos sin sonido de la parte, como los silencios con los que music21
+    completa cada compás (o cada voz): cortados en las barras y en los eventos
+    del director.
+    """
+    silencios = []
+    ocupado = {}
+    for _, k, onset, duracion, voz in trozos:
+        ocupado.setdefault(k, {}).setdefault(voz, []).append((onset, onset + duracion))
+
+    def hueco(desde, hasta):
+        # `eventos` está ordenado
+        for evento in eventos[bisect_right(eventos, desde):bisect_left(eventos, hasta)]:
+            silencios.append((indice, float(desde), float(evento - desde)))
+            desde = evento
+        silencios.append((indice, float(desde), float(hasta - desde)))
+
+    for k, (inicio_compas, duracion_compas) in enumerate(zip(inicios_compas, duraciones_compas)):
+        fin_compas = inicio_compas + duracion_compas
+        capas = ocupado.get(k, {None: []})
+        if len(capas) > 1 or None not in capas:
+            # Compás con voces: cada voz se completa por separado
+            capas = {v: tramos for v, tramos in capas.items() if v is not None}
+        for v in sorted(capas, key=lambda v: -1 if v is None else v):
+            cursor = inicio_compas
+            for ini, fin in sorted(capas[v]):
+                if ini > cursor:
+                    hueco(cursor, ini)
+                cursor = max(cursor, fin)
+            if cursor < fin_compas:
+                hueco(cursor, fin_compas)
+    return silencios
+
+
+class PartituraMidi:
+    """
+    Partitura respaldada solo por el PrettyMIDI. La tabla de notas y el índice
+    de compases (con la rejilla de cada parte) se construyen desde los eventos
+    MIDI, y con ellos se calculan `analizar_midi` (/metrics), las métricas por
+    categoría (/metricas), la indexación de motivos y el precálculo de subidas
+    sin parsear con music21; /mixtas y /compases usan siempre ese score.
+
+    Solo expone lo que puede responder desde los eventos. `parts` y `score`
+    parsean el archivo con music21 y lo anotan en el log: una métrica que
+    llegue ahí ha perdido la ventaja de esta ingesta.
+    """
+
+    def __init__(self, entrada):
+        self._entrada = entrada
+        self.midi = entrada.midi
+        tabla, rejillas = construir_tabla_midi(self.midi)
+        registrar_tabla(self, tabla)
+        registrar_rejilla(self, rejillas[0] if rejillas else _rejilla_flotante(*_rejilla_compases(self.midi, 0)), rejillas)
+
+    @property
+    def score(self):
+        if self._entrada._score is None:
+            logger.warning("%s: se parsea con music21 desde la ingesta MIDI", self._entrada.ruta)
+        return self._entrada.score
+
+    @property
+    def parts(self):
+        return self.score.parts
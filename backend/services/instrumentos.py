@@ -1,5 +1,5 @@
 import os
-from music21 import converter
+from backend.services.cache_partituras import cargar_partitura
 
 def extraer_instrumentos(nombre_archivo: str) -> list[str]:
     """
@@ -11,7 +11,7 @@ def extraer_instrumentos(nombre_archivo: str) -> list[str]:
         raise FileNotFoundError(f"Archivo no encontrado: {nombre_archivo}")
 
     try:
-        score = converter.parse(ruta)
+        score, _ = cargar_partitura(ruta)
         nombres = [
             (p.partName or "Parte sin nombre").strip()
             for p in score.parts
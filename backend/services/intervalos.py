@@ -0,0 +1,72 @@
+import base64
+
+import numpy as np
+
+# Representaciones de la secuencia completa de intervalos
+FORMATOS_INTERVALOS = ["resumen", "lista", "rle", "empaquetado"]
+
+CUANTILES = {"minimo": 0, "q1": 25, "mediana": 50, "q3": 75, "maximo": 100}
+
+
+def resumen_intervalos(intervalos):
+    """
+    Histograma y cuantiles de una secuencia de intervalos (en semitonos): su
+    distribución completa en un tamaño que no depende de la longitud de la obra.
+    """
+    intervalos = np.asarray(intervalos, dtype=np.int64)
+    if intervalos.size == 0:
+        return {"total": 0, "histograma": {"intervalos": [], "conteos": []}, "cuantiles": {}}
+    valores, conteos = np.unique(intervalos, return_counts=True)
+    percentiles = np.percentile(intervalos, list(CUANTILES.values()))
+    return {
+        "total": int(intervalos.size),
+        "histograma": {"intervalos": valores.tolist(), "conteos": conteos.tolist()},
+        "cuantiles": {nombre: float(round(p, 3)) for nombre, p in zip(CUANTILES, percentiles)}
+    }
+
+
+def rle(intervalos):
+    """
+    Codificación por longitud de serie: cada valor con el número de veces
+    seguidas que se repite.
+    """
+    intervalos = np.asarray(intervalos, dtype=np.int64)
+    if intervalos.size == 0:
+        return {"valores": [], "repeticiones": []}
+    cortes = np.flatnonzero(np.diff(intervalos)) + 1
+    inicios = np.concatenate(([0], cortes))
+    repeticiones = np.diff(np.append(inicios, intervalos.size))
+    return {"valores": intervalos[inicios].tolist(), "repeticiones": repeticiones.tolist()}
+
+
+def empaquetar(intervalos):
+    """
+    Secuencia como enteros con signo little-endian del menor ancho que la
+    contiene (int8 casi siempre), en base64.
+    """
+    intervalos = np.asarray(intervalos, dtype=np.int64)
+    tipo = np.int8
+    if intervalos.size and (intervalos.min() < -128 or intervalos.max() > 127):
+        tipo = np.int16
+    datos = intervalos.astype(np.dtype(tipo).newbyteorder("<")).tobytes()
+    return {
+        "tipo": np.dtype(tipo).name,
+        "longitud": int(intervalos.size),
+        "datos": base64.b64encode(datos).decode("ascii")
+    }
+
+
+def representar_intervalos(intervalos, formato="resumen"):
+    """
+    Secuencia completa en el formato pedido, o None con "resumen" (el
+    histograma ya va en `intervalos_predominantes`).
+    """
+    if formato == "lista":
+        return np.asarray(intervalos, dtype=np.int64).tolist()
+    if formato == "rle":
+        return rle(intervalos)
+    if formato == "empaquetado":
+        return empaquetar(intervalos)
+    if formato == "resumen":
+        return None
+    raise ValueError(f"Formato de intervalos inválido: {formato}")
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from backend.config import PROCESOS_LOTE
+
+_pool = None
+_lock = threading.Lock()
+
+
+def numero_procesos():
+    return PROCESOS_LOTE if PROCESOS_LOTE > 0 else (os.cpu_count() or 1)
+
+
+def _obtener_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # "spawn" evita heredar por fork los hilos del servidor; cada proceso
+            # mantiene su propia caché de partituras entre peticiones
+            _pool = ProcessPoolExecutor(
+                max_workers=numero_procesos(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def cerrar_pool():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _ejecutar(funcion, args):
+    try:
+        return funcion(*args), None
+    except Exception as e:
+        return None, e
+
+
+def procesar_lote(funcion, tareas):
+    """
+    Ejecuta `funcion(*args)` para cada tupla de `tareas` en el pool de procesos
+    y devuelve, en el mismo orden, una lista de pares (resultado, excepción).
+    Con una sola tarea o un solo proceso se ejecuta en el proceso actual.
+    `funcion` debe ser de nivel de módulo para poder enviarse a otro proceso.
+    """
+    if len(tareas) < 2 or numero_procesos() < 2:
+        return [_ejecutar(funcion, args) for args in tareas]
+
+    pool = _obtener_pool()
+    futuros = [pool.submit(funcion, *args) for args in tareas]
+    salida = []
+    for futuro in futuros:
+        try:
+            salida.append((futuro.result(), None))
+        except BrokenProcessPool as e:
+            # Un proceso murió (p. ej. por memoria): el pool no se puede reutilizar
+            _descartar_pool(pool)
+            salida.append((None, e))
+        except Exception as e:
+            salida.append((None, e))
+    return salida
@@ -0,0 +1,179 @@
+import threading
+import weakref
+
+import numpy as np
+
+from backend.services.tabla_notas import ELEMENTOS
+from backend.services.acordes import acordes_ventana
+from backend.services.indice_compases import indice_compases, actividad_midi_por_compas
+from backend.services.ngramas import repetitividad_por_compas
+
+# Métricas por compás de la matriz, en el orden de sus columnas
+COLUMNAS = [
+    "notas",
+    "varianza_notas",
+    "compacidad_melodica",
+    "repetitividad_motivica",
+    "dispersion_temporal",
+    "variabilidad_intervalica",
+    "entropia_melodica",
+    "entropia_ritmica",
+    "entropia_duracion",
+    "densidad_armonica",
+    "entropia_armonica",
+    "entropia_compuesta",
+    "sincronizacion_entrada",
+    "promedio_rango_dinamico",
+    "seccion_aurea",
+]
+
+# Longitud de los motivos de `repetitividad_motívica_por_compas`
+LONGITUD_MOTIVO = 3
+
+
+def _entropia(valores, bins):
+    if not len(valores):
+        return 0.0
+    hist = np.histogram(valores, bins=bins)[0]
+    suma = np.sum(hist)
+    if suma == 0:
+        return 0.0
+    prob = hist / suma
+    prob = prob[prob > 0]
+    if prob.size == 0:
+        return 0.0
+    entropia = -np.sum(prob * np.log2(prob))
+    return float(round(entropia, 3)) if np.isfinite(entropia) else 0.0
+
+
+def _entropia_armonica(nombres):
+    letras = [ord(a[0]) for a in nombres if a]
+    return _entropia(letras, bins=12)
+
+
+class MatrizCompases:
+    """
+    Matriz compases x métricas de un score para un subconjunto de partes. Cada
+    fila corresponde a un compás de la rejilla y cada columna a una de
+    `COLUMNAS`; los valores coinciden con los de las funciones `*_por_compas`.
+    """
+
+    def __init__(self, numeros, duraciones, valores):
+        self.numeros = numeros
+        self.duraciones = duraciones
+        self.valores = valores
+
+    def __len__(self):
+        return len(self.numeros)
+
+    def columna(self, nombre):
+        return self.valores[:, COLUMNAS.index(nombre)]
+
+    def fila(self, i):
+        return dict(zip(COLUMNAS, self.valores[i].tolist()))
+
+
+def _calcular_filas(score, midi, instrumentos_seleccionados, valores, ventana=None):
+    """
+    Recorre la rejilla de compases (o solo los de la ventana) una sola vez y
+    rellena `valores` fila a fila; genera (i, fila) en cuanto cada compás está
+    calculado, con i la posición del compás en la rejilla completa.
+    """
+    indice = indice_compases(score)
+    ini, fin = indice.rango(ventana)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados)
+    elementos, inicios_el, fines_el = indice.segmentos(instrumentos_seleccionados, tipos=ELEMENTOS)
+    acordes_por_compas = acordes_ventana(score, instrumentos_seleccionados, ventana).por_compas(indice.numeros[ini:fin])
+
+    # Columnas que salen de operaciones vectorizadas sobre toda la ventana
+    entradas, rangos = actividad_midi_por_compas(score, midi, instrumentos_seleccionados, ventana)
+    tocan = ~np.isnan(entradas)
+    cantidad = tocan.sum(axis=0)
+    media = np.nansum(entradas, axis=0) / np.maximum(cantidad, 1)
+    desviacion = np.sqrt(np.nansum((entradas - media) ** 2, axis=0) / np.maximum(cantidad, 1))
+    valores[:, 12] = np.where(cantidad > 0, np.round(desviacion, 3), 0.0)
+    cantidad_rangos = (~np.isnan(rangos)).sum(axis=0)
+    promedio = np.nansum(rangos, axis=0) / np.maximum(cantidad_rangos, 1)
+    valores[:, 13] = np.where(cantidad_rangos > 0, np.round(promedio, 3), 0.0)
+    # `round` de Python, como `seccion_aurea_por_compas` (np.round redondea distinto)
+    valores[:, 14] = [round(float(d) * 0.618, 3) for d in indice.duraciones[ini:fin]]
+    valores[:, 3] = repetitividad_por_compas(filas, indice.numeros[ini:fin], LONGITUD_MOTIVO)
+
+    for j, i in enumerate(range(ini, fin)):
+        tramo = filas[inicios[i]:fines[i]]
+        alturas = tramo["altura"]
+        fila = valores[j]
+        fila[0] = len(tramo)
+        if len(alturas) > 1:
+            fila[1] = round(np.var(alturas), 2)
+        if alturas.size:
+            rango = int(alturas.max()) - int(alturas.min())
+            fila[2] = round(np.unique(alturas).size / (rango + 1), 3)
+            fila[4] = round(np.std(tramo["onset_compas"]), 3)
+        misma_parte = tramo["parte"][1:] == tramo["parte"][:-1]
+        intervalos = np.abs(np.diff(alturas.astype(np.int64)))[misma_parte]
+        if intervalos.size:
+            fila[5] = round(np.std(intervalos), 3)
+        fila[6] = _entropia(alturas, bins=24)
+        fila[7] = _entropia(tramo["duracion"], bins=16)
+        fila[8] = _entropia(elementos["duracion"][inicios_el[i]:fines_el[i]], bins=8)
+        fila[9] = len(acordes_por_compas[j])
+        fila[10] = _entropia_armonica(acordes_por_compas[j])
+        fila[11] = round(np.mean(fila[[6, 7, 10]]), 3)
+        yield i, fila
+
+
+def construir_matriz(score, midi, instrumentos_seleccionados=None):
+    indice = indice_compases(score)
+    valores = np.zeros((len(indice), len(COLUMNAS)), dtype=np.float64)
+    for _ in _calcular_filas(score, midi, instrumentos_seleccionados, valores):
+        pass
+    return MatrizCompases(indice.numeros, indice.duraciones, valores)
+
+
+_matrices = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _clave(instrumentos_seleccionados):
+    return tuple(instrumentos_seleccionados) if instrumentos_seleccionados else None
+
+
+def recorrer_matriz(score, midi, instrumentos_seleccionados=None, ventana=None):
+    """
+    Genera (i, fila) compás a compás, solo para los compases de la ventana si
+    se indica. Si la matriz ya está calculada se lee de ella; si no, se
+    calcula sobre la marcha y, cuando abarca toda la obra, se guarda al
+    terminar.
+    """
+    clave = _clave(instrumentos_seleccionados)
+    indice = indice_compases(score)
+    ini, fin = indice.rango(ventana)
+    with _lock:
+        matriz = _matrices.get(score, {}).get(clave)
+    if matriz is not None:
+        for i in range(ini, fin):
+            yield i, matriz.valores[i]
+        return
+
+    valores = np.zeros((fin - ini, len(COLUMNAS)), dtype=np.float64)
+    yield from _calcular_filas(score, midi, instrumentos_seleccionados, valores, ventana)
+    if (ini, fin) != (0, len(indice)):
+        return
+    with _lock:
+        _matrices.setdefault(score, {}).setdefault(clave, MatrizCompases(indice.numeros, indice.duraciones, valores))
+
+
+def matriz_compases(score, midi, instrumentos_seleccionados=None):
+    """
+    Matriz de métricas por compás, calculada una sola vez por (score,
+    subconjunto de instrumentos).
+    """
+    clave = _clave(instrumentos_seleccionados)
+    with _lock:
+        matriz = _matrices.get(score, {}).get(clave)
+    if matriz is None:
+        matriz = construir_matriz(score, midi, instrumentos_seleccionados)
+        with _lock:
+            matriz = _matrices.setdefault(score, {}).setdefault(clave, matriz)
+    return matriz
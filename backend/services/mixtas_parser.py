@@ -1,45 +1,40 @@
 import pretty_midi
 import numpy as np
-from music21 import converter, note, chord, stream
+from music21 import stream
+from backend.services.cache_partituras import cargar_partitura
+from backend.services.cache_resultados import con_cache
+from backend.services.tabla_notas import tabla_notas, ELEMENTOS
+from backend.services.acordes import acordes, acordes_ventana
+from backend.services.indice_compases import indice_compases, actividad_midi_por_compas
+from backend.services.ngramas import repetitividad_partes, repetitividad_por_compas
 
 def carga_score(midi_path):
-    return converter.parse(midi_path)
+    return cargar_partitura(midi_path)[0]
 
 def carga_midi(midi_path):
-    return pretty_midi.PrettyMIDI(midi_path)
+    return cargar_partitura(midi_path)[1]
 
 def compases(score):
     if not score.parts:
         return []
     return list(score.parts[0].getElementsByClass(stream.Measure))
 
-def notas_por_compas(score, instrumentos_seleccionados=None):
-    resultados_por_compas = []
-    for i, m in enumerate(compases(score)):
-        notas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                notas.extend([n for n in compas_parte.notes if isinstance(n, note.Note)])
-        resultados_por_compas.append({f"compas #{i+1}": len(notas)})
-    return resultados_por_compas
+def notas_por_compas(score, instrumentos_seleccionados=None, ventana=None):
+    indice = indice_compases(score)
+    conteos = indice.conteos(instrumentos_seleccionados, ventana=ventana)
+    return [{f"compas #{i+1}": int(c)} for i, c in enumerate(conteos, start=indice.rango(ventana)[0])]
 
 def promedio_notas_por_compas(score, instrumentos_seleccionados=None):
     cantidades_raw = [list(d.values())[0] for d in notas_por_compas(score, instrumentos_seleccionados)]
     return float(round(np.mean(cantidades_raw), 2)) if cantidades_raw else 0.0
 
-def varianza_notas_por_compas(score, instrumentos_seleccionados=None):
+def varianza_notas_por_compas(score, instrumentos_seleccionados=None, ventana=None):
     resultados_por_compas = []
-    for i, m in enumerate(compases(score)):
-        notas_midi_en_compas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                notas_midi_en_compas.extend([n.pitch.midi for n in compas_parte.notes if isinstance(n, note.Note)])
+    indice = indice_compases(score)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados)
+    desde, hasta = indice.rango(ventana)
+    for i, (ini, fin) in enumerate(zip(inicios[desde:hasta], fines[desde:hasta]), start=desde):
+        notas_midi_en_compas = filas["altura"][ini:fin]
         if len(notas_midi_en_compas) > 1:
             varianza = float(round(np.var(notas_midi_en_compas), 2))
         else:
@@ -47,17 +42,15 @@ def varianza_notas_por_compas(score, instrumentos_seleccionados=None):
         resultados_por_compas.append({f"compas #{i+1}": varianza})
     return resultados_por_compas
 
-def entropia_duracion_por_compas(score, instrumentos_seleccionados=None):
+def entropia_duracion_por_compas(score, instrumentos_seleccionados=None, ventana=None):
     resultados_por_compas = []
-    for i, m in enumerate(compases(score)):
-        duraciones_en_compas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                duraciones_en_compas.extend([n.quarterLength for n in compas_parte.notes if hasattr(n, 'quarterLength')])
-        if not duraciones_en_compas:
+    # Cualquier elemento con duración (notas, acordes, sin altura), como en `compas.notes`
+    indice = indice_compases(score)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados, tipos=ELEMENTOS)
+    desde, hasta = indice.rango(ventana)
+    for i, (ini, fin) in enumerate(zip(inicios[desde:hasta], fines[desde:hasta]), start=desde):
+        duraciones_en_compas = filas["duracion"][ini:fin]
+        if not duraciones_en_compas.size:
             entropia = 0.0
         else:
             hist, _ = np.histogram(duraciones_en_compas, bins=8)
@@ -77,83 +70,40 @@ def entropia_duracion_por_compas(score, instrumentos_seleccionados=None):
     return resultados_por_compas
 
 def compacidad_melodica(score, instrumentos_seleccionados=None):
-    alturas = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        alturas.extend([n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)])
-    if not alturas:
+    alturas = tabla_notas(score).seleccion(instrumentos_seleccionados)["altura"]
+    if not alturas.size:
         return 0.0
-    rango = max(alturas) - min(alturas) if alturas else 0
-    return float(round(len(set(alturas)) / (rango + 1), 3))
+    rango = int(alturas.max()) - int(alturas.min())
+    return float(round(np.unique(alturas).size / (rango + 1), 3))
 
-def compacidad_melodica_por_compas(score, instrumentos_seleccionados=None):
+def compacidad_melodica_por_compas(score, instrumentos_seleccionados=None, ventana=None):
     resultados = []
-    for i, m in enumerate(compases(score)):
-        alturas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                alturas.extend([n.pitch.midi for n in compas_parte.notes if isinstance(n, note.Note)])
-        if not alturas:
+    indice = indice_compases(score)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados)
+    desde, hasta = indice.rango(ventana)
+    for i, (ini, fin) in enumerate(zip(inicios[desde:hasta], fines[desde:hasta]), start=desde):
+        alturas = filas["altura"][ini:fin]
+        if not alturas.size:
             valor = 0.0
         else:
-            rango = max(alturas) - min(alturas) if alturas else 0
-            valor = float(round(len(set(alturas)) / (rango + 1), 3))
+            rango = int(alturas.max()) - int(alturas.min())
+            valor = float(round(np.unique(alturas).size / (rango + 1), 3))
         resultados.append({f"compas #{i+1}": valor})
     return resultados
 
 def repetitividad_motívica(score, n=3, instrumentos_seleccionados=None):
-    motivos_conteo = {}
-    partes = score.parts
-    if instrumentos_seleccionados:
-        partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-
-    for p in partes:
-        notas = [n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)]
-        for i in range(len(notas) - n + 1):
-            motivo = tuple(notas[i:i+n])
-            motivos_conteo[motivo] = motivos_conteo.get(motivo, 0) + 1
-
-    total_motivos = sum(motivos_conteo.values())
-    if total_motivos == 0:
-        return 0.0
-    repetidos = sum(count for count in motivos_conteo.values() if count > 1)
-    return float(round(repetidos / total_motivos, 3))
+    return repetitividad_partes(tabla_notas(score).seleccion(instrumentos_seleccionados), n)
 
-def repetitividad_motívica_por_compas(score, n=3, instrumentos_seleccionados=None):
-    resultados = []
-    for i, m in enumerate(compases(score)):
-        motivos_conteo = {}
-        partes = score.parts
-        if instrumentos_seleccionados:
-            partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-        for p in partes:
-            compas_parte = p.measure(m.number)
-            if not compas_parte:
-                continue
-            notas = [n.pitch.midi for n in compas_parte.notes if isinstance(n, note.Note)]
-            for j in range(len(notas) - n + 1):
-                motivo = tuple(notas[j:j+n])
-                motivos_conteo[motivo] = motivos_conteo.get(motivo, 0) + 1
-        total_motivos = sum(motivos_conteo.values())
-        if total_motivos == 0:
-            valor = 0.0
-        else:
-            repetidos = sum(count for count in motivos_conteo.values() if count > 1)
-            valor = float(round(repetidos / total_motivos, 3))
-        resultados.append({f"compas #{i+1}": valor})
-    return resultados
+def repetitividad_motívica_por_compas(score, n=3, instrumentos_seleccionados=None, ventana=None):
+    indice = indice_compases(score)
+    filas, _, _ = indice.segmentos(instrumentos_seleccionados)
+    desde, hasta = indice.rango(ventana)
+    valores = repetitividad_por_compas(filas, indice.numeros[desde:hasta], n)
+    return [{f"compas #{i+1}": valor} for i, valor in enumerate(valores, start=desde)]
 
 def entropia_melodica(score, instrumentos_seleccionados=None):
-    alturas = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        alturas.extend([n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)])
-    if not alturas:
+    alturas = tabla_notas(score).seleccion(instrumentos_seleccionados)["altura"]
+    if not alturas.size:
         return 0.0
     hist = np.histogram(alturas, bins=24)[0]
     prob = hist / np.sum(hist)
@@ -162,12 +112,8 @@ def entropia_melodica(score, instrumentos_seleccionados=None):
     return float(round(entropia, 3))
 
 def entropia_ritmica(score, instrumentos_seleccionados=None):
-    duraciones = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        duraciones.extend([n.quarterLength for n in p.flat.notes if isinstance(n, note.Note)])
-    if not duraciones:
+    duraciones = tabla_notas(score).seleccion(instrumentos_seleccionados)["duracion"]
+    if not duraciones.size:
         return 0.0
     hist = np.histogram(duraciones, bins=16)[0]
     prob = hist / np.sum(hist)
@@ -176,16 +122,8 @@ def entropia_ritmica(score, instrumentos_seleccionados=None):
     return float(round(entropia, 3))
 
 def entropia_armonica(score, instrumentos_seleccionados=None):
-    partes = score.parts
-    if instrumentos_seleccionados:
-        partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-    if not partes:
-        return 0.0
-    score_chord = stream.Score()
-    for p in partes:
-        score_chord.append(p)
-    acordes = score_chord.chordify().recurse().getElementsByClass(chord.Chord)
-    nombres_acordes = [c.pitchedCommonName for c in acordes if c.pitchedCommonName]
+    secuencia = acordes(score, instrumentos_seleccionados)
+    nombres_acordes = secuencia.nombres_validos()
     if not nombres_acordes:
         return 0.0
     letras = [ord(a[0]) for a in nombres_acordes if a]
@@ -196,45 +134,30 @@ def entropia_armonica(score, instrumentos_seleccionados=None):
     return float(round(entropia, 3))
 
 def densidad_armonica(score):
-    compases_del_score = compases(score) # Renombrado de variable local
-    if not compases_del_score:
+    compases_del_score = indice_compases(score) # Renombrado de variable local
+    if not len(compases_del_score):
         return 0.0
-    score_chord = score.chordify()
-    acordes = score_chord.recurse().getElementsByClass(chord.Chord)
-    total_acordes = len(acordes)
+    total_acordes = len(acordes(score))
     densidad = total_acordes / len(compases_del_score) # Usar la variable renombrada
     return float(round(densidad, 3))
 
-def densidad_armonica_por_compas(score, instrumentos_seleccionados=None):
+def densidad_armonica_por_compas(score, instrumentos_seleccionados=None, ventana=None):
     resultados = []
-    compases_lista = compases(score)
-    for i, m in enumerate(compases_lista):
-        score_chord = stream.Score()
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                score_chord.append(compas_parte)
-        acordes = score_chord.chordify().recurse().getElementsByClass(chord.Chord)
-        densidad = len(acordes)
+    indice = indice_compases(score)
+    desde, hasta = indice.rango(ventana)
+    acordes_por_compas = acordes_ventana(score, instrumentos_seleccionados, ventana).por_compas(indice.numeros[desde:hasta])
+    for i, acordes_compas in enumerate(acordes_por_compas, start=desde):
+        densidad = len(acordes_compas)
         resultados.append({f"compas #{i+1}": densidad})
     return resultados
 
-def entropia_armonica_por_compas(score, instrumentos_seleccionados=None):
+def entropia_armonica_por_compas(score, instrumentos_seleccionados=None, ventana=None):
     resultados = []
-    compases_lista = compases(score)
-    for i, m in enumerate(compases_lista):
-        partes = score.parts
-        if instrumentos_seleccionados:
-            partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-        score_chord = stream.Score()
-        for p in partes:
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                score_chord.append(compas_parte)
-        acordes = score_chord.chordify().recurse().getElementsByClass(chord.Chord)
-        nombres_acordes = [c.pitchedCommonName for c in acordes if c.pitchedCommonName]
+    indice = indice_compases(score)
+    desde, hasta = indice.rango(ventana)
+    acordes_por_compas = acordes_ventana(score, instrumentos_seleccionados, ventana).por_compas(indice.numeros[desde:hasta])
+    for i, acordes_compas in enumerate(acordes_por_compas, start=desde):
+        nombres_acordes = [a for a in acordes_compas if a]
         if not nombres_acordes:
             entropia = 0.0
         else:
@@ -242,7 +165,6 @@ def entropia_armonica_por_compas(score, instrumentos_seleccionados=None):
             hist = np.histogram(letras, bins=12)[0]
             prob = hist / np.sum(hist) if np.sum(hist) > 0 else np.zeros_like(hist)
             prob = prob[prob > 0]
-            # INICIO DE CÓDIGO A INSERTAR/MODIFICAR
             if prob.size == 0: # Añadido: Manejar caso de prob vacío
                 entropia = 0.0
             else:
@@ -262,47 +184,34 @@ def sincronizacion_entrada(midi, instrumentos_seleccionados=None):
         return 0.0
     return float(round(np.std(tiempos), 3))
 
-def sincronizacion_entrada_por_compas(score, midi, instrumentos_seleccionados=None):
+def sincronizacion_entrada_por_compas(score, midi, instrumentos_seleccionados=None, ventana=None):
     resultados = []
-    compases_lista = compases(score)
-    for i, m in enumerate(compases_lista):
-        tiempos = []
-        for inst in midi.instruments:
-            nombre = inst.name.strip() or pretty_midi.program_to_instrument_name(inst.program)
-            if instrumentos_seleccionados and nombre not in instrumentos_seleccionados:
-                continue
-            notas_en_compas = [n for n in inst.notes if m.offset <= n.start < m.offset + m.duration.quarterLength]
-            if notas_en_compas:
-                tiempos.append(notas_en_compas[0].start)
-        if not tiempos:
-            valor = 0.0
-        else:
-            valor = float(round(np.std(tiempos), 3))
-        resultados.append({f"compas #{i+1}": valor})
+    desde, _ = indice_compases(score).rango(ventana)
+    entradas, _ = actividad_midi_por_compas(score, midi, instrumentos_seleccionados, ventana)
+    # Desviación estándar, por compás, del primer ataque de cada instrumento que toca
+    tocan = ~np.isnan(entradas)
+    cantidad = tocan.sum(axis=0)
+    media = np.nansum(entradas, axis=0) / np.maximum(cantidad, 1)
+    desviacion = np.sqrt(np.nansum((entradas - media) ** 2, axis=0) / np.maximum(cantidad, 1))
+    for j, valor in enumerate(desviacion):
+        resultados.append({f"compas #{desde+j+1}": float(round(valor, 3)) if cantidad[j] else 0.0})
     return resultados
 
 def dispersión_temporal(score, instrumentos_seleccionados=None):
-    offsets = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        offsets.extend([n.offset for n in p.flat.notes if isinstance(n, note.Note)])
-    if not offsets:
+    offsets = tabla_notas(score).seleccion(instrumentos_seleccionados)["onset"]
+    if not offsets.size:
         return 0.0
     return float(round(np.std(offsets), 3))
 
-def dispersion_temporal_por_compas(score, instrumentos_seleccionados=None):
+def dispersion_temporal_por_compas(score, instrumentos_seleccionados=None, ventana=None):
     resultados = []
-    compases_lista = compases(score)
-    for i, m in enumerate(compases_lista):
-        offsets = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                offsets.extend([n.offset for n in compas_parte.notes if isinstance(n, note.Note)])
-        if not offsets:
+    indice = indice_compases(score)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados)
+    desde, hasta = indice.rango(ventana)
+    for i, (ini, fin) in enumerate(zip(inicios[desde:hasta], fines[desde:hasta]), start=desde):
+        # Offsets relativos al compás, como `n.offset` dentro de `compas_parte.notes`
+        offsets = filas["onset_compas"][ini:fin]
+        if not offsets.size:
             valor = 0.0
         else:
             valor = float(round(np.std(offsets), 3))
@@ -325,72 +234,62 @@ def promedio_rango_dinamico(midi, total_compases, instrumentos_seleccionados=Non
         return 0.0
     return float(round(np.mean(rangos), 3))
 
-def promedio_rango_dinamico_por_compas(midi, score, instrumentos_seleccionados=None):
+def promedio_rango_dinamico_por_compas(midi, score, instrumentos_seleccionados=None, ventana=None):
     resultados = []
-    compases_lista = compases(score)
-    for m in compases_lista:
-        rangos = []
-        for inst in midi.instruments:
-            nombre = inst.name.strip() or pretty_midi.program_to_instrument_name(inst.program)
-            if instrumentos_seleccionados and nombre not in instrumentos_seleccionados:
-                continue
-            notas_en_compas = [n for n in inst.notes if m.offset <= n.start < m.offset + m.duration.quarterLength]
-            if notas_en_compas:
-                velocities = [n.velocity for n in notas_en_compas]
-                rango = max(velocities) - min(velocities)
-                rangos.append(rango)
-        if not rangos:
-            valor = 0.0
-        else:
-            valor = float(round(np.mean(rangos), 3))
-        resultados.append({f"compas #{m.number}": valor})
+    indice = indice_compases(score)
+    desde, hasta = indice.rango(ventana)
+    _, rangos = actividad_midi_por_compas(score, midi, instrumentos_seleccionados, ventana)
+    cantidad = (~np.isnan(rangos)).sum(axis=0)
+    promedio = np.nansum(rangos, axis=0) / np.maximum(cantidad, 1)
+    for numero, valor, n in zip(indice.numeros[desde:hasta], promedio, cantidad):
+        resultados.append({f"compas #{numero}": float(round(valor, 3)) if n else 0.0})
     return resultados
 
 def variabilidad_intervalica(score, instrumentos_seleccionados=None):
-    intervalos = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        notas = [n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)]
-        intervalos.extend([abs(notas[i+1] - notas[i]) for i in range(len(notas)-1)])
-    if not intervalos:
+    filas = tabla_notas(score).seleccion(instrumentos_seleccionados)
+    # Intervalos entre notas consecutivas de una misma parte
+    misma_parte = filas["parte"][1:] == filas["parte"][:-1]
+    intervalos = np.abs(np.diff(filas["altura"].astype(np.int64)))[misma_parte]
+    if not intervalos.size:
         return 0.0
     return float(round(np.std(intervalos), 3))
 
-def variabilidad_intervalica_por_compas(score, instrumentos_seleccionados=None):
+def variabilidad_intervalica_por_compas(score, instrumentos_seleccionados=None, ventana=None):
     resultados = []
-    compases_lista = compases(score)
-    for m in compases_lista:
-        intervalos = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                notas = [n.pitch.midi for n in compas_parte.notes if isinstance(n, note.Note)]
-                intervalos.extend([abs(notas[i+1] - notas[i]) for i in range(len(notas)-1)])
-        if not intervalos:
+    indice = indice_compases(score)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados)
+    desde, hasta = indice.rango(ventana)
+    for i, (ini, fin) in enumerate(zip(inicios[desde:hasta], fines[desde:hasta]), start=desde):
+        tramo = filas[ini:fin]
+        # Intervalos entre notas consecutivas de una misma parte dentro del compás
+        misma_parte = tramo["parte"][1:] == tramo["parte"][:-1]
+        intervalos = np.abs(np.diff(tramo["altura"].astype(np.int64)))[misma_parte]
+        if not intervalos.size:
             valor = 0.0
         else:
             valor = float(round(np.std(intervalos), 3))
-        resultados.append({f"compas #{m.number}": valor})
+        resultados.append({f"compas #{indice.numeros[i]}": valor})
     return resultados
 
-def entropia_compuesta_por_compas(score, instrumentos_seleccionados=None):
+def _entropia_histograma(valores, bins):
+    if not len(valores):
+        return 0.0
+    hist = np.histogram(valores, bins=bins)[0]
+    prob = hist / np.sum(hist)
+    prob = prob[prob > 0]
+    return float(round(-np.sum(prob * np.log2(prob)), 3))
+
+def entropia_compuesta_por_compas(score, instrumentos_seleccionados=None, ventana=None):
     resultados = []
-    compases_lista = compases(score)
-    for i, m in enumerate(compases_lista):
-        score_compas = stream.Score()
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                score_compas.append(compas_parte)
-
-        em = entropia_melodica(score_compas, instrumentos_seleccionados=instrumentos_seleccionados)
-        er = entropia_ritmica(score_compas, instrumentos_seleccionados=instrumentos_seleccionados)
-        ea = entropia_armonica(score_compas, instrumentos_seleccionados=instrumentos_seleccionados)
+    indice = indice_compases(score)
+    filas, inicios, fines = indice.segmentos(instrumentos_seleccionados)
+    desde, hasta = indice.rango(ventana)
+    armonicas = entropia_armonica_por_compas(score, instrumentos_seleccionados, ventana)
+    for i, (ini, fin) in enumerate(zip(inicios[desde:hasta], fines[desde:hasta]), start=desde):
+        tramo = filas[ini:fin]
+        em = _entropia_histograma(tramo["altura"], bins=24)
+        er = _entropia_histograma(tramo["duracion"], bins=16)
+        ea = armonicas[i - desde][f"compas #{i+1}"]
         valores = [v for v in [em, er, ea] if isinstance(v, (int, float)) and np.isfinite(v)]
         entropia_compuesta = float(round(np.mean(valores), 3)) if valores else 0.0
         
@@ -400,17 +299,18 @@ def entropia_compuesta_por_compas(score, instrumentos_seleccionados=None):
 def contrapunto_activo_instrumento(score):
 
     resultados = {}
-    instrumentos = [p.partName for p in score.parts if p.partName]
+    tabla = tabla_notas(score)
+    instrumentos = [nombre for nombre in tabla.nombres_partes if nombre]
     for instrumento in instrumentos:
-        partes = [p for p in score.parts if p.partName == instrumento]
+        partes = tabla.por_parte([instrumento])
         if len(partes) < 2:
             resultados[instrumento] = 0.0
             continue
 
         entropias = []
-        for p in partes:
-            notas = [n.pitch.midi for n in p.flatten().notes if isinstance(n, note.Note)]
-            if notas:
+        for _, filas in partes:
+            notas = filas["altura"]
+            if notas.size:
                 hist = np.histogram(notas, bins=12)[0]
                 suma = np.sum(hist)
                 if suma == 0:
@@ -431,15 +331,17 @@ def contrapunto_activo_instrumento(score):
 
 def complejidad_total(score):
 
-    from backend.services.parser import entropia_melodica, entropia_ritmica, entropia_armonica, entropia_interaccion
+    from backend.services.parser import perfil_entropias
 
+    # Siempre ha usado las entropías de `parser`, no las de este módulo
     resultados = {}
-    instrumentos = [p.partName for p in score.parts if p.partName]
+    instrumentos = [nombre for nombre in tabla_notas(score).nombres_partes if nombre]
     for instrumento in instrumentos:
-        em = entropia_melodica(score, instrumentos_seleccionados=[instrumento])
-        er = entropia_ritmica(score, instrumentos_seleccionados=[instrumento])
-        ea = entropia_armonica(score, instrumentos_seleccionados=[instrumento])
-        ei = entropia_interaccion(score, instrumentos_seleccionados=[instrumento])
+        perfil = perfil_entropias(score, [instrumento])
+        em = perfil["entropia_melodica"]
+        er = perfil["entropia_ritmica"]
+        ea = perfil["entropia_armonica"]
+        ei = perfil["entropia_interaccion"]
 
         valores = [v for v in [em, er, ea, ei] if isinstance(v, (int, float)) and np.isfinite(v)]
         if not valores:
@@ -448,55 +350,126 @@ def complejidad_total(score):
             resultados[instrumento] = round(float(sum(valores)), 3)
     return resultados
 
-def seccion_aurea_por_compas(score):
+def seccion_aurea_por_compas(score, ventana=None):
 
     resultados = []
     if not score.parts:
         return resultados
-    compases_lista = score.parts[0].getElementsByClass(stream.Measure)
+    desde, hasta = indice_compases(score).rango(ventana)
+    compases_lista = list(score.parts[0].getElementsByClass(stream.Measure))[desde:hasta]
     for m in compases_lista:
         duracion_compas = m.duration.quarterLength
         punto_seccion_aurea = duracion_compas * 0.618
         resultados.append({f"compas #{m.number}": round(punto_seccion_aurea, 3)})
     return resultados
 
-def analizar_mixtas(midi_path, instrumentos_seleccionados=None):
+def analizar_mixtas(midi_path, instrumentos_seleccionados=None, ventana=None):
+    return con_cache(
+        "analizar_mixtas",
+        midi_path,
+        {"instrumentos": instrumentos_seleccionados or [], "ventana": ventana},
+        lambda: _analizar_mixtas(midi_path, instrumentos_seleccionados, ventana)
+    )
+
+def _analizar_mixtas(midi_path, instrumentos_seleccionados=None, ventana=None):
     score = carga_score(midi_path)
     midi = carga_midi(midi_path)
-    total_compases = len(compases(score))
 
+    return {
+        **resumen_mixtas(score, midi, instrumentos_seleccionados),
+        "varianza_notas_por_compas": varianza_notas_por_compas(score, instrumentos_seleccionados, ventana),
+        "seccion_aurea_por_compas": seccion_aurea_por_compas(score, ventana),
+        "entropia_duracion": entropia_duracion_por_compas(score, instrumentos_seleccionados, ventana),  # Nota: aquí usamos la función por compás para global también
+        "cantidad_notas_por_compas": notas_por_compas(score, instrumentos_seleccionados, ventana),
+        "compacidad_melodica_por_compas": compacidad_melodica_por_compas(score, instrumentos_seleccionados, ventana),
+        "repetitividad_motívica_por_compas": repetitividad_motívica_por_compas(score, n=3, instrumentos_seleccionados=instrumentos_seleccionados, ventana=ventana),
+        "entropia_duracion_por_compas": entropia_duracion_por_compas(score, instrumentos_seleccionados, ventana),
+        "entropia_armonica_por_compas": entropia_armonica_por_compas(score, instrumentos_seleccionados, ventana),
+        "densidad_armonica_por_compas": densidad_armonica_por_compas(score, instrumentos_seleccionados, ventana),
+        "sincronizacion_entrada_por_compas": sincronizacion_entrada_por_compas(score, midi, instrumentos_seleccionados, ventana),
+        "dispersión_temporal_por_compas": dispersion_temporal_por_compas(score, instrumentos_seleccionados, ventana),
+        "promedio_rango_dinamico_por_compas": promedio_rango_dinamico_por_compas(midi, score, instrumentos_seleccionados, ventana),
+        "variabilidad_intervalica_por_compas": variabilidad_intervalica_por_compas(score, instrumentos_seleccionados, ventana),
+        "entropia_compuesta_por_compas": entropia_compuesta_por_compas(score, instrumentos_seleccionados, ventana)
+    }
+
+# Métricas por compás de `analizar_mixtas` y su columna en la matriz de compases
+COLUMNAS_MIXTAS_POR_COMPAS = {
+    "varianza_notas_por_compas": "varianza_notas",
+    "seccion_aurea_por_compas": "seccion_aurea",
+    "cantidad_notas_por_compas": "notas",
+    "compacidad_melodica_por_compas": "compacidad_melodica",
+    "repetitividad_motívica_por_compas": "repetitividad_motivica",
+    "entropia_duracion_por_compas": "entropia_duracion",
+    "entropia_armonica_por_compas": "entropia_armonica",
+    "densidad_armonica_por_compas": "densidad_armonica",
+    "sincronizacion_entrada_por_compas": "sincronizacion_entrada",
+    "dispersión_temporal_por_compas": "dispersion_temporal",
+    "promedio_rango_dinamico_por_compas": "promedio_rango_dinamico",
+    "variabilidad_intervalica_por_compas": "variabilidad_intervalica",
+    "entropia_compuesta_por_compas": "entropia_compuesta",
+}
+
+def perfil_entropias_mixtas(score, instrumentos_seleccionados=None):
+    """
+    Entropías melódica, rítmica y armónica de este módulo, con -sum(p log2 p)
+    exacto (las de `parser` suman 1e-9 a p), memoizadas como `perfil_entropias`.
+    """
+    from backend.services.parser import memoizar_perfil
+
+    clave = ("mixtas", tuple(instrumentos_seleccionados) if instrumentos_seleccionados else None)
+    return memoizar_perfil(score, clave, lambda: {
+        "entropia_melodica": entropia_melodica(score, instrumentos_seleccionados),
+        "entropia_ritmica": entropia_ritmica(score, instrumentos_seleccionados),
+        "entropia_armonica": entropia_armonica(score, instrumentos_seleccionados)
+    })
+
+def resumen_mixtas(score, midi, instrumentos_seleccionados=None):
+    """
+    Métricas de `analizar_mixtas` que son un único valor para todo el archivo.
+    """
+    perfil = perfil_entropias_mixtas(score, instrumentos_seleccionados)
     return {
         "promedio_notas_por_compas": promedio_notas_por_compas(score, instrumentos_seleccionados),
-        "varianza_notas_por_compas": varianza_notas_por_compas(score, instrumentos_seleccionados),
-        "promedio_rango_dinamico": promedio_rango_dinamico(midi, total_compases, instrumentos_seleccionados),
+        "promedio_rango_dinamico": promedio_rango_dinamico(midi, len(indice_compases(score)), instrumentos_seleccionados),
         "contrapunto_activo_instrumento": contrapunto_activo_instrumento(score),
         "complejidad_total_por_instrumentos": complejidad_total(score),
-        "seccion_aurea_por_compas": seccion_aurea_por_compas(score),
         "densidad_armonica": densidad_armonica(score),
         "variabilidad_intervalica": variabilidad_intervalica(score, instrumentos_seleccionados),
-        "entropia_duracion": entropia_duracion_por_compas(score, instrumentos_seleccionados),  # Nota: aquí usamos la función por compás para global también
         "sincronizacion_entrada": sincronizacion_entrada(midi, instrumentos_seleccionados),
         "dispersión_temporal": dispersión_temporal(score, instrumentos_seleccionados),
         "compacidad_melodica": compacidad_melodica(score, instrumentos_seleccionados),
         "repetitividad_motívica": repetitividad_motívica(score, n=3, instrumentos_seleccionados=instrumentos_seleccionados),
-        "entropia_melodica": entropia_melodica(score, instrumentos_seleccionados),
-        "entropia_ritmica": entropia_ritmica(score, instrumentos_seleccionados),
-        "entropia_armonica": entropia_armonica(score, instrumentos_seleccionados),
+        "entropia_melodica": perfil["entropia_melodica"],
+        "entropia_ritmica": perfil["entropia_ritmica"],
+        "entropia_armonica": perfil["entropia_armonica"],
         "entropia_compuesta": float(round(
             np.mean([
-                entropia_melodica(score, instrumentos_seleccionados),
-                entropia_ritmica(score, instrumentos_seleccionados),
-                entropia_armonica(score, instrumentos_seleccionados)
+                perfil["entropia_melodica"],
+                perfil["entropia_ritmica"],
+                perfil["entropia_armonica"]
             ]), 3)),
-        "cantidad_notas_por_compas": notas_por_compas(score, instrumentos_seleccionados),
-        "compacidad_melodica_por_compas": compacidad_melodica_por_compas(score, instrumentos_seleccionados),
-        "repetitividad_motívica_por_compas": repetitividad_motívica_por_compas(score, n=3, instrumentos_seleccionados=instrumentos_seleccionados),
-        "entropia_duracion_por_compas": entropia_duracion_por_compas(score, instrumentos_seleccionados),
-        "entropia_armonica_por_compas": entropia_armonica_por_compas(score, instrumentos_seleccionados),
-        "densidad_armonica_por_compas": densidad_armonica_por_compas(score, instrumentos_seleccionados),
-        "sincronizacion_entrada_por_compas": sincronizacion_entrada_por_compas(score, midi, instrumentos_seleccionados),
-        "dispersión_temporal_por_compas": dispersion_temporal_por_compas(score, instrumentos_seleccionados),
-        "promedio_rango_dinamico_por_compas": promedio_rango_dinamico_por_compas(midi, score, instrumentos_seleccionados),
-        "variabilidad_intervalica_por_compas": variabilidad_intervalica_por_compas(score, instrumentos_seleccionados),
-        "entropia_compuesta_por_compas": entropia_compuesta_por_compas(score, instrumentos_seleccionados)
-    }
\ No newline at end of file
+    }
+
+def mixtas_en_flujo(midi_path, instrumentos_seleccionados=None, ventana=None):
+    """
+    Genera las métricas mixtas de un archivo como registros: un `resumen` con
+    los valores globales y un `compas` por compás (de la ventana, si se indica)
+    con los valores por compás.
+    """
+    from backend.services.matriz_compases import recorrer_matriz, COLUMNAS
+
+    score, midi = cargar_partitura(midi_path)
+    yield {"tipo": "resumen", "mixtas": resumen_mixtas(score, midi, instrumentos_seleccionados)}
+    columnas = {clave: COLUMNAS.index(columna) for clave, columna in COLUMNAS_MIXTAS_POR_COMPAS.items()}
+    numeros = indice_compases(score).numeros
+    total = 0
+    for i, fila in recorrer_matriz(score, midi, instrumentos_seleccionados, ventana):
+        total += 1
+        yield {
+            "tipo": "compas",
+            "numero": i + 1,
+            "compas": int(numeros[i]),
+            "metricas": {clave: float(fila[j]) for clave, j in columnas.items()}
+        }
+    yield {"tipo": "fin", "compases": total}
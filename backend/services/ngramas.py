@@ -0,0 +1,150 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Una altura MIDI (0..127) ocupa 7 bits: caben 9 en un entero de 64 bits
+BITS_ALTURA = 7
+LONGITUD_EMPAQUETABLE = 63 // BITS_ALTURA
+
+
+def _empaquetables(valores, n):
+    return n <= LONGITUD_EMPAQUETABLE and (
+        valores.size == 0 or (valores.min() >= 0 and valores.max() < 1 << BITS_ALTURA)
+    )
+
+
+def empaquetar_ngramas(valores, n):
+    """
+    Código entero de cada ventana de n valores consecutivos de 0..127, 7 bits
+    por valor con el primero en los más altos: el mismo n-grama tiene el mismo
+    código en cualquier parte u obra (y en el índice de motivos).
+    """
+    valores = np.asarray(valores, dtype=np.int64)
+    if not _empaquetables(valores, n):
+        raise ValueError(f"No se pueden empaquetar n-gramas de {n} valores fuera de 0..{(1 << BITS_ALTURA) - 1}")
+    if n < 1 or len(valores) < n:
+        return np.zeros(0, dtype=np.int64)
+    pesos = np.int64(1) << (BITS_ALTURA * np.arange(n - 1, -1, -1, dtype=np.int64))
+    return sliding_window_view(valores, n) @ pesos
+
+
+def codigos_ngramas(valores, longitudes):
+    """
+    {n: código entero de cada ventana de n valores consecutivos} para todas
+    las longitudes pedidas, sin crear un objeto de Python por ventana. Las
+    alturas MIDI se empaquetan con `empaquetar_ngramas`; los valores fuera de
+    rango, o las ventanas demasiado largas, se numeran con `np.unique`.
+
+    Las longitudes se calculan en una sola pasada: solo la más corta se
+    empaqueta desde las alturas, y el código de longitud n+1 sale del de
+    longitud n desplazado más la nota siguiente.
+    """
+    valores = np.asarray(valores, dtype=np.int64)
+    codigos = {}
+    actual, n_actual = None, 0
+    for n in sorted(set(longitudes)):
+        if n < 1 or len(valores) < n:
+            codigos[n] = np.zeros(0, dtype=np.int64)
+        elif not _empaquetables(valores, n):
+            _, inversos = np.unique(sliding_window_view(valores, n), axis=0, return_inverse=True)
+            codigos[n] = inversos.reshape(-1).astype(np.int64)
+        else:
+            if actual is None:
+                actual = empaquetar_ngramas(valores, n)
+            else:
+                for k in range(n_actual, n):
+                    actual = (actual[:-1] << BITS_ALTURA) | valores[k:]
+            n_actual = n
+            codigos[n] = actual
+    return codigos
+
+
+def segmentos_por_cambio(*columnas):
+    """
+    Identificador de segmento de cada fila: empieza uno nuevo cada vez que
+    cambia alguna de las columnas (parte, compás...).
+    """
+    if not len(columnas[0]):
+        return np.zeros(0, dtype=np.int64)
+    cambio = np.zeros(len(columnas[0]), dtype=bool)
+    for columna in columnas:
+        cambio[1:] |= columna[1:] != columna[:-1]
+    return np.cumsum(cambio)
+
+
+def ngramas_en_segmentos(valores, segmentos, longitudes):
+    """
+    {n: (códigos, inicios)} de las ventanas que no cruzan de un segmento a
+    otro; `inicios` es la posición de la primera nota de cada ventana.
+    """
+    segmentos = np.asarray(segmentos)
+    salida = {}
+    for n, codigos in codigos_ngramas(valores, longitudes).items():
+        inicios = np.arange(len(codigos))
+        if len(codigos):
+            # Una ventana es válida si su primera y su última nota están en el mismo segmento
+            validas = segmentos[:len(codigos)] == segmentos[n - 1:]
+            codigos, inicios = codigos[validas], inicios[validas]
+        salida[n] = (codigos, inicios)
+    return salida
+
+
+def repetitividad(codigos):
+    """
+    Fracción de n-gramas cuyo código aparece más de una vez.
+    """
+    if not len(codigos):
+        return 0.0
+    _, conteos = np.unique(codigos, return_counts=True)
+    return float(round(int(conteos[conteos > 1].sum()) / len(codigos), 3))
+
+
+def repetitividad_por_grupo(codigos, grupos, n_grupos):
+    """
+    Repetitividad de los n-gramas de cada grupo (p. ej. cada compás) contando
+    las repeticiones solo dentro del grupo. `grupos` va de 0 a n_grupos - 1.
+    """
+    codigos = np.asarray(codigos)
+    grupos = np.asarray(grupos, dtype=np.int64)
+    totales = np.bincount(grupos, minlength=n_grupos)
+    repetidos = np.zeros(n_grupos, dtype=np.int64)
+    if len(codigos):
+        orden = np.lexsort((codigos, grupos))
+        c, g = codigos[orden], grupos[orden]
+        nuevo = np.ones(len(c), dtype=bool)
+        nuevo[1:] = (c[1:] != c[:-1]) | (g[1:] != g[:-1])
+        inicios = np.flatnonzero(nuevo)
+        longitudes = np.diff(np.append(inicios, len(c)))
+        repetidos = np.bincount(g[inicios], weights=np.where(longitudes > 1, longitudes, 0), minlength=n_grupos).astype(np.int64)
+    # `round` de Python sobre el cociente, como el cálculo original
+    return [round(int(r) / int(t), 3) if t else 0.0 for r, t in zip(repetidos, totales)]
+
+
+def repetitividad_partes(filas, n):
+    """
+    Repetitividad de los n-gramas de alturas de cada parte (filas de la tabla
+    de notas en orden de parte), sin cruzar de una parte a otra. Con varias
+    longitudes en `n` (p. ej. range(2, 9)) devuelve {n: repetitividad}.
+    """
+    longitudes = [n] if np.ndim(n) == 0 else list(n)
+    ngramas = ngramas_en_segmentos(filas["altura"], filas["parte"], longitudes)
+    if np.ndim(n) == 0:
+        return repetitividad(ngramas[n][0])
+    return {longitud: repetitividad(ngramas[longitud][0]) for longitud in longitudes}
+
+
+def repetitividad_por_compas(filas, numeros, n):
+    """
+    Repetitividad de los n-gramas de cada compás de `numeros`, contando solo
+    dentro del compás y sin cruzar de una parte a otra. `filas` son las de
+    `IndiceCompases.segmentos` (ordenadas por compás y parte).
+    """
+    filas = filas[np.isin(filas["compas"], numeros)]
+    compases, grupos = np.unique(filas["compas"], return_inverse=True)
+    segmentos = segmentos_por_cambio(filas["compas"], filas["parte"])
+    codigos, inicios = ngramas_en_segmentos(filas["altura"], segmentos, [n])[n]
+    valores = repetitividad_por_grupo(codigos, grupos[inicios], len(compases))
+    posiciones = np.searchsorted(compases, numeros)
+    return [
+        valores[p] if p < len(compases) and compases[p] == numero else 0.0
+        for p, numero in zip(posiciones.tolist(), numeros)
+    ]
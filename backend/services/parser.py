@@ -1,9 +1,19 @@
 import os
+import copy
+import threading
+import weakref
 import numpy as np
 import pretty_midi
 import numpy as np
 from collections import Counter, defaultdict
-from music21 import converter, note, chord, stream, interval, pitch
+from music21 import chord, interval, pitch
+from backend.services.cache_partituras import cargar_eventos
+from backend.services.cache_resultados import con_cache
+from backend.services.tabla_notas import tabla_notas, ELEMENTOS, NOTA
+from backend.services.indice_compases import indice_compases, subconjunto_partitura
+from backend.services.acordes import acordes
+from backend.services.intervalos import resumen_intervalos
+from backend.services.ngramas import ngramas_en_segmentos, segmentos_por_cambio
 
 def validar_metrica(valor, nombre):
     if isinstance(valor, (int, float)) and np.isfinite(valor):
@@ -12,49 +22,60 @@ def validar_metrica(valor, nombre):
     return None
 
 def instrumentos_detectados(score):
-    return [p.partName or "Parte sin nombre" for p in score.parts]
+    return [nombre or "Parte sin nombre" for nombre in tabla_notas(score).nombres_partes]
 
 def cantidad_total_notas(score):
-    total_notas = 0
-    conteo_por_nota = defaultdict(int)
-    for p in score.parts:
-        for n in p.flatten().notes:
-            if isinstance(n, note.Note):
-                total_notas += 1
-                conteo_por_nota[n.nameWithOctave] += 1
+    alturas = tabla_notas(score).seleccion()["altura"]
+    valores, primeras, conteos = np.unique(alturas, return_index=True, return_counts=True)
+    conteo_por_nota = {}
+    # Mismo orden que el recorrido original: por primera aparición
+    for i in np.argsort(primeras):
+        conteo_por_nota[pitch.Pitch(midi=int(valores[i])).nameWithOctave] = int(conteos[i])
     return {
-        "total": total_notas,
-        "por_nota": dict(conteo_por_nota)
+        "total": int(alturas.size),
+        "por_nota": conteo_por_nota
     }
 
 def seccion_aurea_por_compas(score): # Nueva función
-    resultados = []
-    if not score.parts:
-        return []
-    compases_lista = score.parts[0].getElementsByClass(stream.Measure)
-    for m in compases_lista:
-        punto_seccion_aurea_compas = m.duration.quarterLength * 0.618
-        resultados.append({f"compas #{m.number}": float(round(punto_seccion_aurea_compas, 3))})
-    return resultados
+    indice = indice_compases(score)
+    return [
+        {f"compas #{numero}": float(round(duracion * 0.618, 3))}
+        for numero, duracion in zip(indice.numeros.tolist(), indice.duraciones.tolist())
+    ]
 
 def compases_no_vacios_por_instrumento(score): # Nueva función
+    tabla = tabla_notas(score)
+    indice = indice_compases(score)
     resultados = {}
-    for p in score.parts:
-        nombre_instrumento = p.partName or "Parte sin nombre"
-        conteo_compases = 0
-        for m in p.getElementsByClass(stream.Measure):
-            # Cuenta compases que tienen al menos una nota o un silencio
-            if any(isinstance(el, (note.Note, note.Rest)) for el in m.flat.notesAndRests):
-                conteo_compases += 1
-        resultados[nombre_instrumento] = conteo_compases
+    for i, nombre in enumerate(tabla.nombres_partes):
+        # Cuenta compases de la parte que tienen al menos una nota o un silencio
+        _, offsets, duraciones = indice.rejilla_parte(i)
+        onsets = np.concatenate((
+            tabla.notas["onset"][(tabla.notas["parte"] == i) & (tabla.notas["tipo"] == NOTA)],
+            tabla.silencios["onset"][tabla.silencios["parte"] == i]
+        ))
+        posiciones = np.searchsorted(offsets, onsets, side="right") - 1
+        dentro = posiciones >= 0
+        dentro[dentro] = onsets[dentro] < offsets[posiciones[dentro]] + duraciones[posiciones[dentro]]
+        resultados[nombre or "Parte sin nombre"] = int(np.unique(posiciones[dentro]).size)
     return resultados
 
 def analizar_midi(nombre_archivo: str, instrumentos_seleccionados=None) -> dict:
+    return con_cache(
+        "analizar_midi",
+        os.path.join("uploads", nombre_archivo),
+        {"instrumentos": instrumentos_seleccionados or []},
+        lambda: _analizar_midi(nombre_archivo, instrumentos_seleccionados),
+        guardar_si=lambda resultado: "error" not in resultado
+    )
+
+def _analizar_midi(nombre_archivo: str, instrumentos_seleccionados=None) -> dict:
     ruta = os.path.join("uploads", nombre_archivo)
 
     try:
-        midi = pretty_midi.PrettyMIDI(ruta)
-        score_original = converter.parse(ruta)
+        score_original, midi_original = cargar_eventos(ruta)
+        # Copia superficial: el objeto en caché es compartido y no debe mutarse
+        midi = copy.copy(midi_original)
 
         instrumento = None
         score = score_original
@@ -66,16 +87,12 @@ def analizar_midi(nombre_archivo: str, instrumentos_seleccionados=None) -> dict:
                 inst for inst in midi.instruments if inst.name.strip().lower() in instrumentos_normalizados
             ]
 
-            partes_filtradas = [
-                p for p in score_original.parts
-                if (p.partName or "").strip().lower() in instrumentos_normalizados
+            indices_partes = [
+                i for i, nombre in enumerate(tabla_notas(score_original).nombres_partes)
+                if (nombre or "").strip().lower() in instrumentos_normalizados
             ]
-
-            score_filtrado = stream.Score()
-            for parte in partes_filtradas:
-                score_filtrado.append(parte)
-
-            score = score_filtrado
+            # Vista de las partes, sin reasignarlas a otro stream
+            score = subconjunto_partitura(score_original, indices_partes)
             if instrumentos_seleccionados and len(instrumentos_seleccionados) == 1:
                 instrumento = instrumentos_seleccionados[0]
 
@@ -95,6 +112,8 @@ def analizar_midi(nombre_archivo: str, instrumentos_seleccionados=None) -> dict:
             "motivos_recurrentes": motivos_recurrentes(score, instrumento=instrumento),
             "progresiones_armonicas": progresiones_armonicas(score, instrumento=instrumento),
             "intervalos_predominantes": intervalos_predominantes(score, instrumento=instrumento),
+            # Secuencia completa compacta; /metrics la representa como se pida
+            "intervalos_todos": intervalos_melodicos(score, instrumento=instrumento).astype(np.int16),
             "balance_dinamico": balance_dinamico(midi, instrumento=instrumento),
             "familias_instrumentales": clasificar_familias(score),
             "contrapunto_activo": validar_metrica(contrapunto_activo(score, instrumento=instrumento), "contrapunto_activo"),
@@ -120,37 +139,22 @@ def analizar_midi(nombre_archivo: str, instrumentos_seleccionados=None) -> dict:
         }
 
 def motivos_recurrentes(score, n=3, instrumento=None):
-    motivos_conteo = defaultdict(int)
-    motivos_notacion = {}
-
-    partes = score.parts
-    if instrumento:
-        partes = [p for p in partes if p.partName == instrumento]
-
-    for p in partes:
-        if not p.getElementsByClass('Measure'):
-            continue
-        
-        for m in p.getElementsByClass('Measure'):
-            notas_en_compas = [n for n in m.notes if isinstance(n, note.Note)]
-            notas_midi = [n.pitch.midi for n in notas_en_compas]
-            notas_nombre = [n.nameWithOctave for n in notas_en_compas]
-
-            for i in range(len(notas_midi) - n + 1):
-                motivo_midi = tuple(notas_midi[i:i+n])
-                motivo_nombre = tuple(notas_nombre[i:i+n])
-                clave = "-".join(str(p_midi) for p_midi in motivo_midi)
-                motivos_conteo[clave] += 1
-                if clave not in motivos_notacion:
-                    motivos_notacion[clave] = list(motivo_nombre)
+    # Notas que cuelgan directamente de cada compás (como `m.notes`), sin que
+    # los motivos crucen de un compás o de una parte a otra
+    filas = tabla_notas(score).seleccion([instrumento] if instrumento else None)
+    filas = filas[~filas["en_voz"]]
+    segmentos = segmentos_por_cambio(filas["parte"], filas["compas"])
+    codigos, inicios = ngramas_en_segmentos(filas["altura"], segmentos, [n])[n]
+    _, primeros, conteos = np.unique(codigos, return_index=True, return_counts=True)
 
     resultados = {}
-    for clave, conteo in motivos_conteo.items():
-        if conteo > 1:
-            resultados[clave] = {
-                "conteo": conteo,
-                "notacion": motivos_notacion.get(clave, [])
-            }
+    # En el orden de su primera aparición
+    for k in sorted(np.flatnonzero(conteos > 1).tolist(), key=lambda k: primeros[k]):
+        alturas = filas["altura"][inicios[primeros[k]]:inicios[primeros[k]] + n].tolist()
+        resultados["-".join(str(a) for a in alturas)] = {
+            "conteo": int(conteos[k]),
+            "notacion": [pitch.Pitch(midi=a).nameWithOctave for a in alturas]
+        }
     return resultados
 
 
@@ -192,25 +196,18 @@ def clasificar_familias(score):
                                 return instrumento_a_familia[clave]
         return "Otros"
 
-    for p in score.parts:
-        nombre = p.partName or "Parte sin nombre"
+    for nombre in tabla_notas(score).nombres_partes:
+        nombre = nombre or "Parte sin nombre"
         familia = encontrar_familia(nombre)
         familias[familia].append(nombre)
 
     return familias
 
 def progresiones_armonicas(score, instrumento=None):
-    partes = score.parts
-    if instrumento:
-        partes = [p for p in partes if p.partName == instrumento]    
-    if not partes:
+    instrumentos = [instrumento] if instrumento else None
+    if not tabla_notas(score).indices_partes(instrumentos):
         return {}
-    score_para_chordify = stream.Score()
-    for p in partes:
-        score_para_chordify.append(p)
-
-    acordes = score_para_chordify.chordify().recurse().getElementsByClass(chord.Chord)
-    nombres_acordes = [c.pitchedCommonName for c in acordes if c.pitchedCommonName]
+    nombres_acordes = acordes(score, instrumentos).nombres_validos()
 
     conteo_acordes = Counter(nombres_acordes)
 
@@ -248,40 +245,32 @@ def intervalos_predominantes(score, instrumento=None):
         nombre = nombres_intervalos.get(val_abs, f"Intervalo desconocido ({real_valor})")
         return f"{nombre} ({direccion})" if val_abs != 0 else nombre
 
-    partes = score.parts
-    if instrumento:
-        partes = [p for p in partes if p.partName == instrumento]
+    intervalos = intervalos_melodicos(score, instrumento=instrumento)
 
-    notas_midi = []
-    for p in partes:
-        for n in p.flatten().notes:
-            if isinstance(n, note.Note):
-                notas_midi.append(n.pitch.midi)
+    if intervalos.size == 0:
+        return {"predominantes": [], "nombres": [], **resumen_intervalos(intervalos)}
 
-    intervalos_raw = [
-        notas_midi[i] - notas_midi[i-1]
-        for i in range(1, len(notas_midi))
-    ]
-
-    if not intervalos_raw:
-        return {"valores": [], "predominantes": [], "nombres": []}
-
-    conteo_intervalos = Counter(intervalos_raw)
-    max_frecuencia = max(conteo_intervalos.values()) if conteo_intervalos else 0
+    valores, primeras, conteos = np.unique(intervalos, return_index=True, return_counts=True)
+    orden = np.argsort(primeras)
+    max_frecuencia = conteos.max()
 
     predominantes_valores = [
-        val for val, count in conteo_intervalos.items()
-        if count == max_frecuencia
+        int(valores[i]) for i in orden
+        if conteos[i] == max_frecuencia
     ]
-
     predominantes_nombres = [intervalo_nombre(val) for val in predominantes_valores]
 
+    # La secuencia completa no viaja aquí: el histograma conserva su distribución
     return {
-        "valores": intervalos_raw,
         "predominantes": predominantes_valores,
-        "nombres": predominantes_nombres
+        "nombres": predominantes_nombres,
+        **resumen_intervalos(intervalos)
     }
 
+def intervalos_melodicos(score, instrumento=None):
+    notas_midi = tabla_notas(score).seleccion([instrumento] if instrumento else None)["altura"]
+    return np.diff(notas_midi.astype(np.int64))
+
 def balance_dinamico(midi, instrumento=None):
     energia = {}
     for inst in midi.instruments:
@@ -330,25 +319,23 @@ def clasificar_familias(score):
                 return instrumento_a_familia[clave]
         return "Otros"
 
-    for p in score.parts:
-        nombre = p.partName or "Parte sin nombre"
+    for nombre in tabla_notas(score).nombres_partes:
+        nombre = nombre or "Parte sin nombre"
         familia = encontrar_familia(nombre)
         familias[familia].append(nombre)
 
     return familias
 
 def contrapunto_activo(score, instrumento=None): # Modificado para aceptar instrumento
-    partes_a_analizar = score.parts
-    if instrumento:
-        partes_a_analizar = [p for p in score.parts if p.partName == instrumento]
+    partes_a_analizar = tabla_notas(score).por_parte([instrumento] if instrumento else None)
     
     if len(partes_a_analizar) < 2:
         return 0.0
     
     entropias = []
-    for p in partes_a_analizar:
-        notas = [n.pitch.midi for n in p.flatten().notes if isinstance(n, note.Note)]
-        if notas:
+    for _, filas in partes_a_analizar:
+        notas = filas["altura"]
+        if notas.size:
             hist = np.histogram(notas, bins=12)[0]
             prob = hist / np.sum(hist)
             prob = prob[prob > 0] # Asegurarse de que no haya ceros
@@ -361,60 +348,51 @@ def contrapunto_activo(score, instrumento=None): # Modificado para aceptar instr
     if len(entropias) < 2:
         return 0.0
     return float(round(np.std(entropias), 3))
-    
-    entropias = []
-    for p in partes:
-        notas = [n.pitch.midi for n in p.flatten().notes if isinstance(n, note.Note)]
-        if notas:
-            hist = np.histogram(notas, bins=12)[0]
-            prob = hist / np.sum(hist)
-            entropia = -np.sum(prob * np.log2(prob + 1e-9))
-            entropias.append(entropia)
-    
-    if len(entropias) < 2:
-        return 0.0
-    return float(round(np.std(entropias), 3))
 
 def red_interaccion(score, instrumento=None):
-    partes = score.parts
-    if instrumento:
-        partes = [p for p in partes if p.partName == instrumento]
-
-    nodos = defaultdict(set)
-    for p in partes:
-        nombre = p.partName or "Parte"
-        for n in p.flatten().notes:
-            tiempo = round(n.offset, 2)
-            nodos[tiempo].add(nombre)
-
-    conexiones = defaultdict(int)
-    for tiempo, partes in nodos.items():
-        partes = list(partes)
-        for i in range(len(partes)):
-            for j in range(i + 1, len(partes)):
-                par = tuple(sorted([partes[i], partes[j]]))
-                conexiones[par] += 1
-    return {f"{a}-{b}": int(v) for (a, b), v in conexiones.items()}
+    tabla = tabla_notas(score)
+    filas = tabla.seleccion([instrumento] if instrumento else None, tipos=ELEMENTOS)
+    if filas.size == 0:
+        return {}
+
+    # Partes con el mismo nombre cuentan como un único nodo
+    nombres = sorted({tabla.nombres_partes[i] or "Parte" for i in np.unique(filas["parte"])})
+    indice_nombre = {nombre: i for i, nombre in enumerate(nombres)}
+    nodo_por_parte = np.array([indice_nombre.get(n or "Parte", -1) for n in tabla.nombres_partes])
+
+    _, tiempos = np.unique(np.round(filas["onset"], 2), return_inverse=True)
+    # Matriz tiempos x nodos: qué nodos suenan en cada instante
+    presencia = np.zeros((tiempos.max() + 1, len(nombres)), dtype=np.int64)
+    presencia[tiempos, nodo_por_parte[filas["parte"]]] = 1
+    coincidencias = presencia.T @ presencia
+
+    a, b = np.triu_indices(len(nombres), k=1)
+    return {
+        f"{nombres[i]}-{nombres[j]}": int(coincidencias[i, j])
+        for i, j in zip(a, b)
+        if coincidencias[i, j] > 0
+    }
+
+def _notas_por_parte(tabla):
+    return np.bincount(tabla.seleccion()["parte"], minlength=len(tabla.nombres_partes))
 
 def partes_detectadas(score):
+    tabla = tabla_notas(score)
     partes_info = []
-    for p in score.parts:
-        nombre = p.partName or "Parte sin nombre"
-        notas = [n for n in p.flatten().notes if isinstance(n, note.Note)]
+    for nombre, cantidad in zip(tabla.nombres_partes, _notas_por_parte(tabla)):
         partes_info.append({
-            "nombre": nombre,
-            "notas": len(notas)
+            "nombre": nombre or "Parte sin nombre",
+            "notas": int(cantidad)
         })
     return partes_info
 
 def participacion_por_partes(score):
+    tabla = tabla_notas(score)
     conteo = {}
     total = 0
-    for p in score.parts:
-        nombre = p.partName or "Parte sin nombre"
-        notas = [n for n in p.flatten().notes if isinstance(n, note.Note)]
-        conteo[nombre] = len(notas)
-        total += len(notas)
+    for nombre, cantidad in zip(tabla.nombres_partes, _notas_por_parte(tabla)):
+        conteo[nombre or "Parte sin nombre"] = int(cantidad)
+        total += int(cantidad)
 
     return {
         nombre: round((cantidad / total) * 100, 2)
@@ -422,21 +400,53 @@ def participacion_por_partes(score):
         if total > 0
     }
 
+_perfiles = weakref.WeakKeyDictionary()
+_lock_perfiles = threading.Lock()
+
+def memoizar_perfil(score, clave, calcular):
+    """
+    Perfil de entropías `calcular()` del score guardado con `clave`: se calcula
+    una sola vez por objeto score y lo descarta `invalidar_perfiles`.
+    """
+    with _lock_perfiles:
+        perfil = _perfiles.get(score, {}).get(clave)
+    if perfil is None:
+        perfil = calcular()
+        with _lock_perfiles:
+            perfil = _perfiles.setdefault(score, {}).setdefault(clave, perfil)
+    return dict(perfil)
+
+def perfil_entropias(score, instrumentos_seleccionados=None):
+    """
+    Entropías rítmica, melódica, armónica y de interacción del score para un
+    subconjunto de instrumentos. Se calculan una sola vez por (score,
+    subconjunto) y las comparten todas las métricas compuestas.
+    """
+    clave = tuple(instrumentos_seleccionados) if instrumentos_seleccionados else None
+    return memoizar_perfil(score, clave, lambda: {
+        "entropia_ritmica": entropia_ritmica(score, instrumentos_seleccionados=instrumentos_seleccionados),
+        "entropia_melodica": entropia_melodica(score, instrumentos_seleccionados=instrumentos_seleccionados),
+        "entropia_armonica": entropia_armonica(score, instrumentos_seleccionados=instrumentos_seleccionados),
+        "entropia_interaccion": entropia_interaccion(score, instrumentos_seleccionados=instrumentos_seleccionados)
+    })
+
+def invalidar_perfiles(score=None):
+    """
+    Descarta los perfiles de entropía del score (o todos si no se indica),
+    p. ej. si cambia su tabla de notas.
+    """
+    with _lock_perfiles:
+        if score is None:
+            _perfiles.clear()
+        else:
+            _perfiles.pop(score, None)
+
 def perfil_compositivo(score, instrumento=None): # Modificado para aceptar instrumento
-    return {
-        "entropia_ritmica": entropia_ritmica(score, instrumentos_seleccionados=[instrumento] if instrumento else None),
-        "entropia_melodica": entropia_melodica(score, instrumentos_seleccionados=[instrumento] if instrumento else None),
-        "entropia_armonica": entropia_armonica(score, instrumentos_seleccionados=[instrumento] if instrumento else None),
-        "entropia_interaccion": entropia_interaccion(score, instrumentos_seleccionados=[instrumento] if instrumento else None)
-    }
+    return perfil_entropias(score, [instrumento] if instrumento else None)
 
 def entropia_ritmica(score, instrumentos_seleccionados=None): # Modificado para aceptar instrumentos_seleccionados
-    duraciones = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        duraciones.extend([n.quarterLength for n in p.flat.notes if isinstance(n, note.Note)])
-    if not duraciones:
+    duraciones = tabla_notas(score).seleccion(instrumentos_seleccionados)["duracion"]
+    if not duraciones.size:
         return 0.0
     hist = np.histogram(duraciones, bins=16)[0]
     prob = hist / np.sum(hist)
@@ -446,12 +456,8 @@ def entropia_ritmica(score, instrumentos_seleccionados=None): # Modificado para
     return float(round(-np.sum(prob * np.log2(prob + 1e-9)), 3))
 
 def entropia_melodica(score, instrumentos_seleccionados=None): # Modificado para aceptar instrumentos_seleccionados
-    alturas = []
-    for p in score.parts:
-        if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-            continue
-        alturas.extend([n.pitch.midi for n in p.flat.notes if isinstance(n, note.Note)])
-    if not alturas:
+    alturas = tabla_notas(score).seleccion(instrumentos_seleccionados)["altura"]
+    if not alturas.size:
         return 0.0
     hist = np.histogram(alturas, bins=24)[0]
     prob = hist / np.sum(hist)
@@ -461,16 +467,8 @@ def entropia_melodica(score, instrumentos_seleccionados=None): # Modificado para
     return float(round(-np.sum(prob * np.log2(prob + 1e-9)), 3))
 
 def entropia_armonica(score, instrumentos_seleccionados=None): # Modificado para aceptar instrumentos_seleccionados
-    partes = score.parts
-    if instrumentos_seleccionados:
-        partes = [p for p in partes if p.partName in instrumentos_seleccionados]
-    if not partes:
-        return 0.0
-    score_chord = stream.Score()
-    for p in partes:
-        score_chord.append(p)
-    acordes = score_chord.chordify().recurse().getElementsByClass(chord.Chord)
-    nombres_acordes = [c.pitchedCommonName for c in acordes if c.pitchedCommonName]
+    secuencia = acordes(score, instrumentos_seleccionados)
+    nombres_acordes = secuencia.nombres_validos()
     if not nombres_acordes:
         return 0.0
     letras = [ord(a[0]) for a in nombres_acordes if a]
@@ -502,21 +500,16 @@ def complejidad_total(score, instrumento=None): # Modificado para aceptar instru
     return float(round(sum(valores), 3)) if valores else 0.0
 
 def firma_metrica(score):
-    if not score.parts:
+    indice = indice_compases(score)
+    if not len(indice):
         return {}
-    compases = score.parts[0].getElementsByClass(stream.Measure)
-    duraciones = [m.duration.quarterLength for m in compases]
-    return dict(Counter(duraciones))
+    return dict(Counter(float(d) for d in indice.duraciones))
 
 def seccion_aurea(score):
-    return float(round(score.highestTime * 0.618, 2))
+    return float(round(tabla_notas(score).fin() * 0.618, 2))
 
 def variedad_tonal(score):
-    tonalidades = set()
-    for el in score.recurse():
-        if el.classes[0] == 'Key':
-            tonalidades.add(el.tonic.name)
-    return len(tonalidades)
+    return len(set().union(*tabla_notas(score).tonicas))
 
 def innovacion_estadistica(score):
     perfil = perfil_compositivo(score)
@@ -524,32 +517,19 @@ def innovacion_estadistica(score):
     return float(round(np.mean(valores), 3)) if valores else 0.0
 
 def firma_fractal(score, instrumento=None): # Modificado para aceptar instrumento
-    partes_a_analizar = score.parts
-    if instrumento:
-        partes_a_analizar = [p for p in score.parts if p.partName == instrumento]
-    notas = [n.offset for p in partes_a_analizar for n in p.flat.notes if isinstance(n, note.Note)]
+    notas = tabla_notas(score).seleccion([instrumento] if instrumento else None)["onset"]
     if len(notas) < 2:
         return 0.0
     escalas = [1, 2, 4, 8]
     variaciones = []
     for s in escalas:
-        agrupadas = [notas[i:i+s] for i in range(0, len(notas), s)]
-        medias = [np.mean(g) for g in agrupadas if g]
+        # Medias de bloques consecutivos de s notas (el último puede ser más corto)
+        inicios = np.arange(0, len(notas), s)
+        tamanos = np.diff(np.append(inicios, len(notas)))
+        medias = np.add.reduceat(notas, inicios) / tamanos
         variaciones.append(np.std(medias))
     return float(round(np.std(variaciones), 3))
 
 def notas_por_compas(score, instrumentos_seleccionados=None):
-    resultados_por_compas = []
-    if not score.parts:
-        return resultados_por_compas
-    compases = score.parts[0].getElementsByClass(stream.Measure)
-    for i, m in enumerate(compases):
-        notas = []
-        for p in score.parts:
-            if instrumentos_seleccionados and p.partName not in instrumentos_seleccionados:
-                continue
-            compas_parte = p.measure(m.number)
-            if compas_parte:
-                notas.extend([n for n in compas_parte.notes if isinstance(n, note.Note)])
-        resultados_por_compas.append({f"compas #{i+1}": len(notas)})
-    return resultados_por_compas
\ No newline at end of file
+    conteos = indice_compases(score).conteos(instrumentos_seleccionados)
+    return [{f"compas #{i+1}": int(c)} for i, c in enumerate(conteos)]
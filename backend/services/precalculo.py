@@ -0,0 +1,80 @@
+import asyncio
+import os
+import threading
+
+from backend.services.cache_partituras import cargar_eventos
+from backend.services.tabla_notas import tabla_notas
+from backend.services.indice_compases import indice_compases
+from backend.services.clasificador_metricas import metricas_archivo
+from backend.services.instrumentos import extraer_instrumentos
+from backend.services.indice_similitud import indexar_subida
+from backend.services.ejecutor import enviar_a_ejecutor
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+LISTO = "listo"
+FALLIDO = "fallido"
+
+# Conjunto de métricas que pide el panel al abrir un archivo
+CATEGORIA_POR_DEFECTO = "todos"
+MODO_POR_DEFECTO = "todos"
+
+# Fracción del progreso que corresponde a parsear y construir tabla e índice
+PESO_INGESTA = 0.2
+
+_estados = {}
+_lock = threading.Lock()
+
+
+def _precalcular(estado, nombre_archivo, ruta):
+    estado["estado"] = EN_CURSO
+    try:
+        score, _ = cargar_eventos(ruta)
+        tabla_notas(score)
+        indice_compases(score)
+        extraer_instrumentos(nombre_archivo)
+        estado["progreso"] = PESO_INGESTA
+
+        def progreso(fraccion):
+            estado["progreso"] = round(PESO_INGESTA + (1 - PESO_INGESTA) * fraccion, 4)
+        metricas_archivo(ruta, CATEGORIA_POR_DEFECTO, None, MODO_POR_DEFECTO, progreso=progreso)
+        indexar_subida(nombre_archivo)
+        estado["progreso"] = 1.0
+        estado["estado"] = LISTO
+    except Exception as e:
+        estado["error"] = str(e)
+        estado["estado"] = FALLIDO
+
+
+def programar_precalculo(nombre_archivo):
+    """
+    Encola la ingesta y el análisis por defecto del archivo subido. Los
+    resultados quedan en las cachés de partituras y de resultados, y el
+    archivo en el índice de similitud.
+    """
+    estado = {"estado": PENDIENTE, "progreso": 0.0, "error": None}
+    ruta = os.path.join("uploads", nombre_archivo)
+    futuro = enviar_a_ejecutor(_precalcular, estado, nombre_archivo, ruta)
+    with _lock:
+        _estados[nombre_archivo] = (estado, futuro)
+    return dict(estado)
+
+
+def estado_precalculo(nombre_archivo):
+    """
+    Estado del precálculo del archivo, o None si no se programó ninguno.
+    """
+    with _lock:
+        registro = _estados.get(nombre_archivo)
+    return dict(registro[0]) if registro else None
+
+
+async def esperar_precalculo(nombre_archivo):
+    """
+    Si el archivo se está precalculando, espera a que termine para reutilizar
+    sus resultados en lugar de repetir el mismo análisis.
+    """
+    with _lock:
+        registro = _estados.get(nombre_archivo)
+    if registro is not None and not registro[1].done():
+        await asyncio.wrap_future(registro[1])
@@ -0,0 +1,235 @@
+import threading
+import weakref
+
+import numpy as np
+from music21 import note, chord, stream
+
+# Tipos de fila de la tabla
+NOTA = 0            # note.Note
+ACORDE = 1          # primera altura de un chord.Chord (representa al acorde)
+MIEMBRO_ACORDE = 2  # resto de alturas del acorde
+OTRO = 3            # elementos sin altura (Unpitched, etc.)
+
+# Elementos de `.notes` (una fila por objeto music21)
+ELEMENTOS = (NOTA, ACORDE, OTRO)
+
+DTYPE_NOTAS = np.dtype([
+    ("parte", np.int16),            # índice en score.parts
+    ("compas", np.int32),           # número de compás (m.number), 0 si está fuera de compás
+    ("onset", np.float64),          # offset en negras dentro de la parte
+    ("onset_compas", np.float64),   # offset en negras dentro del compás
+    ("onset_segundos", np.float64),
+    ("duracion", np.float64),       # quarterLength
+    ("altura", np.int16),           # altura MIDI, -1 si no tiene
+    ("velocidad", np.int16),
+    ("tipo", np.int8),
+    ("en_voz", np.bool_),           # el elemento está dentro de una Voice del compás
+])
+
+DTYPE_SILENCIOS = np.dtype([
+    ("parte", np.int16),
+    ("onset", np.float64),
+    ("duracion", np.float64),
+])
+
+
+class MapaTempo:
+    """
+    Conversión entre negras y segundos a partir de tramos de tempo constante.
+    """
+
+    def __init__(self, inicios_negras, bpms):
+        if len(inicios_negras) == 0 or inicios_negras[0] > 0:
+            inicios_negras = [0.0] + list(inicios_negras)
+            bpms = [120.0] + list(bpms)
+        self.inicios_negras = np.asarray(inicios_negras, dtype=np.float64)
+        self.segundos_por_negra = 60.0 / np.asarray(bpms, dtype=np.float64)
+        tramos = np.diff(self.inicios_negras) * self.segundos_por_negra[:-1]
+        self.inicios_segundos = np.concatenate(([0.0], np.cumsum(tramos)))
+
+    @classmethod
+    def desde_score(cls, score):
+        inicios, bpms = [], []
+        for inicio, fin, marca in score.metronomeMarkBoundaries():
+            if fin <= inicio or marca is None:
+                continue
+            bpm = marca.getQuarterBPM()
+            if not bpm:
+                continue
+            if inicios and inicios[-1] == inicio:
+                bpms[-1] = bpm
+            else:
+                inicios.append(float(inicio))
+                bpms.append(float(bpm))
+        return cls(inicios, bpms)
+
+    @classmethod
+    def desde_midi(cls, midi):
+        tiempos, tempos = midi.get_tempo_changes()
+        inicios = [0.0]
+        for i in range(1, len(tiempos)):
+            inicios.append(inicios[-1] + (tiempos[i] - tiempos[i - 1]) * tempos[i - 1] / 60.0)
+        return cls(inicios, tempos if len(tempos) else [120.0])
+
+    def a_segundos(self, negras):
+        negras = np.asarray(negras, dtype=np.float64)
+        idx = np.searchsorted(self.inicios_negras, negras, side="right") - 1
+        idx = np.clip(idx, 0, len(self.inicios_negras) - 1)
+        return self.inicios_segundos[idx] + (negras - self.inicios_negras[idx]) * self.segundos_por_negra[idx]
+
+    def a_negras(self, segundos):
+        segundos = np.asarray(segundos, dtype=np.float64)
+        idx = np.searchsorted(self.inicios_segundos, segundos, side="right") - 1
+        idx = np.clip(idx, 0, len(self.inicios_segundos) - 1)
+        return self.inicios_negras[idx] + (segundos - self.inicios_segundos[idx]) / self.segundos_por_negra[idx]
+
+
+class TablaNotas:
+    """
+    Tabla columnar (array estructurado de NumPy) con una fila por altura de la
+    partitura. Las filas de cada parte siguen el orden de `p.flatten().notes`.
+    Los silencios se guardan aparte: solo se usan como cortes temporales.
+    """
+
+    def __init__(self, notas, nombres_partes, mapa_tempo, silencios=None, tonicas=None):
+        self.notas = notas
+        self.nombres_partes = nombres_partes
+        self.mapa_tempo = mapa_tempo
+        self.silencios = silencios if silencios is not None else np.zeros(0, dtype=DTYPE_SILENCIOS)
+        # Tónicas de las tonalidades (`key.Key`) de cada parte
+        self.tonicas = tonicas if tonicas is not None else [set() for _ in nombres_partes]
+
+    def fin(self):
+        """
+        Offset en el que termina el último elemento o silencio, como
+        `score.highestTime`.
+        """
+        fines = np.concatenate((
+            self.notas["onset"] + self.notas["duracion"],
+            self.silencios["onset"] + self.silencios["duracion"]
+        ))
+        return float(fines.max()) if fines.size else 0.0
+
+    def indices_partes(self, instrumentos_seleccionados=None):
+        if not instrumentos_seleccionados:
+            return list(range(len(self.nombres_partes)))
+        return [i for i, nombre in enumerate(self.nombres_partes) if nombre in instrumentos_seleccionados]
+
+    def mascara(self, instrumentos_seleccionados=None, tipos=(NOTA,)):
+        mascara = np.isin(self.notas["tipo"], tipos)
+        if instrumentos_seleccionados:
+            mascara &= np.isin(self.notas["parte"], self.indices_partes(instrumentos_seleccionados))
+        return mascara
+
+    def seleccion(self, instrumentos_seleccionados=None, tipos=(NOTA,)):
+        return self.notas[self.mascara(instrumentos_seleccionados, tipos)]
+
+    def por_parte(self, instrumentos_seleccionados=None, tipos=(NOTA,)):
+        """
+        Devuelve una lista (indice_parte, filas) respetando el orden de score.parts.
+        """
+        seleccion = self.seleccion(instrumentos_seleccionados, tipos)
+        return [
+            (i, seleccion[seleccion["parte"] == i])
+            for i in self.indices_partes(instrumentos_seleccionados)
+        ]
+
+    def subconjunto(self, indices_partes):
+        """
+        Tabla restringida a las partes indicadas, renumeradas en ese orden.
+        """
+        def renumerar(tabla, dtype):
+            filas = []
+            for nuevo, viejo in enumerate(indices_partes):
+                f = tabla[tabla["parte"] == viejo].copy()
+                f["parte"] = nuevo
+                filas.append(f)
+            return np.concatenate(filas) if filas else np.zeros(0, dtype=dtype)
+
+        return TablaNotas(
+            renumerar(self.notas, DTYPE_NOTAS),
+            [self.nombres_partes[i] for i in indices_partes],
+            self.mapa_tempo,
+            renumerar(self.silencios, DTYPE_SILENCIOS),
+            [self.tonicas[i] for i in indices_partes]
+        )
+
+
+def _ubicaciones_en_compases(parte):
+    ubicaciones = {}
+    for m in parte.getElementsByClass(stream.Measure):
+        for el in m.notes:
+            ubicaciones[id(el)] = (m.number, float(el.offset), False)
+        for v in m.voices:
+            for el in v.notes:
+                ubicaciones[id(el)] = (m.number, float(v.offset + el.offset), True)
+    return ubicaciones
+
+
+def _velocidad(el):
+    return el.volume.velocity or 0
+
+
+def construir_tabla(score):
+    filas, silencios, tonicas = [], [], []
+    for indice, parte in enumerate(score.parts):
+        plano = parte.flatten()
+        tonicas.append({el.tonic.name for el in plano.getElementsByClass("Key") if el.classes[0] == "Key"})
+        ubicaciones = _ubicaciones_en_compases(parte)
+        for el in plano.notesAndRests:
+            if isinstance(el, note.Rest):
+                silencios.append((indice, float(el.offset), float(el.quarterLength)))
+                continue
+            compas, onset_compas, en_voz = ubicaciones.get(id(el), (0, 0.0, False))
+            onset = float(el.offset)
+            duracion = float(el.quarterLength)
+            if isinstance(el, note.Note):
+                filas.append((indice, compas, onset, onset_compas, 0.0, duracion,
+                              el.pitch.midi, _velocidad(el), NOTA, en_voz))
+            elif isinstance(el, chord.Chord) and len(el.pitches) > 0:
+                velocidad = _velocidad(el)
+                for j, p in enumerate(el.pitches):
+                    filas.append((indice, compas, onset, onset_compas, 0.0, duracion,
+                                  p.midi, velocidad, ACORDE if j == 0 else MIEMBRO_ACORDE, en_voz))
+            else:
+                filas.append((indice, compas, onset, onset_compas, 0.0, duracion,
+                              -1, _velocidad(el), OTRO, en_voz))
+
+    notas = np.array(filas, dtype=DTYPE_NOTAS)
+    mapa_tempo = MapaTempo.desde_score(score)
+    notas["onset_segundos"] = mapa_tempo.a_segundos(notas["onset"])
+    return TablaNotas(
+        notas,
+        [p.partName for p in score.parts],
+        mapa_tempo,
+        np.array(silencios, dtype=DTYPE_SILENCIOS),
+        tonicas
+    )
+
+
+_tablas = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def tabla_notas(score):
+    """
+    Tabla de notas del score, construida una sola vez por objeto score. Como la
+    caché de partituras devuelve siempre el mismo objeto para un mismo archivo,
+    la tabla se comparte entre todas las métricas y peticiones.
+    """
+    with _lock:
+        tabla = _tablas.get(score)
+    if tabla is None:
+        tabla = construir_tabla(score)
+        with _lock:
+            tabla = _tablas.setdefault(score, tabla)
+    return tabla
+
+
+def registrar_tabla(score, tabla):
+    """
+    Asocia al score una tabla ya construida por otra vía (p. ej. desde el MIDI).
+    """
+    with _lock:
+        _tablas[score] = tabla
+
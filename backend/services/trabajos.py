@@ -0,0 +1,144 @@
+import json
+import sqlite3
+from contextlib import contextmanager
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from backend.config import TRABAJOS_DB
+from backend.services.clasificador_metricas import metricas_archivo
+from backend.services.ejecutor import enviar_a_ejecutor
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+TERMINADO = "terminado"
+FALLIDO = "fallido"
+
+_lock = threading.RLock()
+_inicializada = False
+
+
+def _inicializar(conexion):
+    global _inicializada
+    with _lock:
+        if _inicializada:
+            return
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id TEXT PRIMARY KEY,
+                archivo TEXT NOT NULL,
+                ruta TEXT NOT NULL,
+                categorias TEXT NOT NULL,
+                instrumento TEXT,
+                modo TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                progreso REAL NOT NULL DEFAULT 0,
+                resultado TEXT,
+                error TEXT,
+                creado REAL NOT NULL,
+                actualizado REAL NOT NULL
+            )
+        """)
+        conexion.commit()
+        _inicializada = True
+
+
+@contextmanager
+def _conexion():
+    # Una conexión por operación: los trabajos se actualizan desde los hilos del ejecutor
+    conexion = sqlite3.connect(TRABAJOS_DB, timeout=30)
+    conexion.row_factory = sqlite3.Row
+    try:
+        _inicializar(conexion)
+        with conexion:
+            yield conexion
+    finally:
+        conexion.close()
+
+
+def _actualizar(id_trabajo, **campos):
+    campos["actualizado"] = time.time()
+    asignaciones = ", ".join(f"{c} = ?" for c in campos)
+    with _lock, _conexion() as conexion:
+        conexion.execute(f"UPDATE trabajos SET {asignaciones} WHERE id = ?", (*campos.values(), id_trabajo))
+
+
+def _a_json(valor):
+    # Los resultados mezclan tipos de NumPy con tipos nativos
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    return str(valor)
+
+
+def _ejecutar(id_trabajo, ruta, categorias, instrumento, modo):
+    _actualizar(id_trabajo, estado=EN_CURSO, progreso=0.0)
+    try:
+        metricas = {}
+        for i, categoria in enumerate(categorias):
+            def progreso(fraccion, i=i):
+                _actualizar(id_trabajo, progreso=round((i + fraccion) / len(categorias), 4))
+            metricas[categoria] = metricas_archivo(ruta, categoria, instrumento, modo, progreso=progreso)
+            progreso(1.0)
+        _actualizar(id_trabajo, estado=TERMINADO, progreso=1.0, resultado=json.dumps(metricas, default=_a_json))
+    except Exception as e:
+        _actualizar(id_trabajo, estado=FALLIDO, error=str(e))
+
+
+def crear_trabajo(archivo, ruta, categorias, instrumento=None, modo="global"):
+    """
+    Registra un trabajo de análisis y lo encola en el ejecutor. Devuelve su id.
+    """
+    id_trabajo = uuid.uuid4().hex
+    ahora = time.time()
+    with _lock, _conexion() as conexion:
+        conexion.execute(
+            "INSERT INTO trabajos (id, archivo, ruta, categorias, instrumento, modo, estado, creado, actualizado)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (id_trabajo, archivo, str(ruta), json.dumps(categorias), instrumento, modo, PENDIENTE, ahora, ahora)
+        )
+    enviar_a_ejecutor(_ejecutar, id_trabajo, str(ruta), categorias, instrumento, modo)
+    return id_trabajo
+
+
+def obtener_trabajo(id_trabajo):
+    """
+    Estado del trabajo (sin el resultado), o None si no existe.
+    """
+    with _conexion() as conexion:
+        fila = conexion.execute(
+            "SELECT id, archivo, categorias, instrumento, modo, estado, progreso, error, creado, actualizado"
+            " FROM trabajos WHERE id = ?", (id_trabajo,)
+        ).fetchone()
+    if fila is None:
+        return None
+    trabajo = dict(fila)
+    trabajo["categorias"] = json.loads(trabajo["categorias"])
+    return trabajo
+
+
+def obtener_resultado(id_trabajo):
+    with _conexion() as conexion:
+        fila = conexion.execute("SELECT resultado FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+    if fila is None or fila["resultado"] is None:
+        return None
+    return json.loads(fila["resultado"])
+
+
+def reanudar_trabajos():
+    """
+    Vuelve a encolar los trabajos que quedaron sin terminar al parar el servidor.
+    """
+    with _conexion() as conexion:
+        filas = conexion.execute(
+            "SELECT id, ruta, categorias, instrumento, modo FROM trabajos WHERE estado IN (?, ?) ORDER BY creado",
+            (PENDIENTE, EN_CURSO)
+        ).fetchall()
+    for fila in filas:
+        _actualizar(fila["id"], estado=PENDIENTE, progreso=0.0)
+        enviar_a_ejecutor(_ejecutar, fila["id"], fila["ruta"], json.loads(fila["categorias"]), fila["instrumento"], fila["modo"])
+    return len(filas)
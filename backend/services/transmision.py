@@ -0,0 +1,66 @@
+import json
+from itertools import islice
+
+import numpy as np
+from fastapi.responses import StreamingResponse
+
+from backend.services.ejecutor import en_ejecutor
+
+TIPOS_MEDIO = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+# Registros que se calculan por cada paso por el ejecutor de análisis
+REGISTROS_POR_LOTE = 16
+
+
+def _a_json(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    return str(valor)
+
+
+def serializar(registro, formato):
+    datos = json.dumps(registro, ensure_ascii=False, default=_a_json)
+    if formato == "sse":
+        return f"event: {registro.get('tipo', 'mensaje')}\ndata: {datos}\n\n"
+    return datos + "\n"
+
+
+def _siguientes(iterador, cantidad):
+    # Un error a mitad de lote no descarta los registros ya calculados
+    lote = []
+    try:
+        lote.extend(islice(iterador, cantidad))
+    except Exception as e:
+        return lote, e
+    return lote, None
+
+
+async def _en_lotes(registros, formato):
+    iterador = iter(registros)
+    while True:
+        lote, error = await en_ejecutor(_siguientes, iterador, REGISTROS_POR_LOTE)
+        for registro in lote:
+            yield serializar(registro, formato)
+        if error is not None:
+            yield serializar({"tipo": "error", "error": str(error)}, formato)
+            return
+        if len(lote) < REGISTROS_POR_LOTE:
+            return
+
+
+def respuesta_en_flujo(registros, formato="ndjson"):
+    """
+    Respuesta que envía cada registro (un dict) en cuanto se calcula, como
+    NDJSON o Server-Sent Events. El generador avanza por lotes en el ejecutor
+    de análisis, así que respeta su límite de concurrencia.
+    """
+    return StreamingResponse(
+        _en_lotes(registros, formato),
+        media_type=TIPOS_MEDIO[formato],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
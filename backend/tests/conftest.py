@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture(autouse=True)
+def en_raiz(monkeypatch):
+    # Los servicios buscan los archivos en uploads/ relativo a la raíz del proyecto
+    monkeypatch.chdir(RAIZ)
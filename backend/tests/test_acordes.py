@@ -0,0 +1,39 @@
+import copy
+
+import pytest
+from music21 import chord, converter, stream
+
+from backend.services.acordes import cortes_verticales
+
+RUTA = "uploads/coriolan.mid"
+
+
+@pytest.fixture(scope="module")
+def score():
+    return converter.parse(RUTA)
+
+
+def _sonoridades_chordify(score, indices):
+    # Score nuevo con copias: las partes del original no deben reasignarse
+    seleccion = stream.Score()
+    for i in indices:
+        seleccion.insert(0, copy.deepcopy(score.parts[i]))
+    return [
+        (round(float(c.getOffsetInHierarchy(seleccion)), 4), round(float(c.quarterLength), 4), c.pitchedCommonName)
+        for c in seleccion.chordify().recurse().getElementsByClass(chord.Chord)
+        if c.pitchedCommonName
+    ]
+
+
+# La viola tiene más compases que la primera parte de la obra: sus barras son
+# las suyas, como en chordify
+@pytest.mark.parametrize("nombres", [["Viola"], ["Cello", "Violin I", "Timpani"], None])
+def test_cortes_verticales_como_chordify(score, nombres):
+    indices = [i for i, p in enumerate(score.parts) if nombres is None or p.partName in nombres]
+    secuencia = cortes_verticales(score, indices)
+    obtenidas = [
+        (round(o, 4), round(d, 4), n)
+        for o, d, n in zip(secuencia.offsets.tolist(), secuencia.duraciones.tolist(), secuencia.nombres)
+        if n
+    ]
+    assert obtenidas == _sonoridades_chordify(score, indices)
@@ -0,0 +1,39 @@
+import io
+import os
+import stat
+
+from backend.services.almacen_subidas import AlmacenSubidas
+
+
+def _guardar(almacen, nombre, contenido):
+    return almacen.guardar(nombre, io.BytesIO(contenido).read)
+
+
+def test_importa_los_archivos_previos_al_almacen(tmp_path):
+    (tmp_path / "previo.mid").write_bytes(b"MThd previo")
+    almacen = AlmacenSubidas(tmp_path, 0)
+
+    assert almacen.importar_existentes() == 1
+    assert almacen.importar_existentes() == 0
+    guardado = _guardar(almacen, "copia.mid", b"MThd previo")
+
+    assert guardado["duplicado"]
+    assert guardado["hash"] == almacen.hash_de("previo.mid")
+    assert os.path.samefile(tmp_path / "copia.mid", tmp_path / "previo.mid")
+
+
+def test_olvida_los_nombres_borrados(tmp_path):
+    almacen = AlmacenSubidas(tmp_path, 0)
+    guardado = _guardar(almacen, "a.mid", b"MThd a")
+    os.remove(tmp_path / "a.mid")
+
+    assert almacen.importar_existentes() == 1
+    assert almacen.hash_de("a.mid") is None
+    assert not almacen.ruta_objeto(guardado["hash"]).exists()
+
+
+def test_los_objetos_son_legibles_por_todos(tmp_path):
+    almacen = AlmacenSubidas(tmp_path, 0)
+    guardado = _guardar(almacen, "a.mid", b"MThd a")
+
+    assert stat.S_IMODE(os.stat(almacen.ruta_objeto(guardado["hash"])).st_mode) == 0o644
@@ -0,0 +1,101 @@
+import pickle
+import shutil
+from pathlib import Path
+
+import pytest
+
+from backend.services.cache_resultados import CacheResultados, _version_codigo
+
+RUTA = "uploads/coriolan.mid"
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+class Contador:
+    def __init__(self, valor):
+        self.valor = valor
+        self.llamadas = 0
+
+    def __call__(self):
+        self.llamadas += 1
+        return self.valor
+
+
+def _entrada(cache):
+    entradas = list(cache.directorio.glob("*/*.pkl"))
+    assert len(entradas) == 1
+    return entradas[0]
+
+
+def test_acierto_tras_guardar(tmp_path):
+    cache = CacheResultados(tmp_path, 1 << 20, version="v1")
+    calcular = Contador({"total": 3})
+    assert cache.obtener("metricas", RUTA, {"n": 1}, calcular) == {"total": 3}
+    assert cache.obtener("metricas", RUTA, {"n": 1}, calcular) == {"total": 3}
+    assert calcular.llamadas == 1
+    # Otros parámetros son otra entrada
+    cache.obtener("metricas", RUTA, {"n": 2}, calcular)
+    assert calcular.llamadas == 2
+
+
+def test_otra_version_no_reutiliza_y_borra_lo_antiguo(tmp_path):
+    antigua = CacheResultados(tmp_path, 1 << 20, version="v1")
+    antigua.obtener("metricas", RUTA, {}, Contador("antiguo"))
+
+    nueva = CacheResultados(tmp_path, 1 << 20, version="v2")
+    calcular = Contador("nuevo")
+    assert nueva.obtener("metricas", RUTA, {}, calcular) == "nuevo"
+    assert calcular.llamadas == 1
+
+    nueva.borrar_versiones_antiguas()
+    assert not antigua.directorio.exists()
+    assert nueva.obtener("metricas", RUTA, {}, calcular) == "nuevo"
+    assert calcular.llamadas == 1
+
+
+@pytest.mark.parametrize("carpeta", ["services", "endpoints", "schemas"])
+def test_version_cambia_con_el_codigo(tmp_path, carpeta):
+    copia = tmp_path / "backend"
+    for nombre in ("services", "endpoints", "schemas"):
+        shutil.copytree(BACKEND / nombre, copia / nombre, ignore=shutil.ignore_patterns("__pycache__"))
+    antes = _version_codigo(copia)
+    assert antes == _version_codigo(BACKEND)
+
+    fuente = sorted((copia / carpeta).glob("*.py"))[-1]
+    fuente.write_text(fuente.read_text() + "\n# cambio\n")
+    assert _version_codigo(copia) != antes
+
+
+class Renombrada:
+    pass
+
+
+@pytest.mark.parametrize("contenido", [
+    b"no es un pickle",
+    b"",
+    pickle.dumps({"x": 1})[:-3],
+    # Pickle de una clase que ya no existe en el módulo
+    pickle.dumps(Renombrada()).replace(b"Renombrada", b"Inexistente"),
+    # Y de un módulo que ya no existe
+    pickle.dumps(Renombrada()).replace(b"test_cache_resultados", b"modulo_borrado_xyz"),
+])
+def test_entrada_ilegible_se_recalcula(tmp_path, contenido):
+    cache = CacheResultados(tmp_path, 1 << 20, version="v1")
+    cache.obtener("metricas", RUTA, {}, Contador("viejo"))
+    _entrada(cache).write_bytes(contenido)
+
+    calcular = Contador("recalculado")
+    assert cache.obtener("metricas", RUTA, {}, calcular) == "recalculado"
+    assert calcular.llamadas == 1
+    assert cache.fallos == 2
+    # La entrada se reescribe y vuelve a acertar
+    assert cache.obtener("metricas", RUTA, {}, calcular) == "recalculado"
+    assert calcular.llamadas == 1
+
+
+def test_no_guarda_si_guardar_si_lo_impide(tmp_path):
+    cache = CacheResultados(tmp_path, 1 << 20, version="v1")
+    calcular = Contador({"error": "temporal"})
+    for _ in range(2):
+        cache.obtener("metricas", RUTA, {}, calcular, guardar_si=lambda r: "error" not in r)
+    assert calcular.llamadas == 2
+    assert not list(cache.directorio.glob("*/*.pkl"))
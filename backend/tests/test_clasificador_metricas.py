@@ -0,0 +1,76 @@
+import collections
+
+import pytest
+
+from backend.services import clasificador_metricas
+from backend.services.cache_partituras import cargar_eventos
+from backend.services.clasificador_metricas import blindar, metricas_categoria, plan_metricas
+
+
+@pytest.fixture(scope="module")
+def partitura():
+    return cargar_eventos("uploads/coriolan.mid")
+
+
+def test_blindar_calcula_una_vez_por_plan():
+    llamadas = []
+
+    def metrica(x, escala=1):
+        llamadas.append((x, escala))
+        return x * escala
+
+    with plan_metricas() as plan:
+        assert blindar(metrica, 2, nombre="m") == 2
+        assert blindar(metrica, 2, nombre="m") == 2
+        assert blindar(metrica, 2, escala=3, nombre="m") == 6
+        with plan_metricas() as anidado:
+            # Una llamada anidada comparte el plan de la petición
+            assert anidado is plan
+            assert blindar(metrica, 2, nombre="m") == 2
+        # Las lambdas sin cierre se reconocen por su código
+        for _ in range(3):
+            blindar(lambda v: v + 1, 5, nombre="lambda")
+    assert llamadas == [(2, 1), (2, 3)]
+    assert (plan.calculadas, plan.reutilizadas) == (3, 4)
+
+    # Fuera de un plan no hay reutilización
+    blindar(metrica, 2, nombre="m")
+    assert len(llamadas) == 3
+
+
+def test_errores_se_guardan_como_marca():
+    llamadas = []
+
+    def falla():
+        llamadas.append(1)
+        raise RuntimeError("sin datos")
+
+    with plan_metricas():
+        assert blindar(falla, nombre="falla") == "[ERROR en falla]: sin datos"
+        assert blindar(falla, nombre="falla") == "[ERROR en falla]: sin datos"
+    assert len(llamadas) == 1
+    assert clasificador_metricas.contiene_errores({"a": {"b": ["[ERROR en falla]: sin datos"]}})
+    assert clasificador_metricas.contiene_errores({"[ERROR en global]": "x"})
+    assert not clasificador_metricas.contiene_errores({"a": [1.0, "texto"]})
+
+
+def test_todos_calcula_cada_metrica_una_vez(partitura, monkeypatch):
+    score, midi = partitura
+    llamadas = collections.Counter()
+    for nombre in ("entropia_ritmica", "firma_metrica", "promedio_notas_por_compas", "densidad_armonica", "seccion_aurea"):
+        original = getattr(clasificador_metricas, nombre)
+
+        def espia(*args, _nombre=nombre, _original=original, **kwargs):
+            llamadas[_nombre] += 1
+            return _original(*args, **kwargs)
+        monkeypatch.setattr(clasificador_metricas, nombre, espia)
+
+    resultado = metricas_categoria(score, midi, "todos", modo="todos")
+    assert not clasificador_metricas.contiene_errores(resultado)
+    # Varias categorías y submodos piden las mismas métricas con los mismos argumentos
+    assert llamadas == {nombre: 1 for nombre in llamadas}
+    assert set(llamadas) == {"entropia_ritmica", "firma_metrica", "promedio_notas_por_compas", "densidad_armonica", "seccion_aurea"}
+
+    # Cada petición tiene su propio plan
+    metricas_categoria(score, midi, "ritmicas", modo="global")
+    assert llamadas["entropia_ritmica"] == 2
@@ -0,0 +1,98 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.endpoints import mixtas, clasificador_metricas_endpoint
+
+ARCHIVO = "coriolan.mid"
+
+
+@pytest.fixture
+def cliente():
+    return TestClient(app)
+
+
+@pytest.fixture
+def lote(monkeypatch):
+    # Sustituye el análisis del lote de mixtas por resultados fijados en la prueba
+    estado = {"resultado": ({"densidad": 1.5}, None), "llamadas": 0}
+
+    async def en_ejecutor(funcion, analizar, argumentos):
+        estado["llamadas"] += 1
+        return [estado["resultado"] for _ in argumentos]
+
+    monkeypatch.setattr(mixtas, "en_ejecutor", en_ejecutor)
+    return estado
+
+
+@pytest.mark.parametrize("columnas", [False, True])
+def test_304_sin_volver_a_calcular(cliente, lote, columnas):
+    parametros = {"archivos": ARCHIVO, "columnas": columnas}
+    respuesta = cliente.get("/mixtas/", params=parametros)
+    assert respuesta.status_code == 200
+    etiqueta = respuesta.headers["etag"]
+    assert respuesta.headers["cache-control"] == "no-cache"
+
+    repetida = cliente.get("/mixtas/", params=parametros, headers={"If-None-Match": etiqueta})
+    assert repetida.status_code == 304
+    assert repetida.headers["etag"] == etiqueta
+    assert lote["llamadas"] == 1
+
+    # Otros parámetros, otra etiqueta
+    otra = cliente.get("/mixtas/", params={**parametros, "hasta_compas": 4}, headers={"If-None-Match": etiqueta})
+    assert otra.status_code == 200
+    assert otra.headers["etag"] != etiqueta
+
+
+def test_etiqueta_propia_de_la_version_comprimida(cliente, lote):
+    lote["resultado"] = ({f"m{i}": float(i) for i in range(200)}, None)
+    plana = cliente.get("/mixtas/", params={"archivos": ARCHIVO}, headers={"Accept-Encoding": "identity"})
+    comprimida = cliente.get("/mixtas/", params={"archivos": ARCHIVO}, headers={"Accept-Encoding": "gzip"})
+    assert comprimida.headers["content-encoding"] == "gzip"
+    assert comprimida.headers["etag"] == plana.headers["etag"][:-1] + '-gz"'
+    repetida = cliente.get("/mixtas/", params={"archivos": ARCHIVO}, headers={
+        "Accept-Encoding": "gzip", "If-None-Match": comprimida.headers["etag"]
+    })
+    assert repetida.status_code == 304
+
+
+@pytest.mark.parametrize("columnas", [False, True])
+def test_error_transitorio_sin_etiqueta(cliente, lote, columnas):
+    parametros = {"archivos": ARCHIVO, "columnas": columnas}
+    lote["resultado"] = (None, BrokenProcessPool("pool roto"))
+    respuesta = cliente.get("/mixtas/", params=parametros)
+    assert respuesta.status_code == 200
+    assert "pool roto" in respuesta.json()["error"]
+    assert "etag" not in respuesta.headers
+    assert respuesta.headers["cache-control"] == "no-store"
+
+    # Cuando el pool se recupera la respuesta ya es la buena, y se etiqueta
+    lote["resultado"] = ({"densidad": 1.5}, None)
+    respuesta = cliente.get("/mixtas/", params=parametros)
+    assert "error" not in respuesta.json()
+    assert "etag" in respuesta.headers
+
+
+def test_lote_con_errores_parciales_sin_etiqueta(cliente, monkeypatch):
+    async def en_ejecutor(funcion, analizar, argumentos):
+        return [({"densidad": 1.5}, None), (None, TimeoutError("tiempo agotado"))]
+
+    monkeypatch.setattr(mixtas, "en_ejecutor", en_ejecutor)
+    # Dos nombres para el mismo archivo: ambos existen, así que la petición es etiquetable
+    respuesta = cliente.get("/mixtas/", params={"archivos": [ARCHIVO, f"./{ARCHIVO}"]})
+    assert respuesta.status_code == 200
+    assert len(respuesta.json()["resultados"]) == 1
+    assert len(respuesta.json()["errores"]) == 1
+    assert "etag" not in respuesta.headers
+
+
+def test_metricas_con_marcas_de_error_sin_etiqueta(cliente, monkeypatch):
+    async def en_ejecutor(funcion, *args, **kwargs):
+        return {"entropia_melodica": "[ERROR en entropia_melodica]: tiempo agotado"}
+
+    monkeypatch.setattr(clasificador_metricas_endpoint, "en_ejecutor", en_ejecutor)
+    respuesta = cliente.get("/metricas/", params={"archivo": ARCHIVO, "categoria": "melodicas"})
+    assert respuesta.status_code == 200
+    assert "etag" not in respuesta.headers
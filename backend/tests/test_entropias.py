@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from backend.services import compas_parser, mixtas_parser
+from backend.services.cache_partituras import cargar_partitura
+from backend.services.parser import invalidar_perfiles, perfil_entropias
+from backend.services.tabla_notas import tabla_notas
+
+RUTA = "uploads/coriolan.mid"
+
+# Valores de la implementación original (un score de music21 por parte y
+# -sum(p log2 p) sin sumar 1e-9), con la viola seleccionada
+ENTROPIAS_VIOLA = {
+    "entropia_melodica": 4.109, "entropia_ritmica": 2.254,
+    "entropia_armonica": 2.506, "entropia_compuesta": 2.956
+}
+COMPLEJIDAD_ORIGINAL = {
+    "Flute": 9.019, "Oboe": 8.915, "Clarinet": 8.683, "Bassoon": 9.353, "Horn": 7.61,
+    "Trumpet": 4.661, "Timpani": 2.706, "Violin I": 8.013, "Violin II": 8.975,
+    "Viola": 8.869, "Cello": 8.834, "Contrabass": 9.139
+}
+
+
+@pytest.fixture(scope="module")
+def partitura():
+    return cargar_partitura(RUTA)
+
+
+def _entropia_exacta(valores, bins):
+    hist = np.histogram(valores, bins=bins)[0]
+    prob = hist[hist > 0] / hist.sum()
+    return float(round(-np.sum(prob * np.log2(prob)), 3))
+
+
+def test_mixtas_y_compases_como_la_version_original(partitura):
+    score, midi = partitura
+    resumen = mixtas_parser.resumen_mixtas(score, midi, ["Viola"])
+    assert {clave: resumen[clave] for clave in ENTROPIAS_VIOLA} == ENTROPIAS_VIOLA
+    assert resumen["complejidad_total_por_instrumentos"] == COMPLEJIDAD_ORIGINAL
+
+    compases = compas_parser.analizar_compases(RUTA, ["Viola"])
+    assert {clave: compases[clave] for clave in ENTROPIAS_VIOLA} == ENTROPIAS_VIOLA
+
+
+@pytest.mark.parametrize("instrumentos", [None, ["Viola"], ["Cello", "Violin I", "Timpani"]])
+def test_formula_sin_desplazamiento(partitura, instrumentos):
+    score, midi = partitura
+    filas = tabla_notas(score).seleccion(instrumentos)
+    for perfil in (
+        mixtas_parser.perfil_entropias_mixtas(score, instrumentos),
+        compas_parser.perfil_entropias_compases(score, instrumentos)
+    ):
+        assert perfil["entropia_melodica"] == _entropia_exacta(filas["altura"], 24)
+        assert perfil["entropia_ritmica"] == _entropia_exacta(filas["duracion"], 16)
+        assert perfil["entropia_armonica"] == mixtas_parser.entropia_armonica(score, instrumentos)
+
+
+def test_perfiles_memoizados_por_formula(partitura, monkeypatch):
+    score, _ = partitura
+    invalidar_perfiles(score)
+    llamadas = []
+    entropia = mixtas_parser.entropia_melodica
+    monkeypatch.setattr(mixtas_parser, "entropia_melodica", lambda *a: llamadas.append(a) or entropia(*a))
+
+    primero = mixtas_parser.perfil_entropias_mixtas(score, ["Viola"])
+    assert mixtas_parser.perfil_entropias_mixtas(score, ["Viola"]) == primero
+    assert len(llamadas) == 1
+    # El perfil de `parser` (con 1e-9) se guarda aparte
+    assert set(perfil_entropias(score, ["Viola"])) > set(primero)
+    assert len(llamadas) == 1
+
+    invalidar_perfiles(score)
+    mixtas_parser.perfil_entropias_mixtas(score, ["Viola"])
+    assert len(llamadas) == 2
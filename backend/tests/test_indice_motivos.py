@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from backend.services import indice_motivos
+from backend.services.cache_partituras import cargar_eventos
+from backend.services.indice_motivos import ALTURAS, INTERVALOS, buscar_motivo, indexar_motivos
+from backend.services.tabla_notas import tabla_notas
+
+ARCHIVO = "coriolan.mid"
+
+
+@pytest.fixture(scope="module")
+def tabla():
+    score, _ = cargar_eventos(f"uploads/{ARCHIVO}")
+    return tabla_notas(score)
+
+
+@pytest.fixture(scope="module")
+def partes(tabla):
+    return [filas["altura"].astype(np.int64) for _, filas in tabla.por_parte()]
+
+
+@pytest.fixture(scope="module")
+def indice(tmp_path_factory):
+    ruta = str(tmp_path_factory.mktemp("motivos") / "motivos.sqlite3")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(indice_motivos, "MOTIVOS_DB", ruta)
+        mp.setattr(indice_motivos, "_inicializada", False)
+        indexar_motivos(ARCHIVO)
+        yield
+    indice_motivos._inicializada = False
+
+
+def _fuerza_bruta(partes, tipo, motivo):
+    apariciones = []
+    for indice_parte, alturas in enumerate(partes):
+        valores = alturas if tipo == ALTURAS else np.diff(alturas)
+        for posicion in range(len(valores) - len(motivo) + 1):
+            if list(valores[posicion:posicion + len(motivo)]) == motivo:
+                apariciones.append((indice_parte, posicion))
+    return apariciones
+
+
+def _motivos(partes, tipo):
+    # Motivos de una a varias veces la longitud de un n-grama, sacados de la obra,
+    # más algunos que no aparecen
+    valores = partes[0] if tipo == ALTURAS else np.diff(partes[0])
+    motivos = [[int(v) for v in valores[i:i + n]] for n in (3, 4, 5, 7, 9) for i in (0, 17, 40)]
+    if tipo == INTERVALOS:
+        motivos += [[0, 0, -4, 2, 0], [0] * 7, [0, 0, 0, 0], [2, 2, 1, 2, 2, 2, 1]]
+    else:
+        motivos += [[60, 62, 64, 65, 67], [55] * 6]
+    return motivos
+
+
+@pytest.mark.parametrize("tipo", [ALTURAS, INTERVALOS])
+def test_buscar_motivo_coincide_con_fuerza_bruta(indice, tabla, partes, tipo):
+    for motivo in _motivos(partes, tipo):
+        esperado = [(tabla.nombres_partes[p], posicion) for p, posicion in _fuerza_bruta(partes, tipo, motivo)]
+        resultado = buscar_motivo(tipo, motivo, limite=100000)
+        assert resultado["total"] == len(esperado), motivo
+        assert [(o["parte"], o["posicion"]) for o in resultado["ocurrencias"]] == esperado, motivo
+
+
+def test_buscar_motivo_ordena_antes_de_limitar(indice, partes):
+    motivo = [0, 0]
+    todas = buscar_motivo(INTERVALOS, motivo, limite=100000)["ocurrencias"]
+    primeras = buscar_motivo(INTERVALOS, motivo, limite=5)["ocurrencias"]
+    assert len(todas) > 5
+    assert primeras == todas[:5]
@@ -0,0 +1,57 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.endpoints import metrics
+from backend.services import indice_similitud, parser
+from backend.services.indice_similitud import IndiceSimilitud, indexar_subida, DIMENSION
+
+ARCHIVO = "coriolan.mid"
+
+
+def _resultado():
+    return {
+        "entropia_melodica": 3.0, "entropia_ritmica": 2.0, "entropia_armonica": 1.5,
+        "entropia_interaccion": 0.5, "complejidad_total": 7.0,
+        "intervalos_predominantes": {"histograma": {"intervalos": [-2, 0, 2, 15], "conteos": [3, 1, 3, 1]}},
+        "familias_instrumentales": {"Cuerdas": ["Viola", "Cello"], "Metales": ["Horn"]},
+        "balance_dinamico": {"Viola": 80, "Cello": 64, "Horn": 100}
+    }
+
+
+@pytest.fixture
+def indice(tmp_path, monkeypatch):
+    indice = IndiceSimilitud(tmp_path / "indice")
+    monkeypatch.setattr(indice_similitud, "indice_similitud", indice)
+    return indice
+
+
+def test_get_metrics_no_escribe_en_el_indice(indice, monkeypatch):
+    async def en_ejecutor(funcion, analizar, argumentos):
+        return [({"error": "sin datos"}, None) for _ in argumentos]
+
+    monkeypatch.setattr(metrics, "en_ejecutor", en_ejecutor)
+    monkeypatch.setattr(indice, "registrar", lambda *args: pytest.fail("GET /metrics ha escrito en el índice"))
+    respuesta = TestClient(app).get("/metrics/", params={"archivos": ARCHIVO})
+    assert respuesta.status_code == 200
+    assert not (indice.directorio / "claves.jsonl").exists()
+
+
+def test_indexar_subida(indice, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(parser, "analizar_midi", lambda nombre: llamadas.append(nombre) or _resultado())
+    hash_contenido = indexar_subida(ARCHIVO)
+    assert indice.contiene(hash_contenido)
+    assert indice.estadisticas()["vectores"] == 1
+    # Ya indexado con el mismo nombre: no se vuelve a analizar
+    assert indexar_subida(ARCHIVO) == hash_contenido
+    assert llamadas == [ARCHIVO]
+    assert DIMENSION == len(indice_similitud.vector_caracteristicas(_resultado()))
+
+
+def test_indexar_subida_no_propaga_fallos(indice, monkeypatch, caplog):
+    monkeypatch.setattr(parser, "analizar_midi", lambda nombre: {"error": "MIDI ilegible"})
+    assert indexar_subida(ARCHIVO) is None
+    assert indexar_subida("no_existe.mid") is None
+    assert "No se pudo indexar" in caplog.text
+    assert indice.estadisticas()["vectores"] == 0
@@ -0,0 +1,111 @@
+import numpy as np
+import pretty_midi
+import pytest
+from music21 import converter, stream
+
+from backend.services import cache_partituras
+from backend.services.clasificador_metricas import metricas_categoria, contiene_errores, compases_estimados
+from backend.services.ingesta_midi import construir_tabla_midi
+from backend.services.parser import _analizar_midi
+from backend.services.tabla_notas import construir_tabla, tabla_notas, ACORDE, MIEMBRO_ACORDE
+
+ARCHIVO = "coriolan.mid"
+RUTA = f"uploads/{ARCHIVO}"
+
+# Campos que deben coincidir fila a fila; el orden de las notas que empiezan a
+# la vez (y el de las alturas de un acorde) no se puede recuperar de PrettyMIDI,
+# así que se comparan ordenadas y sin distinguir la altura que representa al acorde
+CAMPOS = ("compas", "onset_compas", "duracion", "altura", "velocidad", "tipo", "en_voz")
+
+
+@pytest.fixture(scope="module")
+def score():
+    return converter.parse(RUTA)
+
+
+@pytest.fixture(scope="module")
+def tablas(score):
+    tabla_midi, rejillas = construir_tabla_midi(pretty_midi.PrettyMIDI(RUTA))
+    return construir_tabla(score), tabla_midi, rejillas
+
+
+def _filas_ordenadas(filas):
+    filas = filas.copy()
+    filas["tipo"][filas["tipo"] == MIEMBRO_ACORDE] = ACORDE
+    return filas[np.lexsort([filas[c] for c in reversed(("parte", "onset") + CAMPOS)])]
+
+
+def test_tabla_igual_que_music21(tablas):
+    music21, midi, _ = tablas
+    assert midi.nombres_partes == music21.nombres_partes
+    assert len(midi.notas) == len(music21.notas)
+
+    esperadas, obtenidas = _filas_ordenadas(music21.notas), _filas_ordenadas(midi.notas)
+    for campo in ("parte", "onset") + CAMPOS:
+        np.testing.assert_array_equal(obtenidas[campo], esperadas[campo], err_msg=campo)
+    # Mismo número de acordes, y dentro de cada parte el mismo orden de onsets
+    assert (midi.notas["tipo"] == ACORDE).sum() == (music21.notas["tipo"] == ACORDE).sum()
+    for p in range(len(music21.nombres_partes)):
+        np.testing.assert_array_equal(
+            midi.notas["onset"][midi.notas["parte"] == p],
+            music21.notas["onset"][music21.notas["parte"] == p]
+        )
+
+
+def test_silencios_tonicas_y_fin(tablas):
+    music21, midi, _ = tablas
+    np.testing.assert_array_equal(np.sort(midi.silencios), np.sort(music21.silencios))
+    assert midi.tonicas == music21.tonicas
+    assert midi.fin() == music21.fin()
+
+
+def test_rejilla_de_cada_parte(score, tablas):
+    _, _, rejillas = tablas
+    assert len(rejillas) == len(score.parts)
+    for parte, (numeros, offsets, duraciones) in zip(score.parts, rejillas):
+        medidas = list(parte.getElementsByClass(stream.Measure))
+        assert numeros.tolist() == [m.number for m in medidas]
+        assert offsets.tolist() == [float(m.offset) for m in medidas]
+        assert duraciones.tolist() == [float(m.duration.quarterLength) for m in medidas]
+
+
+@pytest.fixture
+def cache_vacia():
+    cache_partituras.cache_partituras.limpiar()
+    yield
+    cache_partituras.cache_partituras.limpiar()
+
+
+@pytest.mark.parametrize("instrumentos", [None, ["Cello", "Violin I", "Timpani"]])
+def test_analizar_midi_sin_parsear(cache_vacia, monkeypatch, instrumentos):
+    monkeypatch.setattr(cache_partituras, "INGESTA", "music21")
+    esperado = _analizar_midi(ARCHIVO, instrumentos)
+    cache_partituras.cache_partituras.limpiar()
+
+    monkeypatch.setattr(cache_partituras, "INGESTA", "midi")
+    resultado = _analizar_midi(ARCHIVO, instrumentos)
+    assert "error" not in resultado
+    assert cache_partituras.obtener_entrada(RUTA)._score is None
+    for clave in ("compases_estimados", "seccion_aurea", "variedad_tonal", "firma_metrica",
+                  "cantidad_total_notas", "porcentaje_participacion"):
+        assert resultado[clave] == esperado[clave], clave
+
+
+def test_metricas_sin_parsear(cache_vacia, monkeypatch, caplog):
+    monkeypatch.setattr(cache_partituras, "INGESTA", "midi")
+    score, midi = cache_partituras.cargar_eventos(RUTA)
+    resultado = metricas_categoria(score, midi, "todos", modo="todos")
+    assert not contiene_errores(resultado)
+    assert cache_partituras.obtener_entrada(RUTA)._score is None
+    assert "music21" not in caplog.text
+    assert resultado["compases_estimados"] == compases_estimados(cache_partituras.cargar_partitura(RUTA)[0])
+
+
+def test_parseo_explicito_se_anota(cache_vacia, monkeypatch, caplog):
+    monkeypatch.setattr(cache_partituras, "INGESTA", "midi")
+    score, _ = cache_partituras.cargar_eventos(RUTA)
+    with pytest.raises(AttributeError):
+        score.highestTime
+    assert cache_partituras.obtener_entrada(RUTA)._score is None
+    assert [p.partName for p in score.parts] == tabla_notas(score).nombres_partes
+    assert "se parsea con music21" in caplog.text
@@ -0,0 +1,55 @@
+import base64
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.services.cache_partituras import cargar_eventos
+from backend.services.intervalos import empaquetar, representar_intervalos, resumen_intervalos, rle
+from backend.services.parser import intervalos_melodicos
+
+ARCHIVO = "coriolan.mid"
+
+
+def _decodificar(representacion, formato):
+    if formato == "lista":
+        return list(representacion)
+    if formato == "rle":
+        return np.repeat(representacion["valores"], representacion["repeticiones"]).tolist()
+    datos = np.frombuffer(base64.b64decode(representacion["datos"]), dtype=np.dtype(representacion["tipo"]).newbyteorder("<"))
+    assert len(datos) == representacion["longitud"]
+    return datos.tolist()
+
+
+@pytest.fixture(scope="module")
+def secuencia():
+    score, _ = cargar_eventos(f"uploads/{ARCHIVO}")
+    return intervalos_melodicos(score).tolist()
+
+
+@pytest.mark.parametrize("valores", [[], [0], [3, 3, 3], [-200, 5, 5, 300, -1], list(range(-128, 128))])
+def test_codificaciones_vuelven_a_la_lista(valores):
+    for formato in ("lista", "rle", "empaquetado"):
+        assert _decodificar(representar_intervalos(valores, formato), formato) == valores
+    assert representar_intervalos(valores, "resumen") is None
+    assert sum(resumen_intervalos(valores)["histograma"]["conteos"]) == len(valores)
+
+
+def test_codificaciones_de_una_obra(secuencia):
+    assert _decodificar(rle(secuencia), "rle") == secuencia
+    empaquetada = empaquetar(secuencia)
+    assert empaquetada["tipo"] == "int8"
+    assert _decodificar(empaquetada, "empaquetado") == secuencia
+
+
+def test_metricas_con_secuencia_completa(secuencia):
+    cliente = TestClient(app)
+    parametros = {"archivo": ARCHIVO, "categoria": "melodicas", "modo": "global"}
+    resumida = cliente.get("/metricas/", params=parametros).json()["metricas"]
+    assert "intervalos_todos" not in resumida
+    assert resumida["intervalos_predominantes"]["total"] == len(secuencia)
+    for formato in ("lista", "rle", "empaquetado"):
+        metricas = cliente.get("/metricas/", params={**parametros, "intervalos": formato}).json()["metricas"]
+        assert _decodificar(metricas["intervalos_todos"], formato) == secuencia
+        assert metricas["intervalos_predominantes"] == resumida["intervalos_predominantes"]
@@ -0,0 +1,70 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from backend.services import lotes
+from backend.services.lotes import procesar_lote
+
+
+# Funciones de nivel de módulo: se envían a los procesos del pool
+def cuadrado(x):
+    return x * x, os.getpid()
+
+
+def falla_si_impar(x):
+    if x % 2:
+        raise ValueError(f"impar: {x}")
+    return x
+
+
+def termina_proceso(x):
+    if x == 1:
+        os._exit(1)
+    return x
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(lotes, "PROCESOS_LOTE", 2)
+    yield
+    lotes.cerrar_pool()
+
+
+def test_reparte_en_procesos_y_conserva_el_orden(pool):
+    salida = procesar_lote(cuadrado, [(x,) for x in range(6)])
+    assert all(error is None for _, error in salida)
+    assert [valor for (valor, _), _ in salida] == [x * x for x in range(6)]
+    assert os.getpid() not in {pid for (_, pid), _ in salida}
+
+
+def test_un_fallo_no_afecta_al_resto(pool):
+    salida = procesar_lote(falla_si_impar, [(x,) for x in range(5)])
+    assert [resultado for resultado, _ in salida] == [0, None, 2, None, 4]
+    errores = [error for _, error in salida]
+    assert isinstance(errores[1], ValueError) and str(errores[1]) == "impar: 1"
+    assert errores[0] is None and errores[2] is None
+
+
+def test_pool_roto_se_descarta(pool):
+    salida = procesar_lote(termina_proceso, [(x,) for x in range(4)])
+    assert any(isinstance(error, BrokenProcessPool) for _, error in salida)
+    assert all(resultado == x for x, (resultado, error) in enumerate(salida) if error is None)
+    assert lotes._pool is None
+
+    # La siguiente petición crea un pool nuevo
+    salida = procesar_lote(cuadrado, [(2,), (3,)])
+    assert all(error is None for _, error in salida)
+    assert [valor for (valor, _), _ in salida] == [4, 9]
+
+
+def test_sin_pool_con_una_tarea_o_un_proceso(monkeypatch):
+    monkeypatch.setattr(lotes, "PROCESOS_LOTE", 2)
+    (resultado, error), = procesar_lote(cuadrado, [(3,)])
+    assert resultado == (9, os.getpid()) and error is None
+
+    monkeypatch.setattr(lotes, "PROCESOS_LOTE", 1)
+    salida = procesar_lote(falla_si_impar, [(x,) for x in range(3)])
+    assert [resultado for resultado, _ in salida] == [0, None, 2]
+    assert isinstance(salida[1][1], ValueError)
+    assert lotes._pool is None
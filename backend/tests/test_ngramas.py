@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from backend.services import ngramas
+from backend.services.cache_partituras import cargar_eventos
+from backend.services.ngramas import (
+    codigos_ngramas, empaquetar_ngramas, ngramas_en_segmentos, repetitividad, repetitividad_partes
+)
+from backend.services.tabla_notas import tabla_notas
+
+LONGITUDES = range(2, 9)
+
+
+@pytest.fixture(scope="module")
+def filas():
+    score, _ = cargar_eventos("uploads/coriolan.mid")
+    return tabla_notas(score).seleccion()
+
+
+def test_varias_longitudes_como_cada_una_por_separado(filas, monkeypatch):
+    alturas = filas["altura"]
+    separadas = {n: codigos_ngramas(alturas, [n])[n] for n in LONGITUDES}
+
+    # Una sola pasada: solo la longitud más corta se empaqueta desde las alturas
+    llamadas = []
+    empaquetar = ngramas.empaquetar_ngramas
+    monkeypatch.setattr(ngramas, "empaquetar_ngramas", lambda v, n: llamadas.append(n) or empaquetar(v, n))
+    juntas = codigos_ngramas(alturas, LONGITUDES)
+    assert llamadas == [min(LONGITUDES)]
+
+    assert sorted(juntas) == list(LONGITUDES)
+    for n in LONGITUDES:
+        np.testing.assert_array_equal(juntas[n], separadas[n])
+        np.testing.assert_array_equal(juntas[n], empaquetar_ngramas(alturas, n))
+
+
+def test_segmentos_y_repetitividad_por_longitud(filas):
+    juntas = ngramas_en_segmentos(filas["altura"], filas["parte"], LONGITUDES)
+    por_longitud = repetitividad_partes(filas, LONGITUDES)
+    for n in LONGITUDES:
+        codigos, inicios = ngramas_en_segmentos(filas["altura"], filas["parte"], [n])[n]
+        np.testing.assert_array_equal(juntas[n][0], codigos)
+        np.testing.assert_array_equal(juntas[n][1], inicios)
+        # Ninguna ventana cruza de una parte a otra
+        assert (filas["parte"][inicios] == filas["parte"][inicios + n - 1]).all()
+        assert por_longitud[n] == repetitividad_partes(filas, n) == repetitividad(codigos)
+
+
+def test_valores_fuera_de_rango_y_ventanas_largas():
+    valores = np.array([-3, 200, -3, 200, -3, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5])
+    for n, codigos in codigos_ngramas(valores, [2, 3, 12, 40]).items():
+        if len(valores) < n:
+            assert codigos.size == 0
+            continue
+        ventanas = [tuple(v) for v in sliding_window_view(valores, n)]
+        # Mismo código si y solo si es la misma ventana
+        assert len(codigos) == len(ventanas)
+        for i in range(len(ventanas)):
+            for j in range(len(ventanas)):
+                assert (codigos[i] == codigos[j]) == (ventanas[i] == ventanas[j])
+    with pytest.raises(ValueError):
+        empaquetar_ngramas(valores, 3)
@@ -0,0 +1,24 @@
+from backend.services import cache_partituras
+from backend.services.parser import _analizar_midi
+
+ARCHIVO = "coriolan.mid"
+
+
+def test_filtro_no_modifica_la_partitura_en_cache(monkeypatch):
+    monkeypatch.setattr(cache_partituras, "INGESTA", "music21")
+    score, _ = cache_partituras.cargar_partitura(f"uploads/{ARCHIVO}")
+    partes = list(score.parts)
+    fin = score.highestTime
+
+    completo = _analizar_midi(ARCHIVO)
+    filtrado = _analizar_midi(ARCHIVO, ["Viola", "Flute"])
+
+    # Las partes siguen colgando del score en caché, en su sitio
+    assert all(p.activeSite is score and p.offset == 0 for p in partes)
+    assert list(score.parts) == partes
+    assert score.highestTime == fin
+    assert filtrado["instrumentos_detectados"] == ["Flute", "Viola"]
+    assert filtrado["compases_estimados"] == {
+        nombre: completo["compases_estimados"][nombre] for nombre in ("Flute", "Viola")
+    }
+    assert filtrado["seccion_aurea"] <= completo["seccion_aurea"]
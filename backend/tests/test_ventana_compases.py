@@ -0,0 +1,70 @@
+import pretty_midi
+import pytest
+from music21 import converter
+
+from backend.services import acordes, matriz_compases
+from backend.services.indice_compases import IndiceCompases, indice_compases, ventana_compases
+from backend.services.matriz_compases import matriz_compases as matriz_completa, recorrer_matriz
+from backend.services.mixtas_parser import _analizar_mixtas
+
+RUTA = "uploads/coriolan.mid"
+VENTANA = (5, 12)
+
+
+@pytest.fixture
+def partitura():
+    # Score propio: sin matrices ni acordes ya calculados por otras pruebas
+    return converter.parse(RUTA), pretty_midi.PrettyMIDI(RUTA)
+
+
+def test_ventana_solo_recorre_sus_compases(partitura, monkeypatch):
+    score, midi = partitura
+    barridos, entropias = [], []
+    cortes = acordes.cortes_verticales
+    monkeypatch.setattr(acordes, "cortes_verticales", lambda *a, **k: barridos.append(a[3] if len(a) > 3 else k.get("rango")) or cortes(*a, **k))
+    entropia = matriz_compases._entropia
+    monkeypatch.setattr(matriz_compases, "_entropia", lambda *a, **k: entropias.append(1) or entropia(*a, **k))
+
+    filas = list(recorrer_matriz(score, midi, None, VENTANA))
+    desde, hasta = VENTANA
+    assert [i for i, _ in filas] == list(range(desde - 1, hasta))
+    # Cuatro entropías por compás, y un único barrido de acordes limitado a la ventana
+    assert len(entropias) == 4 * (hasta - desde + 1)
+    assert barridos == [indice_compases(score).offsets_ventana(VENTANA)]
+    # La ventana no se guarda como si fuera la matriz completa
+    assert matriz_compases._matrices.get(score) is None
+
+    completa = matriz_completa(score, midi)
+    for i, fila in filas:
+        assert fila.tolist() == completa.valores[i].tolist()
+
+
+def test_mixtas_de_una_ventana_son_un_tramo_de_las_completas():
+    completas = _analizar_mixtas(RUTA, ["Viola", "Cello"])
+    ventana = _analizar_mixtas(RUTA, ["Viola", "Cello"], VENTANA)
+    desde, hasta = VENTANA
+    claves = [f"compas #{n}" for n in range(desde, hasta + 1)]
+    for nombre, valores in completas.items():
+        if isinstance(valores, list) and valores and str(next(iter(valores[0]))).startswith("compas #"):
+            assert [next(iter(v)) for v in ventana[nombre]] == claves, nombre
+            assert ventana[nombre] == [v for v in valores if next(iter(v)) in claves], nombre
+        else:
+            assert ventana[nombre] == valores, nombre
+
+
+@pytest.mark.parametrize("desde, hasta, rango", [
+    (None, None, (0, 10)), (3, None, (2, 10)), (None, 4, (0, 4)), (8, 40, (7, 10)), (30, 40, (10, 10))
+])
+def test_rango_de_la_ventana(desde, hasta, rango):
+    class RejillaDiezCompases:
+        rango = IndiceCompases.rango
+
+        def __len__(self):
+            return 10
+
+    assert RejillaDiezCompases().rango(ventana_compases(desde, hasta)) == rango
+
+
+def test_ventana_invertida():
+    with pytest.raises(ValueError):
+        ventana_compases(9, 3)
@@ -66,9 +66,11 @@ interface MotivosRecurrentes {
 }
 
 interface IntervalosPredominantes {
-  valores: number[];
   predominantes: number[];
   nombres: string[];
+  total: number;
+  histograma: { intervalos: number[]; conteos: number[] };
+  cuantiles: Record<string, number>;
 }
 
 interface ProgresionesArmonicas {
@@ -990,14 +992,13 @@ export default function MidiAnalyzer() {
       key === 'intervalos_predominantes' &&
       typeof value === 'object' &&
       value !== null &&
-      'valores' in value &&
+      'histograma' in value &&
       'nombres' in value
     ) {
       const val = value as IntervalosPredominantes;
-      const intervalCounts = val.valores.reduce(
+      const intervalCounts = val.histograma.intervalos.reduce(
         (acc: Record<string, number>, valNum: number, idx: number) => {
-          const name = val.nombres[idx] || `Intervalo ${valNum}`;
-          acc[name] = (acc[name] || 0) + 1;
+          acc[`Intervalo ${valNum}`] = val.histograma.conteos[idx];
           return acc;
         },
         {}